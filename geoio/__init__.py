@@ -5,6 +5,11 @@ import os as _os
 # Pull in main modules/classes
 from base import GeoImage
 from dg import DGImage
+from cache import BlockCache
+from grid import GeoGrid
+from meta import ImageMeta
+from lazy import LazyArray
+from zonal import ZonalAccumulator
 import constants
 
 _logger = _logging.getLogger(__name__)
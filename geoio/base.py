@@ -18,16 +18,35 @@ import textwrap
 import tempfile
 import logging
 import math
+import copy
+import threading
+import Queue
+import ctypes
+import multiprocessing
+import multiprocessing.sharedctypes as mp_sharedctypes
+from multiprocessing.pool import ThreadPool
 from tzwhere import tzwhere
 import tinytools as tt
 
 # package import
 import constants as const
+from cache import BlockCache
+from grid import GeoGrid
+from meta import ImageMeta
+import lazy
+import zonal
 
 # Module setup
 gdal.UseExceptions()
 ogr.UseExceptions()
 logger = logging.getLogger(__name__)
+
+# Number of iter_vector features sorted and grouped into superwindows at once
+_SUPERWINDOW_CHUNK = 4096
+# numpy types of the numeric ogr field types, as in OGR's Arrow stream
+_OGR_FIELD_DTYPES = {ogr.OFTInteger: 'int32',
+                     ogr.OFTInteger64: 'int64',
+                     ogr.OFTReal: 'float64'}
 # To get access to logging statements from the command line:
 # import logging
 # logging.basicConfig(level=logging.DEBUG) # or your desired level
@@ -41,6 +60,60 @@ class OverlapError(ValueError):
     pass
 
 
+class _MaskBurner(object):
+    """Rasterizes single geometries into boolean masks.  The MEM raster,
+    Memory layer and feature are created once and reused between calls,
+    the raster only being replaced when a larger one is needed."""
+
+    def __init__(self):
+        odrv = ogr.GetDriverByName('Memory')
+        self._ds = odrv.CreateDataSource('')
+        self._lyr = self._ds.CreateLayer('burnshp', None, ogr.wkbUnknown)
+        self._feat = ogr.Feature(self._lyr.GetLayerDefn())
+        self._created = False
+        self._tds = None
+        self._size = (0, 0)
+
+    def burn(self, g, geo_transform, xsize, ysize, all_touched=False):
+        """Return a (ysize, xsize) boolean mask that is True inside the
+        geometry g on the grid described by geo_transform.  The geometry
+        is owned by the burner afterward."""
+        xsize, ysize = int(xsize), int(ysize)
+
+        if xsize > self._size[0] or ysize > self._size[1]:
+            # Grow in powers of two so the raster is rarely replaced
+            self._size = (max(self._size[0], _next_pow2(xsize)),
+                          max(self._size[1], _next_pow2(ysize)))
+            drv = gdal.GetDriverByName('MEM')
+            self._tds = drv.Create('', self._size[0], self._size[1], 1,
+                                   gdal.GDT_Byte)
+        self._tds.SetGeoTransform(geo_transform)
+
+        # Only the requested corner of the raster is cleared and read
+        band = self._tds.GetRasterBand(1)
+        band.WriteRaster(0, 0, xsize, ysize, b'\0'*(xsize*ysize))
+
+        self._feat.SetGeometryDirectly(g)
+        if self._created:
+            self._lyr.SetFeature(self._feat)
+        else:
+            self._lyr.CreateFeature(self._feat)
+            self._created = True
+
+        # Run the burn
+        if all_touched:
+            gdal.RasterizeLayer(self._tds, [1], self._lyr, burn_values=[1],
+                                options=['ALL_TOUCHED=TRUE'])
+        else:
+            gdal.RasterizeLayer(self._tds, [1], self._lyr, burn_values=[1])
+
+        return band.ReadAsArray(0, 0, xsize, ysize).astype('bool')
+
+
+# Per thread _MaskBurner used by GeoImage._geom_mask
+_burners = threading.local()
+
+
 class GeoImage(object):
     """
     Base image class providing high-level access to image data and metadata
@@ -69,12 +142,17 @@ class GeoImage(object):
                        doesn't contain tiles, this should be equal to dfile.
 
         Inherited classes can override/extend this listing.
-    meta : tinytools.bunch.OrderedBunch
-        Summary metadata of the base image.
+    meta : geoio.meta.ImageMeta
+        Summary metadata of the base image.  Supports attribute and
+        dictionary style access.  The grid fields (shape, geo_transform,
+        etc.) are read-only.
     shape : tuple
         shape of the image in gdal format (bands,x,y).
     resolutions : tuple
         length 2 tuple with resolutions of x and y image dimensions.
+    block_cache : geoio.cache.BlockCache or None
+        Cache of decoded image blocks used by get_data.  Disabled (None) by
+        default - see set_block_cache.
     """
 
     def __init__(self, file_in, derived_dir=None):
@@ -148,6 +226,15 @@ class GeoImage(object):
         # Populate metadata info from gdal
         self._set_metadata()
 
+        # Decoded block caching is off unless requested
+        self.block_cache = None
+
+        # Low resolution validity maps computed by get_validity_map
+        self._validity_maps = {}
+
+        # Memory map of the pixels, opened on first use by as_memmap
+        self._memmap = None
+
 
     def _get_file_and_tiles(self, ifile):
 
@@ -184,6 +271,65 @@ class GeoImage(object):
         return (file_loc,tiles_loc)
 
 
+    # The gdal dataset handle is opened lazily through the _fobj property.
+    # It is reopened after unpickling and in a child process after a fork,
+    # since gdal handles can't be pickled or shared between processes.
+    _fobj_handle = None
+    _fobj_pid = None
+    _vrt_xml = None
+
+    @property
+    def _fobj(self):
+        if self._fobj_pid != os.getpid():
+            self._open_fobj()
+        return self._fobj_handle
+
+    @_fobj.setter
+    def _fobj(self, obj):
+        self._fobj_handle = obj
+        self._fobj_pid = os.getpid()
+
+
+    def _open_fobj(self):
+        '''(Re)open the gdal dataset of the object, i.e. after unpickling or
+        in the child process of a fork.'''
+        if self._fobj_handle is not None and self._vrt_xml is None:
+            # Keep the VRT of an inherited in memory dataset so that the
+            # .TIL mosaic isn't rebuilt
+            self._vrt_xml = _vrt_xml(self._fobj_handle)
+
+        # Blocks and locks inherited across a fork aren't safe to reuse
+        if self._fobj_pid is not None and self.block_cache is not None:
+            self.block_cache = BlockCache(self.block_cache.max_bytes)
+
+        logger.debug('opening gdal dataset for %s in process %s',
+                     self.files.dfile, os.getpid())
+        if self._vrt_xml is not None:
+            self._fobj = gdal.Open(self._vrt_xml)
+        else:
+            self._fobj = self._get_gdal_obj(self.files.dfile,
+                                            self.files.dfile_tiles)
+
+
+    def __getstate__(self):
+        '''Pickle the object without the gdal dataset handle or memory map.
+        The resolved file lists and parsed metadata (including meta_dg for
+        DGImage) are kept and the dataset (from the VRT XML for in memory
+        VRTs) is reopened on first use after unpickling.'''
+        state = self.__dict__.copy()
+        handle = state.pop('_fobj_handle', None)
+        state.pop('_fobj_pid', None)
+        if handle is not None:
+            state['_vrt_xml'] = _vrt_xml(handle)
+        if '_memmap' in state:
+            state['_memmap'] = None
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
     def _get_gdal_obj(self, dfile, dfile_tiles):
         '''Return gdal object for the GeoImage.'''
 
@@ -248,13 +394,18 @@ class GeoImage(object):
         # Add geoio class name to dictionary
         meta_geoimg_dict['class_name'] = self.__class__.__name__
 
-        ### OrderedBunch the metadata from the read_geo_file_info dictionary
-        self.meta = tt.bunch.OrderedBunch(meta_geoimg_dict)
+        ### Build the metadata record from the read_geo_file_info dictionary
+        self.meta = ImageMeta(meta_geoimg_dict)
 
         # Set class members
         self.shape = self.meta.shape
         self.resolution = self.meta.resolution
 
+        # Grid geometry (geo transforms, size, and projection) used for the
+        # coordinate conversions and window arithmetic.
+        self.grid = GeoGrid(self.meta.geo_transform, self.meta.shape[1],
+                            self.meta.shape[2], self.meta.projection_string)
+
 
     def __repr__(self):
         """Human readable image summary similar to the R package 'raster'."""
@@ -312,12 +463,260 @@ class GeoImage(object):
         print(self.__repr__())
 
 
+    def set_block_cache(self, max_bytes=256*1024*1024, cache=None):
+        '''
+        Turn on caching of decoded image blocks for get_data.
+
+        With the cache on, get_data assembles windows from native gdal blocks
+        and keeps the decoded blocks in a least recently used cache so that
+        overlapping reads don't decode the same blocks again.
+
+        Parameters
+        ----------
+        max_bytes : int, optional
+            Byte budget for a new cache.  Passing None turns caching off.
+        cache : geoio.cache.BlockCache, optional
+            An existing cache to use instead of creating a new one.  Passing
+            the same cache to several objects gives a process-wide cache.
+
+        Returns
+        -------
+        geoio.cache.BlockCache or None
+            The cache now attached to the object.
+        '''
+
+        if cache is not None:
+            self.block_cache = cache
+        elif max_bytes is None:
+            self.block_cache = None
+        else:
+            self.block_cache = BlockCache(max_bytes)
+
+        return self.block_cache
+
+
+    def to_lazy_array(self, chunks=None):
+        '''
+        Return a lazy chunked view of the image data for out-of-core
+        computation.
+
+        Slicing, ufuncs/arithmetic, and astype on the returned object don't
+        read any data.  The reductions (sum, mean, min, max, histogram) and
+        compute read and process one chunk at a time, optionally on a thread
+        pool, i.e.:
+
+            la = img.to_lazy_array()
+            lf = la.astype('float32')
+            ndvi = (lf[6]-lf[4]) / (lf[6]+lf[4])
+            hist, edges = ndvi.histogram(bins=50, range=(-1, 1), workers=4)
+
+        Parameters
+        ----------
+        chunks : int or tuple, optional
+            Chunk size in y and x (int) or a (bands, y, x) tuple.  Defaults
+            to all bands and about 1024 pixels in y and x rounded to the gdal
+            block size.
+
+        Returns
+        -------
+        geoio.lazy.LazyArray
+            Lazy array with the (bands, y, x) shape and dtype of get_data.
+        '''
+        return lazy.from_image(self, chunks)
+
+
+    def _reopen(self):
+        '''Return a shallow copy of the object with its own gdal dataset
+        handle so that it can be read from another thread.  The copy
+        (see __getstate__) doesn't carry the handle and opens its own on
+        first use.'''
+        return copy.copy(self)
+
+
+    def as_memmap(self):
+        '''
+        Return a read-only memory mapped view of the image pixels.
+
+        Uncompressed ENVI files and uncompressed striped GTiff files are
+        mapped directly with numpy.memmap.  Other uncompressed GTiff layouts
+        (i.e. tiled files) use a gdal virtual memory mapping when the gdal
+        build supports it.  Pixels are only paged in from disk as the array
+        is accessed, so random access over very large files is cheap.
+
+        Returns
+        -------
+        ndarray
+            Read-only array of shape (bands, y, x) as returned by get_data.
+            Pixel and line interleaved files are returned as transposed views
+            so no pixel data is copied.
+
+        Raises
+        ------
+        ValueError
+            If the file layout can't be memory mapped.
+        '''
+
+        if self._memmap is None:
+            self._memmap = self._open_memmap()
+
+        if self._memmap is False:
+            raise ValueError("The image layout can't be memory mapped.  Only "
+                             "uncompressed ENVI and GTiff files are "
+                             "supported.")
+
+        return self._memmap
+
+
+    def _open_memmap(self):
+        '''Map the pixels of self._fobj or return False if not possible.'''
+        layout = _memmap_layout(self._fobj)
+        if layout is not None:
+            fname, offset, dtype, shape, axes = layout
+            logger.debug('memory mapping %s at offset %s as %s %s',
+                         fname, offset, dtype, shape)
+            mm = np.memmap(fname, dtype=dtype, mode='r', offset=offset,
+                           shape=shape)
+            return mm.transpose(axes)
+
+        # Fall back on gdal virtual memory for other uncompressed GTiffs
+        fobj = self._fobj
+        if (fobj.GetDriver().ShortName == 'GTiff' and
+                not fobj.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE') and
+                hasattr(fobj, 'GetVirtualMemArray')):
+            try:
+                vm = fobj.GetVirtualMemArray(gdalconst.GF_Read)
+            except (RuntimeError, TypeError, ImportError) as e:
+                logger.debug('gdal virtual memory is unavailable: %s', e)
+            else:
+                if vm.ndim == 2:
+                    vm = vm[np.newaxis, :, :]
+                return vm
+
+        return False
+
+
+    def _memmap_window(self, bands, xoff, yoff, win_xsize, win_ysize):
+        '''Return a window of the memory map for get_data or None if the
+        image can't be mapped.  Regularly spaced band requests are views
+        and other band requests take a copy of the selected bands.'''
+
+        if self._memmap is None:
+            self._memmap = self._open_memmap()
+        if self._memmap is False:
+            return None
+
+        bidx = [b-1 for b in bands]
+        rows = slice(yoff, yoff+win_ysize)
+        cols = slice(xoff, xoff+win_xsize)
+        bsl = _band_slice(bidx)
+        if bsl is not None:
+            return self._memmap[bsl, rows, cols]
+        return self._memmap[bidx, rows, cols]
+
+
     def __iter__(self):
         '''Yield from default iter_window iterator.'''
         for x in self.iter_window():
             yield x
 
 
+    def __getitem__(self, key):
+        '''
+        Read data with numpy style indexing of the (bands, y, x) array that
+        get_data returns, i.e. img[0:3, 100:200, 50:80] is equivalent to
+        img.get_data()[0:3, 100:200, 50:80] but only the requested pixels
+        are read.
+
+        Bands are zero based as in the returned array and can be an integer,
+        slice, or list of integers.  Rows and columns can be integers or
+        slices (with any step).  Integers drop the axis as in numpy.  Only
+        the rows selected by a row step are read and the columns for each
+        row are read as a single span.  gdal's decimating reads are not used
+        for steps since their nearest neighbor sampling and overview
+        selection don't reproduce numpy stride semantics.
+        '''
+
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            if sum(1 for k in key if k is Ellipsis) > 1:
+                raise IndexError("An index can only have a single ellipsis.")
+            i = [k is Ellipsis for k in key].index(True)
+            fill = (slice(None),)*(3-len(key)+1)
+            key = key[:i] + fill + key[i+1:]
+        if len(key) > 3:
+            raise IndexError("Too many indices for a (bands, y, x) image.")
+        key = key + (slice(None),)*(3-len(key))
+
+        bands, bdrop = self._index_bands(key[0])
+        ystart, ycount, ystep, ydrop = _index_axis(key[1], self.grid.ysize)
+        xstart, xcount, xstep, xdrop = _index_axis(key[2], self.grid.xsize)
+
+        obj = self._fobj
+        dt = const.DICT_GDAL_TO_NP[obj.GetRasterBand(1).DataType]
+        data = np.empty([len(bands), ycount, xcount], dtype=dt)
+
+        # Read the selected rows (or all rows of a contiguous span) and take
+        # the column step from the span
+        xspan = (xcount-1)*abs(xstep)+1
+        x0 = xstart if xstep > 0 else xstart-xspan+1
+        y0 = ystart if ystep > 0 else ystart+(ycount-1)*ystep
+        ystride = abs(ystep)
+        if not (bands and ycount and xcount):
+            pass
+        elif ystride == 1 and abs(xstep) == 1:
+            self._read_bands(obj, bands, x0, y0, xcount, ycount,
+                             dset_key=self.files.dfile, out=data)
+        elif ystride == 1:
+            tmp = self._read_bands(obj, bands, x0, y0, xspan, ycount,
+                                   dset_key=self.files.dfile)
+            data[...] = tmp[:, :, ::abs(xstep)]
+        else:
+            tmp = np.empty([len(bands), 1, xspan], dtype=dt)
+            for i in xrange(ycount):
+                self._read_bands(obj, bands, x0, y0+i*ystride, xspan, 1,
+                                 dset_key=self.files.dfile, out=tmp)
+                data[:, i, :] = tmp[:, 0, ::abs(xstep)]
+
+        # Reverse negative steps and drop integer indexed axes
+        idx = []
+        for drop, step in ((bdrop, 1), (ydrop, ystep), (xdrop, xstep)):
+            if drop:
+                idx.append(0)
+            elif step < 0:
+                idx.append(slice(None, None, -1))
+            else:
+                idx.append(slice(None))
+
+        return data[tuple(idx)]
+
+
+    def _index_bands(self, k):
+        '''Return the one based band numbers for a zero based band index of
+        __getitem__ and whether the band axis is dropped.'''
+        nbands = self._fobj.RasterCount
+        if isinstance(k, (int, long, np.integer)):
+            if not -nbands <= k < nbands:
+                raise IndexError("Band index %s is out of range for %s "
+                                 "bands." % (k, nbands))
+            return [int(k) % nbands + 1], True
+        elif isinstance(k, slice):
+            return [i+1 for i in xrange(*k.indices(nbands))], False
+
+        k = np.asarray(k)
+        if k.dtype == bool:
+            if k.shape != (nbands,):
+                raise IndexError("A boolean band index must be length %s." %
+                                 nbands)
+            k = np.flatnonzero(k)
+        if k.ndim != 1 or not np.issubdtype(k.dtype, np.integer):
+            raise IndexError("Bands must be indexed by an integer, slice, or "
+                             "sequence of integers.")
+        if ((k < -nbands) | (k >= nbands)).any():
+            raise IndexError("Band index out of range for %s bands." % nbands)
+        return [int(i) % nbands + 1 for i in k], False
+
+
     def iter_base(self, xoff, yoff, win_xsize, win_ysize, **kwargs):
         '''
         Base iterator function to yield data from array-like window parameters.
@@ -356,7 +755,8 @@ class GeoImage(object):
             yield self.get_data(window=w,**kwargs)
 
 
-    def iter_window(self, win_size=None, stride=None, **kwargs):
+    def iter_window(self, win_size=None, stride=None, sliding=False,
+                    copy=False, skip_empty=False, **kwargs):
         '''
         Window iterator that yields data from the image based on win_size
         and stride.
@@ -367,12 +767,33 @@ class GeoImage(object):
         the method yields adjoining windows of the size requested.  If only
         stride is provided, an error is rasied.
 
+        If sliding is True, full-width strips of rows are read once into a
+        rolling row buffer and the chips are yielded as views into it.  This
+        reads each image row about once regardless of how much the windows
+        overlap.  The views are read-only and are overwritten as the
+        iteration continues, so pass copy=True to get independent arrays.
+        Only the bands, buffer, and return_location arguments of get_data are
+        supported in sliding mode.
+
+        If skip_empty is True, windows without any valid pixels are skipped
+        before they are read.  Validity is looked up in the low resolution
+        map from get_validity_map and the number of windows skipped is
+        stored in self.skipped_windows.  In sliding mode the row strips
+        are only read for rows that have at least one valid window.
+
         Parameters
         ----------
         win_size : array-like, length 2, optional
             The size of the requested image chip in x and y.
         stride : array-like, length 2, optional
             The size of the step between each yielded chip in x and y.
+        sliding : bool, optional
+            Read through a rolling row buffer instead of one get_data call
+            per window.
+        copy : bool, optional
+            Yield copies instead of read-only views in sliding mode.
+        skip_empty : bool, optional
+            Skip windows that don't contain any valid pixels.
         kwargs: optional
             Arguments for get_data().
 
@@ -406,37 +827,8 @@ class GeoImage(object):
 
         logger.debug('win_size is:  %s, stride is:  %s', win_size, stride)
 
-        # if win_size and NOT stride
-        # set stride to make windows adjoining
-        if win_size and not stride:
-            # Set vars for easy access below
-            xs = self.meta.shape[1]
-            ys = self.meta.shape[2]
-            xsize, ysize = win_size
-
-            # Find starting offsets by identifying the pixels that don't fit in
-            # the requested window blocks and then split the different
-            # between ends of the image using floor (int) to reduce fractions.
-            x_extra_pixels = xs % win_size[0]
-            xoff = int(x_extra_pixels / 2.0)
-            y_extra_pixels = ys % win_size[1]
-            yoff = int(y_extra_pixels / 2.0)
-
-            # Use while True to loop through get_data until outside the image
-            xoff_start = xoff
-            xsize, ysize = win_size
-            while True:
-                logger.debug(' xoff is %s,\tyoff is %s', xoff, yoff)
-                yield self.get_data(window=[xoff, yoff, xsize, ysize],**kwargs)
-                xoff += xsize
-                if xoff > self.meta.shape[1]:
-                    xoff = xoff_start
-                    yoff += ysize
-                if yoff > self.meta.shape[2]:
-                    break
-
         # if NOT win_size and stride, raise error
-        elif not win_size and stride:
+        if not win_size and stride:
             raise ValueError('Setting stride and not setting win_size is not '
                              'allowed because there is no resonable value to '
                              'set win_size to.  In this case stride can be '
@@ -444,34 +836,309 @@ class GeoImage(object):
                              'size return blocks around the center pixel '
                              '(or fractional pixel).')
 
-        # if win_size and stride
-        # just do it
-        elif win_size and stride:
-            # Set vars for easy access below
-            xs = self.meta.shape[1]
-            ys = self.meta.shape[2]
-            xsize, ysize = win_size
-            xstride, ystride = stride
-
-            # Find starting offset by identifying pixels that don't fit in
-            # the requested size/stride and then split the different between
-            # ends of the image using floor (int) to reduce fractions.
-            x_extra_pixels = (xs - xsize) % xstride
-            xoff = int(x_extra_pixels/2.0)
-            y_extra_pixels = (ys - ysize) % ystride
-            yoff = int(y_extra_pixels/2.0)
-
-            # Start the yield loop
-            xoff_start = xoff
-            while True:
+        # if win_size and NOT stride
+        # set stride to make windows adjoining
+        if not stride:
+            stride = win_size
+
+        xoffs, yoffs = self._window_grid(win_size, stride)
+        xsize, ysize = win_size
+
+        if skip_empty:
+            vmap = self.get_validity_map(bands=kwargs.get('bands'))
+            self.skipped_windows = 0
+
+        if sliding:
+            # Strips of rows without any valid windows aren't read
+            window_filter = None
+            if skip_empty:
+                def window_filter(xoff, yoff):
+                    if self._window_has_data(vmap, xoff, yoff, xsize, ysize):
+                        return True
+                    self.skipped_windows += 1
+                    return False
+            for x in self._iter_sliding(xoffs, yoffs, win_size, copy=copy,
+                                        window_filter=window_filter,
+                                        **kwargs):
+                yield x
+        else:
+            for yoff in yoffs:
+                for xoff in xoffs:
+                    if skip_empty and not self._window_has_data(
+                                        vmap, xoff, yoff, xsize, ysize):
+                        self.skipped_windows += 1
+                        continue
+                    logger.debug(' xoff is %s,\tyoff is %s', xoff, yoff)
+                    yield self.get_data(window=[int(xoff), int(yoff),
+                                                xsize, ysize],
+                                        **kwargs)
+
+        if skip_empty:
+            logger.info('iter_window skipped %s of %s windows with no valid '
+                        'pixels', self.skipped_windows,
+                        len(xoffs)*len(yoffs))
+
+
+    def get_validity_map(self, cell_size=16, bands=None):
+        '''
+        Return a low resolution map of where the image has valid pixels.
+
+        Each cell of the map covers about cell_size x cell_size pixels and is
+        True if any pixel in it is valid in any of the bands.  Pixels are
+        invalid where the gdal mask band is zero (i.e. the no data value) or,
+        if the image has no mask or no data value, where the pixel value is
+        zero.  The map is read with averaging decimated reads, so it is
+        cheap when overviews exist (see build_overviews).  The map is cached
+        on the object.
+
+        Parameters
+        ----------
+        cell_size : int, optional
+            Approximate size of a map cell in image pixels.
+        bands : list, optional
+            Bands to check (see get_data).  Defaults to all bands.
+
+        Returns
+        -------
+        ndarray
+            Two dimensional boolean array of shape (ny cells, nx cells).
+        '''
+
+        bands = self._get_band_numbers(bands)
+        key = (cell_size, tuple(bands))
+        if key in self._validity_maps:
+            return self._validity_maps[key]
+
+        xs = self.meta.shape[1]
+        ys = self.meta.shape[2]
+        ncx = int(math.ceil(xs / cell_size))
+        ncy = int(math.ceil(ys / cell_size))
+
+        vmap = np.zeros((ncy, ncx), dtype='bool')
+        for b in bands:
+            bobj = self._fobj.GetRasterBand(b)
+            if bobj.GetMaskFlags() & gdal.GMF_ALL_VALID:
+                src = bobj
+            else:
+                src = bobj.GetMaskBand()
+
+            # Read as float so that small averages don't round to zero
+            a = src.ReadAsArray(0, 0, xs, ys,
+                                buf_xsize=ncx, buf_ysize=ncy,
+                                buf_type=gdal.GDT_Float32,
+                                resample_alg=gdal.GRIORA_Average)
+            vmap |= (a != 0)
+
+        self._validity_maps[key] = vmap
+
+        return vmap
+
+
+    def _window_has_data(self, vmap, xoff, yoff, win_xsize, win_ysize):
+        '''Return True if any cell of the validity map that touches the
+        window is valid.  The cell range is grown by one on each side so that
+        the check errs on the side of reading the window.'''
+
+        ncy, ncx = vmap.shape
+        xs = self.meta.shape[1]
+        ys = self.meta.shape[2]
+
+        x0 = max(int(math.floor(xoff * ncx / xs)) - 1, 0)
+        x1 = min(int(math.ceil((xoff + win_xsize) * ncx / xs)) + 1, ncx)
+        y0 = max(int(math.floor(yoff * ncy / ys)) - 1, 0)
+        y1 = min(int(math.ceil((yoff + win_ysize) * ncy / ys)) + 1, ncy)
+
+        return bool(vmap[y0:y1, x0:x1].any())
+
+
+    def _window_grid(self, win_size, stride):
+        '''Return the x and y offsets of the iter_window windows.'''
+
+        # Set vars for easy access below
+        xs = self.grid.xsize
+        ys = self.grid.ysize
+        xsize, ysize = win_size
+        xstride, ystride = stride
+
+        # Find starting offset by identifying pixels that don't fit in
+        # the requested size/stride and then split the different between
+        # ends of the image using floor (int) to reduce fractions.
+        x_extra_pixels = (xs - xsize) % xstride
+        xoff = int(x_extra_pixels/2.0)
+        y_extra_pixels = (ys - ysize) % ystride
+        yoff = int(y_extra_pixels/2.0)
+
+        # Stop before the image edge so that no window is only padding
+        xoffs = np.arange(xoff, xs, xstride)
+        yoffs = np.arange(yoff, ys, ystride)
+
+        return xoffs, yoffs
+
+
+    def plan_windows(self, win_size=None, stride=None, align_to_blocks=True,
+                     edge='pad'):
+        '''
+        Compute the window parameters for stepping through the image.
+
+        The returned arrays can be inspected, split, or reordered and are
+        passed directly to iter_base, i.e.
+        img.iter_base(*img.plan_windows([256,256])).  Windows are ordered row
+        by row and no window is ever empty.
+
+        Parameters
+        ----------
+        win_size : array-like, length 2, optional
+            The size of the windows in x and y.  Defaults to the gdal block
+            size.
+        stride : array-like, length 2, optional
+            The step between windows in x and y.  Defaults to win_size.
+        align_to_blocks : bool, optional
+            For edge='drop', start the windows on a gdal block boundary when
+            the stride is a multiple of the block size so that each window
+            reads whole blocks.  Otherwise the unused pixels are split
+            between both ends of the image (as in iter_window).  Windows for
+            'pad' and 'shrink' always start at the first pixel, which is
+            block aligned.
+        edge : {'pad', 'shrink', 'drop'}, optional
+            How to handle windows that extend past the image edge - keep the
+            full size (get_data pads them), shrink them to the image, or
+            drop them.
+
+        Returns
+        -------
+        xoff, yoff, win_xsize, win_ysize : ndarray
+            One dimensional integer arrays of the window parameters.
+        '''
+
+        if edge not in ('pad', 'shrink', 'drop'):
+            raise ValueError("edge must be one of 'pad', 'shrink', or 'drop'.")
+
+        block_size = self._fobj.GetRasterBand(1).GetBlockSize()
+        if not win_size:
+            win_size = block_size
+        if not stride:
+            stride = win_size
+
+        if any(x <= 0 for x in win_size) or any(x <= 0 for x in stride):
+            raise ValueError('No value in win_size or stride can be equal '
+                             'to or less than zero.')
+
+        offs = []
+        sizes = []
+        for size, step, lim, bsize in zip(win_size, stride,
+                                          self.meta.shape[1:], block_size):
+            if edge == 'drop':
+                start = int(((lim - size) % step) / 2.0)
+                if align_to_blocks and step % bsize == 0:
+                    start -= start % bsize
+                off = np.arange(start, lim - size + 1, step)
+            else:
+                off = np.arange(0, lim, step)
+
+            if edge == 'shrink':
+                sz = np.minimum(size, lim - off)
+            else:
+                sz = np.repeat(size, len(off))
+
+            offs.append(off)
+            sizes.append(sz)
+
+        # Expand to the full set of windows, stepping along x first
+        nx = len(offs[0])
+        ny = len(offs[1])
+        xoff = np.tile(offs[0], ny)
+        win_xsize = np.tile(sizes[0], ny)
+        yoff = np.repeat(offs[1], nx)
+        win_ysize = np.repeat(sizes[1], nx)
+
+        logger.debug('planned %s windows (%s x %s)', nx*ny, nx, ny)
+
+        return xoff, yoff, win_xsize, win_ysize
+
+
+    def _iter_sliding(self, xoffs, yoffs, win_size, copy=False, bands=None,
+                      buffer=None, return_location=False, window_filter=None,
+                      **kwargs):
+        '''Yield the windows of the xoffs/yoffs grid from a rolling buffer
+        of full-width row strips.  See iter_window.  If window_filter is
+        passed, only the windows for which window_filter(xoff, yoff) is True
+        are yielded and the strips of rows without any are not read.'''
+
+        if kwargs:
+            raise ValueError("The following arguments are not supported in "
+                             "sliding mode: %s" % ', '.join(kwargs.keys()))
+
+        # Apply the buffer to the window size and offsets
+        xbuff, ybuff = _parse_buffer(buffer)
+        xsize = win_size[0]+2*xbuff
+        ysize = win_size[1]+2*ybuff
+        grid_xoffs, grid_yoffs = xoffs, yoffs
+        xoffs = [int(x)-xbuff for x in xoffs]
+        yoffs = [int(y)-ybuff for y in yoffs]
+
+        # Columns covered by the row buffer - includes any padding
+        xmin = min(0, xoffs[0])
+        xmax = max(self.meta.shape[1], xoffs[-1]+xsize)
+        strip_xsize = xmax-xmin
+
+        def read_strip(strip_yoff, strip_ysize, out=None):
+            # Rows entirely outside the image are zero padding
+            if strip_yoff >= self.meta.shape[2]:
+                out[...] = 0
+                return out
+            strip = self.get_data(bands=bands,
+                                  window=[xmin, strip_yoff,
+                                          strip_xsize, strip_ysize])
+            if out is None:
+                return strip
+            out[...] = strip
+            return out
+
+        buf = None
+        buf_yoff = None
+        for grid_yoff, yoff in zip(grid_yoffs, yoffs):
+            if window_filter is None:
+                row = [True]*len(xoffs)
+            else:
+                row = [window_filter(x, grid_yoff) for x in grid_xoffs]
+                if not any(row):
+                    continue
+
+            # buf_yoff only moves forward, so skipped rows are still handled
+            # by the shift below
+            if buf is None:
+                buf = read_strip(yoff, ysize)
+            elif yoff-buf_yoff >= ysize:
+                # Nothing to keep from the last strip
+                read_strip(yoff, ysize, out=buf)
+            else:
+                # Shift the rows that are still needed and read the rest
+                keep = buf_yoff+ysize-yoff
+                buf[:, :keep, :] = buf[:, ysize-keep:, :]
+                read_strip(yoff+keep, ysize-keep, out=buf[:, keep:, :])
+            buf_yoff = yoff
+
+            for xoff, wanted in zip(xoffs, row):
+                if not wanted:
+                    continue
                 logger.debug(' xoff is %s,\tyoff is %s', xoff, yoff)
-                yield self.get_data(window=[xoff, yoff, xsize, ysize], **kwargs)
-                xoff += xstride
-                if xoff > self.meta.shape[1]:
-                    xoff = xoff_start
-                    yoff += ystride
-                if yoff > self.meta.shape[2]:
-                    break
+                chip = buf[:, :, xoff-xmin:xoff-xmin+xsize]
+                if copy:
+                    chip = chip.copy()
+                else:
+                    chip.flags.writeable = False
+
+                if return_location:
+                    location_dict = {}
+                    location_dict['upper_left_pixel'] = [max(xoff, 0),
+                                                         max(yoff, 0)]
+                    if return_location is not True:
+                        location_dict['coords'] = self._location_coords(
+                                                    return_location,
+                                                    [xoff, yoff, xsize, ysize])
+                    yield chip, location_dict
+                else:
+                    yield chip
 
 
     def iter_window_random(self, win_size=None, no_chips=1000, **kwargs):
@@ -513,6 +1180,257 @@ class GeoImage(object):
             if counter == 0: break
 
 
+    def iter_window_batched(self, win_size=None, batch_size=32, stride=None,
+                            edge='pad', prefetch=0, bands=None, buffer=None,
+                            processes=0):
+        '''
+        Window iterator that yields batches of stacked windows.
+
+        The windows are planned with plan_windows and read directly into a
+        preallocated (batch_size, bands, y, x) array that is reused between
+        batches.  The last batch may be shorter than batch_size.  If
+        prefetch is greater than zero, the next batches are read on a
+        background thread while the current batch is being used.
+
+        Parameters
+        ----------
+        win_size : array-like, length 2, optional
+            The size of the requested image chips in x and y.  Defaults to
+            the gdal block size.
+        batch_size : int, optional
+            Number of chips in each batch.
+        stride : array-like, length 2, optional
+            The size of the step between each chip in x and y.
+        edge : {'pad', 'drop'}, optional
+            See plan_windows.  'shrink' is not valid since all chips in a
+            batch must be the same size.
+        prefetch : int, optional
+            Number of batches to read ahead on a background thread (or of
+            extra shared memory slots if processes is used).
+        bands : list, optional
+            Bands to read (see get_data).
+        buffer : int or list, optional
+            Buffer to add around each chip (see get_data).
+        processes : int, optional
+            Number of worker processes used to read batches.  Workers read
+            directly into a ring of batch slots in shared memory and only
+            (slot, position, count) descriptors are sent back, so the chips
+            are never pickled.  A slot is recycled once the next batch is
+            requested.  Batches are yielded in the order they are finished,
+            which is not necessarily the window order.
+
+        Yields
+        ------
+        batch : ndarray
+            Four dimensional array of the chips.  The array is reused, so
+            copy it if it is needed after the next iteration.
+        windows : ndarray
+            (n, 4) array of the xoff, yoff, win_xsize, win_ysize of each chip
+            before any buffer is applied.
+        '''
+
+        if edge == 'shrink':
+            raise ValueError("The chips in a batch must be the same size, so "
+                             "edge='shrink' is not supported.")
+
+        windows = np.column_stack(self.plan_windows(win_size=win_size,
+                                                    stride=stride,
+                                                    edge=edge))
+
+        for x in self._iter_batches(windows, batch_size, prefetch=prefetch,
+                                    bands=bands, buffer=buffer,
+                                    processes=processes):
+            yield x
+
+
+    def iter_window_random_batched(self, win_size=None, batch_size=32,
+                                   no_chips=1000, prefetch=0, bands=None,
+                                   buffer=None, processes=0):
+        """Random chip iterator that yields batches of stacked chips.  See
+        iter_window_random and iter_window_batched for the arguments.
+
+        Yields
+        ------
+        batch : ndarray
+            Four dimensional array of the chips.  The array is reused, so
+            copy it if it is needed after the next iteration.
+        windows : ndarray
+            (n, 4) array of the xoff, yoff, win_xsize, win_ysize of each chip.
+        """
+
+        # Check input values
+        if not win_size or any(x <= 0 for x in win_size):
+            raise ValueError('No value in win_size can be equal '
+                             'to or less than zero.')
+
+        xsize, ysize = win_size
+        windows = np.empty((no_chips, 4), dtype='int64')
+        windows[:,0] = np.random.randint(self.meta.shape[1]-xsize+1,
+                                         size=no_chips)
+        windows[:,1] = np.random.randint(self.meta.shape[2]-ysize+1,
+                                         size=no_chips)
+        windows[:,2] = xsize
+        windows[:,3] = ysize
+
+        for x in self._iter_batches(windows, batch_size, prefetch=prefetch,
+                                    bands=bands, buffer=buffer,
+                                    processes=processes):
+            yield x
+
+
+    def _iter_batches(self, windows, batch_size, prefetch=0, bands=None,
+                      buffer=None, processes=0):
+        '''Yield (batch, windows) from an (n, 4) array of equally sized
+        windows.  See iter_window_batched.'''
+
+        if batch_size < 1:
+            raise ValueError("batch_size must be one or greater.")
+        if prefetch < 0:
+            raise ValueError("prefetch can not be negative.")
+        if processes < 0:
+            raise ValueError("processes can not be negative.")
+        if len(windows) == 0:
+            return
+
+        bands = self._get_band_numbers(bands)
+        xbuff, ybuff = _parse_buffer(buffer)
+        xsize = int(windows[0,2])+2*xbuff
+        ysize = int(windows[0,3])+2*ybuff
+        dt = const.DICT_GDAL_TO_NP[self._fobj.GetRasterBand(bands[0]).DataType]
+        shape = (batch_size, len(bands), ysize, xsize)
+        starts = range(0, len(windows), batch_size)
+
+        if processes:
+            for x in self._iter_batches_shared(windows, starts, shape, dt,
+                                               bands, (xbuff, ybuff),
+                                               prefetch, processes):
+                yield x
+            return
+
+        # One slot is held by the caller and the rest are filled ahead
+        nslots = prefetch+1
+        buf = np.empty((nslots,)+shape, dtype=dt)
+
+        def fill(img, slot, start):
+            return _fill_batch(img, buf[slot], windows, start, bands,
+                               xbuff, ybuff)
+
+        if not prefetch:
+            for start in starts:
+                n = fill(self, 0, start)
+                yield buf[0,:n], windows[start:start+n]
+            return
+
+        # Read ahead on a background thread.  Slots move from free to ready
+        # as they are filled and back to free once the caller is done.
+        free = Queue.Queue()
+        for k in xrange(nslots):
+            free.put(k)
+        ready = Queue.Queue()
+        stop = threading.Event()
+
+        def producer():
+            # gdal handles aren't thread safe, so the producer reads through
+            # its own copy of the image while the caller keeps using self
+            try:
+                img = self._reopen()
+                for start in starts:
+                    slot = None
+                    while slot is None:
+                        if stop.is_set():
+                            return
+                        try:
+                            slot = free.get(timeout=0.1)
+                        except Queue.Empty:
+                            pass
+                    n = fill(img, slot, start)
+                    ready.put((slot, start, n))
+            except Exception as e:
+                ready.put(e)
+                return
+            ready.put(None)
+
+        t = threading.Thread(target=producer)
+        t.daemon = True
+        t.start()
+
+        last = None
+        try:
+            while True:
+                item = ready.get()
+                if last is not None:
+                    free.put(last)
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                slot, start, n = item
+                last = slot
+                yield buf[slot,:n], windows[start:start+n]
+        finally:
+            stop.set()
+
+
+    def _iter_batches_shared(self, windows, starts, shape, dt, bands,
+                             buffer, prefetch, processes):
+        '''Yield (batch, windows) with batches read by worker processes
+        into a ring of slots in shared memory.  See iter_window_batched.'''
+
+        # The ring is allocated before the workers start so that it is
+        # inherited (or passed) rather than pickled per batch.
+        nslots = max(prefetch, processes)+1
+        itemsize = np.dtype(dt).itemsize
+        ring = mp_sharedctypes.RawArray(ctypes.c_char,
+                                        int(nslots*np.prod(shape)*itemsize))
+        buf = np.frombuffer(ring, dtype=dt).reshape((nslots,)+shape)
+
+        tasks = multiprocessing.Queue()
+        free = multiprocessing.Queue()
+        ready = multiprocessing.Queue()
+        for start in starts:
+            tasks.put(start)
+        for k in xrange(processes):
+            tasks.put(None)
+        for k in xrange(nslots):
+            free.put(k)
+
+        workers = [multiprocessing.Process(target=_shared_batch_worker,
+                                           args=(self, ring, dt,
+                                                 (nslots,)+shape, windows,
+                                                 bands, buffer, tasks, free,
+                                                 ready))
+                   for k in xrange(processes)]
+        for p in workers:
+            p.daemon = True
+            p.start()
+
+        last = None
+        try:
+            for k in xrange(len(starts)):
+                while True:
+                    try:
+                        item = ready.get(timeout=1.0)
+                        break
+                    except Queue.Empty:
+                        if not any(p.is_alive() for p in workers):
+                            raise RuntimeError("The worker processes exited "
+                                               "before all batches were "
+                                               "read.")
+                if last is not None:
+                    free.put(last)
+                    last = None
+                if isinstance(item, Exception):
+                    raise item
+                slot, start, n = item
+                last = slot
+                yield buf[slot,:n], windows[start:start+n]
+        finally:
+            for p in workers:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+
+
     def iter_components(self, **kwargs):
         """This is a convenience method that iterataes (via yield) through
         the components in the image object.  Any kwargs valid for get_data
@@ -522,9 +1440,41 @@ class GeoImage(object):
             yield self.get_data(component=c, **kwargs)
 
 
-    def iter_vector(self, vector=None, properties=False, filter=None, **kwargs):
+    def iter_vector(self, vector=None, properties=False, filter=None,
+                    skip_nonoverlap=False, superwindow=None, parts=False,
+                    workers=1, ordered=True, skip_filtered=False, **kwargs):
         """This method iterates (via yeild) through a vector object or file.
-        Any kwargs valid for get_data can be passed through."""
+        Any kwargs valid for get_data can be passed through.
+
+        The filter is set as an OGR attribute filter on the layer when it
+        can be written as one, so the driver only returns the matching
+        features.  Filtered features still yield None (or (None, None)),
+        which takes a second pass over the layer's fids (no fields or
+        geometries are read).  With skip_filtered=True they are dropped
+        instead and the second pass isn't needed.  Filters that can't be
+        set on the layer are checked in python for each feature.
+
+        Features whose envelope does not touch the image footprint are
+        recognized without transforming their geometry and yield None (or
+        (None, properties)).  If skip_nonoverlap is True they are dropped
+        instead of yielded and the footprint is set as a spatial filter on
+        the layer so that the driver's spatial index can skip them.
+
+        If superwindow is set (a size in pixels, or True for 1024), nearby
+        features are grouped in Z-order into superwindows of at most that
+        size that are read once and sliced into the feature chips.  This
+        cuts the number of reads for dense point or small polygon layers.
+        The output and its order are the same as without it.  Only the
+        bands, buffer, mask and mask_all_touched get_data arguments can be
+        used with superwindow, others fall back to per feature reads.
+
+        If parts is True each feature is read with get_data_parts and the
+        data yielded for it is a list with one entry per geometry part.
+
+        With workers > 1 the feature reads run on a pool of that many
+        threads, each with its own gdal dataset handle.  Results are
+        yielded in feature order if ordered is True, otherwise as they
+        finish.  superwindow isn't used with workers."""
 
         if 'window' in kwargs.keys():
             raise ValueError("The window argument is not valid for this " \
@@ -549,77 +1499,149 @@ class GeoImage(object):
 
         coord_trans = osr.CoordinateTransformation(lyr_sr, img_sr)
 
-        for feat in lyr:
-            # Return feature properties data is requested
-            if properties is True:
-                prop_out = feat.items()
-            elif properties:
-                if isinstance(properties, (list, tuple, str)):
-                    if isinstance(properties, str):
-                        properties = [properties]
-                    it = feat.items()
-                    if not all(x for x in properties if x in it.keys()):
-                        raise ValueError("One or more of the requested "
-                                         "properties are not in the vector "
-                                         "feature.")
-                    prop_out = {x: it[x] for x in properties if x in it.keys()}
+        defn = lyr.GetLayerDefn()
+        field_names = [defn.GetFieldDefn(i).GetName()
+                       for i in xrange(defn.GetFieldCount())]
+
+        # Requested property names are resolved against the layer once
+        if properties is True:
+            prop_names = field_names
+        elif properties:
+            if isinstance(properties, (list, tuple, str)):
+                if isinstance(properties, str):
+                    properties = [properties]
+                prop_names = [x for x in properties if x in field_names]
+            else:
+                raise ValueError("Invalid properties argument.")
+        else:
+            prop_names = []
+
+        # Determine which features should be returned based on the value of
+        # filter.  The filter is compiled once to an OGR SQL attribute filter
+        # and a python predicate.  The predicate is the fallback if the
+        # attribute filter can't be built or set and confirms the exact
+        # match of the features the driver returns.
+        where = None
+        if filter:
+            where, predicate, filter_names = _compile_vector_filter(
+                                                        filter, field_names)
+        else:
+            filter_names = []
+
+        # Only fetch the fields that will be used
+        needed = set(prop_names) | set(filter_names)
+        lyr.SetIgnoredFields([x for x in field_names if x not in needed] +
+                             ['OGR_STYLE'])
+
+        # Image footprint in the layer srs to prefilter features before
+        # their geometries are transformed.
+        footprint = self._footprint(lyr_sr)
+        if footprint is not None:
+            fp_extent = footprint.GetEnvelope()
+            if skip_nonoverlap:
+                lyr.SetSpatialFilter(footprint)
+
+        # The filter fields aren't ignored, so drivers that evaluate the
+        # attribute filter with the OGR SQL engine (i.e. Shapefile) can.
+        if where is not None:
+            try:
+                if lyr.SetAttributeFilter(where) != 0:
+                    where = None
+            except RuntimeError:
+                where = None
+            if where is None:
+                lyr.SetAttributeFilter(None)
+
+        # The positions of the filtered features come from the fids of a
+        # second handle of the layer that doesn't read fields or geometries.
+        all_lyr = None
+        if where is not None and not skip_filtered:
+            all_obj = ogr.Open(vector)
+            all_lyr = all_obj.GetLayer(0)
+            all_lyr.SetIgnoredFields(field_names + ['OGR_GEOMETRY',
+                                                    'OGR_STYLE'])
+            if footprint is not None and skip_nonoverlap:
+                all_lyr.SetSpatialFilter(footprint)
+            first = all_lyr.GetNextFeature()
+            all_lyr.ResetReading()
+            if first is not None and first.GetFID() == ogr.NullFID:
+                # Without fids the features can't be matched up
+                lyr.SetAttributeFilter(None)
+                where = None
+                all_lyr = None
+
+        def layer_features():
+            # Yield (feature, filtered) in layer order, feature is None for
+            # filtered features that the driver didn't return.
+            if all_lyr is None:
+                for feat in lyr:
+                    yield feat, bool(filter) and not predicate(feat)
+                return
+
+            # The attribute filter doesn't change the order the driver
+            # returns features in, so the matches are merged in by fid.
+            matches = iter(lyr)
+            match = next(matches, None)
+            for feat in all_lyr:
+                if match is not None and feat.GetFID() == match.GetFID():
+                    yield match, not predicate(match)
+                    match = next(matches, None)
+                else:
+                    yield None, True
+            if match is not None:
+                raise RuntimeError("The attribute filtered features of %s "
+                                   "aren't in layer order." % vector)
+
+        def features():
+            # Yield (geom, properties, filtered) with geom in image space or
+            # None if the feature is filtered or outside the footprint.
+            for feat, filtered in layer_features():
+                if filtered:
+                    if not skip_filtered:
+                        yield None, None, True
+                    continue
+
+                # Return feature properties data is requested
+                prop_out = None
+                if properties is True:
+                    prop_out = feat.items()
+                elif properties:
+                    prop_out = {x: feat.GetField(x) for x in prop_names}
                     if not prop_out:
                         prop_out = None
                         warnings.warn("No properties value found matching "
                                       "request.")
-                else:
-                    raise ValueError("Invalid properties argument.")
-
-
-            # Determine if the feature should be returned based on value of
-            # filter and if the value exists in the feature properties.
-            if filter:
-                # The filter should be either a list of dictionary key/value
-                # paris of length one, or of list of key/value pairs.  The
-                # idea is that you can filter against more than one value
-                # of a key when you can pass a list of pairs.
-                if isinstance(filter, dict) & (len(filter) != 1):
-                    raise ValueError("Filters should be passed in as a " \
-                                     "list of dictionaries that will " \
-                                     "be used to filter against the " \
-                                     "feature property values.")
-
-                # If filter is a dict of len 1, convert to a list of len 1 for
-                # the looping code below.
-                if isinstance(filter,dict):
-                    filter = [filter]
-
-                # Get feature properties to check against.
-                prop_test = feat.items()
-
-                # raise warning if a filter item key is not in properties
-                if any(f.keys()[0] not in prop_test.keys() for f in filter):
-                    warnings.warn("Requested filter key is not present in "
-                                  "vector properties.")
-
-                # If any filter is caught, pass on, otherwise return
-                if any(prop_test.get(d.keys()[0], None) ==
-                                    d.values()[0] for d in filter):
-                    pass
-                else:
-                    if properties:
-                        yield (None, None)
-                        continue
-                    else:
-                        yield None
-                        continue
 
-            # Get the geometry to pass to get_data
-            geom = feat.geometry()
+                # Get the geometry to pass to get_data
+                geom = feat.geometry()
 
-            # Use transform from above to put geom in image space
-            geom.Transform(coord_trans)
+                if footprint is not None and (geom is None or
+                        not _extents_overlap(geom.GetEnvelope(), fp_extent)):
+                    geom = None
+                else:
+                    # Use transform from above to put geom in image space
+                    geom.Transform(coord_trans)
+
+                yield geom, prop_out, False
+
+        reader = 'get_data_parts' if parts else 'get_data'
+        if workers > 1:
+            chips = self._iter_feature_chips_parallel(features(), workers,
+                                                      ordered, reader,
+                                                      **kwargs)
+        elif (superwindow and not parts and
+              set(kwargs) <= set(['bands', 'buffer', 'mask',
+                                  'mask_all_touched'])):
+            if superwindow is True:
+                superwindow = 1024
+            chips = self._iter_superwindow_chips(features(), superwindow,
+                                                 **kwargs)
+        else:
+            chips = self._iter_feature_chips(features(), reader, **kwargs)
 
-            # Catch and pass OverlapError for the iterator
-            try:
-                data = self.get_data(geom=geom, **kwargs)
-            except OverlapError:
-                data = None
+        for data, prop_out, filtered in chips:
+            if data is None and skip_nonoverlap and not filtered:
+                continue
 
             # Yield the data
             if properties:
@@ -628,52 +1650,518 @@ class GeoImage(object):
                 yield data
 
 
-    def get_data_from_vec_extent(self, vector=None, **kwargs):
-        """This is a convenience method to find the extent of a vector and
-        return the data from that extent.  kwargs can be anything accepted
-        by get_data."""
+    def _iter_feature_chips(self, features, reader='get_data', **kwargs):
+        """Yield (data, properties, filtered) for the iter_vector features
+        with one call of the reader method (get_data by default) per
+        feature."""
+        for geom, prop_out, filtered in features:
+            yield (self._read_feature(reader, geom, **kwargs), prop_out,
+                   filtered)
+
+
+    def _read_feature(self, reader, geom, **kwargs):
+        """Read an iter_vector feature geometry with the reader method,
+        None if it is None or doesn't overlap the image."""
+        if geom is None:
+            return None
+        # Catch and pass OverlapError for the iterator
+        try:
+            return getattr(self, reader)(geom=geom, **kwargs)
+        except OverlapError:
+            return None
+
+
+    def _iter_feature_chips_parallel(self, features, workers, ordered=True,
+                                     reader='get_data', **kwargs):
+        """Like _iter_feature_chips with the reads done on a pool of workers
+        threads, each reading through its own copy of the image (see
+        _reopen).  Results are yielded in feature order if ordered is True
+        and as they finish otherwise.  At most a few reads per thread are
+        in flight so features are pulled from the layer as needed."""
+
+        local = threading.local()
+
+        def run(geom):
+            try:
+                img = local.img
+            except AttributeError:
+                img = local.img = self._reopen()
+            return img._read_feature(reader, geom, **kwargs)
+
+        max_pending = 4*workers
+        pool = ThreadPool(workers)
+        try:
+            if ordered:
+                pending = collections.deque()
+                for geom, prop_out, filtered in features:
+                    # The geometry belongs to the feature, so copy it
+                    # before the layer moves on
+                    if geom is not None:
+                        geom = geom.Clone()
+                    pending.append((pool.apply_async(run, (geom,)),
+                                    prop_out, filtered))
+                    if len(pending) >= max_pending:
+                        r, prop_out, filtered = pending.popleft()
+                        yield r.get(), prop_out, filtered
+                while pending:
+                    r, prop_out, filtered = pending.popleft()
+                    yield r.get(), prop_out, filtered
+            else:
+                done = Queue.Queue()
+
+                def task(geom, prop_out, filtered):
+                    try:
+                        done.put((run(geom), prop_out, filtered))
+                    except Exception as e:
+                        done.put(e)
+
+                def finished():
+                    item = done.get()
+                    if isinstance(item, Exception):
+                        raise item
+                    return item
+
+                n = 0
+                for geom, prop_out, filtered in features:
+                    if geom is None:
+                        yield None, prop_out, filtered
+                        continue
+                    pool.apply_async(task, (geom.Clone(), prop_out,
+                                            filtered))
+                    n += 1
+                    if n >= max_pending:
+                        yield finished()
+                        n -= 1
+                while n:
+                    yield finished()
+                    n -= 1
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+    def _iter_superwindow_chips(self, features, size, bands=None,
+                                buffer=None, mask=False,
+                                mask_all_touched=False):
+        """Yield (data, properties, filtered) for the iter_vector features
+        like _iter_feature_chips.  Features are buffered in chunks, sorted in
+        Z-order and grouped into superwindows of at most size x size pixels
+        that are read once, then each chip is sliced from its superwindow
+        and masked/padded as get_data would.  Output order is unchanged."""
+
+        chunk = []
+        for geom, prop_out, filtered in features:
+            # Copy the geometry before the layer moves on (see
+            # _instantiate_geom)
+            if geom is not None:
+                geom = self._instantiate_geom(geom)
+            chunk.append(self._superwindow_record(geom, buffer, prop_out,
+                                                  filtered))
+
+            if len(chunk) == _SUPERWINDOW_CHUNK:
+                for x in self._read_superwindow_chunk(chunk, size, bands,
+                                                      mask, mask_all_touched):
+                    yield x
+                chunk = []
+
+        for x in self._read_superwindow_chunk(chunk, size, bands, mask,
+                                              mask_all_touched):
+            yield x
+
+
+    def _superwindow_record(self, g, buffer, prop_out, filtered):
+        """Return the (geometry, clipped window, padding, properties,
+        filtered) record read by _read_superwindow_chunk for the image
+        space geometry g.  The geometry is None if g is None or doesn't
+        overlap the image."""
+        if g is None:
+            return (None, None, None, prop_out, filtered)
+        try:
+            window = self._extent_to_window(g.GetEnvelope())
+        except OverlapError:
+            return (None, None, None, prop_out, filtered)
+        if buffer:
+            xbuff, ybuff = _parse_buffer(buffer)
+            window = [window[0]-xbuff, window[1]-ybuff,
+                      window[2]+2*xbuff, window[3]+2*ybuff]
+        window, pads = self._clip_window(window)
+        return (g, window, pads, prop_out, filtered)
+
+
+    def _read_superwindow_chunk(self, chunk, size, bands, mask,
+                                mask_all_touched):
+        """Read the chips of a chunk of _iter_superwindow_chips records."""
+
+        idx = [i for i, rec in enumerate(chunk) if rec[0] is not None]
+        out = [None]*len(chunk)
+
+        if idx:
+            windows = np.array([chunk[i][1] for i in idx], dtype='int64')
+            for members, (ux, uy, uw, uh) in _group_windows(windows, size):
+                sw = self.get_data(window=[ux, uy, uw, uh], bands=bands)
+                for k in members:
+                    i = idx[k]
+                    g, window, pads = chunk[i][:3]
+                    [xoff, yoff, win_xsize, win_ysize] = window
+                    data = sw[:, yoff-uy:yoff-uy+win_ysize,
+                                 xoff-ux:xoff-ux+win_xsize].copy()
+                    out[i] = self._mask_and_pad(data, g, mask,
+                                                mask_all_touched, window,
+                                                pads)
+
+        for data, rec in zip(out, chunk):
+            yield data, rec[3], rec[4]
+
+
+    def iter_vector_batches(self, vector=None, batch_size=1024,
+                            properties=False, superwindow=1024, **kwargs):
+        """Iterate through a vector in columnar batches of features.
+
+        Features are read a batch at a time, through OGR's Arrow stream
+        interface when it is available (GDAL >= 3.6) and with a feature loop
+        otherwise.  The GDAL >= 3.6 bindings are python 3 only, so with the
+        python 2 GDAL builds geoio runs on the feature loop is used and the
+        Arrow stream path is untested.  Each batch is transformed to image
+        space with a single Transform call and its chips are read together,
+        grouped into superwindows as with iter_vector(superwindow=...).  This
+        avoids most of the per feature python overhead of iter_vector.
+
+        Parameters
+        ----------
+        vector : str
+            Vector file (or anything ogr.Open accepts).  Layer 0 is used.
+        batch_size : int, optional
+            Maximum number of features in a batch.
+        properties : bool, str, or list, optional
+            Attribute columns to include in the batches, True for all.
+        superwindow : int, optional
+            Superwindow size used to read the chips of a batch.  Pass None
+            to read each chip with its own get_data call.
+        kwargs
+            bands, buffer, mask, and mask_all_touched are passed on to the
+            reads.  Other get_data arguments need superwindow=None.
+
+        Yields
+        ------
+        OrderedDict
+            'fid' (int64 array), 'geometry' (object array of WKB in the layer
+            srs, None for empty geometries), one masked array per requested
+            attribute (null values are masked), and 'data' (a list with the
+            chip of each feature or None if it doesn't overlap the image).
+        """
         if vector is None:
             raise ValueError("Requires a vector to read.  The vector can be " \
                              "a string that describes a vector object or a " \
                              "path to a valid vector file.")
 
-        if 'window' in kwargs.keys():
-            raise ValueError("The window argument is not valid for this " \
-                             "method. The vector file passed in defines " \
-                             "the retrieval geometry.")
-
-        if 'geom' in kwargs.keys():
-            raise ValueError("The geom argument is not valid for this " \
-                             "method. The vector file passed in defines " \
-                             "the retrieval geometry.")
-
-        if 'mask' in kwargs.keys():
-            raise ValueError("A mask request is not valid for this method " \
-                             "because it retrives data from the full extent " \
-                             "of the vector.  You might want a rasterize " \
-                             "method or iter_vector?")
+        if 'window' in kwargs.keys() or 'geom' in kwargs.keys():
+            raise ValueError("The window and geom arguments are not valid " \
+                             "for this method. The vector file passed in " \
+                             "defines the retrieval geometry.")
 
-        # ToDo Test for overlap of geom and image data?
+        if superwindow and not set(kwargs) <= set(['bands', 'buffer', 'mask',
+                                                   'mask_all_touched']):
+            raise ValueError("Only the bands, buffer, mask, and "
+                             "mask_all_touched arguments can be used with "
+                             "superwindow.")
 
         obj = ogr.Open(vector)
         lyr = obj.GetLayer(0)
         lyr_sr = lyr.GetSpatialRef()
 
-        img_proj = self.meta.projection_string
-        img_trans = self.meta.geo_transform
         img_sr = osr.SpatialReference()
-        img_sr.ImportFromWkt(img_proj)
+        img_sr.ImportFromWkt(self.meta.projection_string)
+        coord_trans = osr.CoordinateTransformation(lyr_sr, img_sr)
 
-        coord_trans = osr.CoordinateTransformation(lyr_sr,img_sr)
+        defn = lyr.GetLayerDefn()
+        field_names = [defn.GetFieldDefn(i).GetName()
+                       for i in xrange(defn.GetFieldCount())]
+        if properties is True:
+            fields = field_names
+        elif properties:
+            if isinstance(properties, basestring):
+                properties = [properties]
+            fields = [x for x in properties if x in field_names]
+        else:
+            fields = []
+        lyr.SetIgnoredFields([x for x in field_names if x not in fields] +
+                             ['OGR_STYLE'])
+
+        footprint = self._footprint(lyr_sr)
+        if footprint is not None:
+            fp_extent = footprint.GetEnvelope()
+
+        for batch in _vector_batches(lyr, batch_size, fields):
+            # Transform the overlapping geometries of the batch at once as
+            # one collection
+            coll = ogr.Geometry(ogr.wkbGeometryCollection)
+            members = []
+            for i, wkb in enumerate(batch['geometry']):
+                if wkb is None:
+                    continue
+                g = ogr.CreateGeometryFromWkb(wkb)
+                if footprint is not None and not _extents_overlap(
+                                            g.GetEnvelope(), fp_extent):
+                    continue
+                coll.AddGeometryDirectly(g)
+                members.append(i)
+            if members:
+                coll.Transform(coord_trans)
+
+            geoms = [None]*len(batch['fid'])
+            for j, i in enumerate(members):
+                geoms[i] = coll.GetGeometryRef(j).Clone()
+
+            if superwindow:
+                recs = [self._superwindow_record(g, kwargs.get('buffer'),
+                                                 None, False) for g in geoms]
+                chips = self._read_superwindow_chunk(
+                                recs, superwindow, kwargs.get('bands'),
+                                kwargs.get('mask', False),
+                                kwargs.get('mask_all_touched', False))
+            else:
+                chips = self._iter_feature_chips(
+                                ((g, None, False) for g in geoms), **kwargs)
+            batch['data'] = [x[0] for x in chips]
+
+            yield batch
+
+
+    def zonal_stats(self, vector=None, stats=('count', 'mean', 'std', 'min',
+                                              'max'),
+                    bands=None, all_touched=False, bins=10, hist_range=None,
+                    tile_size=1024, out_file=None,
+                    out_driver='ESRI Shapefile'):
+        """Compute statistics of the image pixels under each feature of a
+        vector in a single pass over the image.
+
+        The features are transformed to image space and indexed by the image
+        tiles they touch once.  Then each tile that has features is read
+        once, its features are rasterized into a label block, and the
+        statistics are reduced per label with grouped numpy operations (see
+        zonal.ZonalAccumulator).  Pixels equal to the image no data value are
+        excluded.  Features whose pixel windows overlap are rasterized in
+        separate passes over the tile, so pixels shared by overlapping
+        features count for each of them (as with iter_vector(mask=True)).
 
-        extent = lyr.GetExtent()
+        Parameters
+        ----------
+        vector : str
+            Vector file (or anything ogr.Open accepts).  Layer 0 is used.
+        stats : list, optional
+            Any of 'count', 'sum', 'mean', 'std', 'min', 'max', and 'hist'.
+        bands : list, optional
+            Bands to compute the statistics for (see get_data).
+        all_touched : bool, optional
+            Include all pixels touched by a feature, not only those whose
+            center is inside it.
+        bins : int, optional
+            Number of histogram bins for 'hist'.
+        hist_range : tuple, optional
+            (min, max) of the histogram bins, required for 'hist'.
+        tile_size : int, optional
+            Size of the tiles the image is processed in.
+        out_file : str, optional
+            If passed, a copy of the vector layer with a '<stat>_<band>'
+            field for each statistic (other than 'hist') is written to this
+            file.
+        out_driver : str, optional
+            ogr driver used to write out_file.
 
-        window = self._extent_to_window(extent,coord_trans)
+        Returns
+        -------
+        OrderedDict
+            'fid' holds the feature ids in layer order and each requested
+            statistic an (features, bands) array ((features, bands, bins)
+            for 'hist').  Features that don't overlap the image have a count
+            of zero and NaN for the other statistics.
+        """
+        if vector is None:
+            raise ValueError("Requires a vector to read.  The vector can be " \
+                             "a string that describes a vector object or a " \
+                             "path to a valid vector file.")
+
+        bands = self._get_band_numbers(bands)
+        tile_size = int(tile_size)
+
+        obj = ogr.Open(vector)
+        lyr = obj.GetLayer(0)
+        lyr_sr = lyr.GetSpatialRef()
+
+        img_sr = osr.SpatialReference()
+        img_sr.ImportFromWkt(self.meta.projection_string)
+        coord_trans = osr.CoordinateTransformation(lyr_sr, img_sr)
+
+        footprint = self._footprint(lyr_sr)
+        if footprint is not None:
+            fp_extent = footprint.GetEnvelope()
+
+        # Index the image space geometries (as wkb) by the tiles they touch
+        defn = lyr.GetLayerDefn()
+        lyr.SetIgnoredFields([defn.GetFieldDefn(i).GetName()
+                              for i in xrange(defn.GetFieldCount())] +
+                             ['OGR_STYLE'])
+        fids = []
+        wkbs = {}
+        windows = {}
+        tiles = collections.defaultdict(list)
+        for k, feat in enumerate(lyr):
+            fids.append(feat.GetFID())
+            geom = feat.geometry()
+            if geom is None or (footprint is not None and not
+                    _extents_overlap(geom.GetEnvelope(), fp_extent)):
+                continue
+            geom.Transform(coord_trans)
+            try:
+                window = self._extent_to_window(geom.GetEnvelope())
+            except OverlapError:
+                continue
+            [xoff, yoff, win_xsize, win_ysize] = self._clip_window(window)[0]
+            wkbs[k] = geom.ExportToWkb()
+            windows[k] = [xoff, yoff, win_xsize, win_ysize]
+            for ty in xrange(yoff//tile_size,
+                             (yoff+win_ysize-1)//tile_size+1):
+                for tx in xrange(xoff//tile_size,
+                                 (xoff+win_xsize-1)//tile_size+1):
+                    tiles[(ty, tx)].append(k)
+        lyr.SetIgnoredFields([])
+
+        acc = zonal.ZonalAccumulator(len(fids), len(bands), stats=stats,
+                                     bins=bins, hist_range=hist_range)
+
+        # Label raster and layer reused for every tile
+        tds = gdal.GetDriverByName('MEM').Create('', tile_size, tile_size, 1,
+                                                 gdal.GDT_Int32)
+        tband = tds.GetRasterBand(1)
+        mds = ogr.GetDriverByName('Memory').CreateDataSource('')
+        opts = ['ATTRIBUTE=label']
+        if all_touched:
+            opts.append('ALL_TOUCHED=TRUE')
+
+        for (ty, tx) in sorted(tiles):
+            xoff, yoff = tx*tile_size, ty*tile_size
+            win_xsize = min(tile_size, self.grid.xsize-xoff)
+            win_ysize = min(tile_size, self.grid.ysize-yoff)
+
+            tds.SetGeoTransform(
+                    self.grid.subgrid([xoff, yoff, tile_size,
+                                       tile_size]).geo_transform)
+            data = self.get_data(window=[xoff, yoff, win_xsize, win_ysize],
+                                 bands=bands)
+
+            # One label block per set of features that can't share pixels
+            for members in _label_passes(tiles[(ty, tx)], windows,
+                                         [xoff, yoff, win_xsize, win_ysize],
+                                         pad=1 if all_touched else 0):
+                tband.Fill(0)
+                tlyr = mds.CreateLayer('labels', None, ogr.wkbUnknown)
+                tlyr.CreateField(ogr.FieldDefn('label', ogr.OFTInteger))
+                tdefn = tlyr.GetLayerDefn()
+                for k in members:
+                    f = ogr.Feature(tdefn)
+                    f.SetField(0, k+1)
+                    f.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkbs[k]))
+                    tlyr.CreateFeature(f)
+                gdal.RasterizeLayer(tds, [1], tlyr, options=opts)
+                mds.DeleteLayer(0)
+
+                labels = tband.ReadAsArray(0, 0, win_xsize, win_ysize)
+                acc.add(labels, data, nodata=self.meta.no_data_value)
+
+        table = collections.OrderedDict()
+        table['fid'] = np.array(fids, dtype='int64')
+        table.update(acc.result())
+
+        if out_file is not None:
+            _write_zonal_layer(lyr, table, bands, out_file, out_driver)
+
+        return table
+
+
+    def get_data_from_vec_extent(self, vector=None, **kwargs):
+        """This is a convenience method to find the extent of a vector and
+        return the data from that extent.  kwargs can be anything accepted
+        by get_data."""
+        if vector is None:
+            raise ValueError("Requires a vector to read.  The vector can be " \
+                             "a string that describes a vector object or a " \
+                             "path to a valid vector file.")
+
+        if 'window' in kwargs.keys():
+            raise ValueError("The window argument is not valid for this " \
+                             "method. The vector file passed in defines " \
+                             "the retrieval geometry.")
+
+        if 'geom' in kwargs.keys():
+            raise ValueError("The geom argument is not valid for this " \
+                             "method. The vector file passed in defines " \
+                             "the retrieval geometry.")
+
+        if 'mask' in kwargs.keys():
+            raise ValueError("A mask request is not valid for this method " \
+                             "because it retrives data from the full extent " \
+                             "of the vector.  You might want a rasterize " \
+                             "method or iter_vector?")
+
+        # ToDo Test for overlap of geom and image data?
+
+        obj = ogr.Open(vector)
+        lyr = obj.GetLayer(0)
+        lyr_sr = lyr.GetSpatialRef()
+
+        img_proj = self.meta.projection_string
+        img_trans = self.meta.geo_transform
+        img_sr = osr.SpatialReference()
+        img_sr.ImportFromWkt(img_proj)
+
+        coord_trans = osr.CoordinateTransformation(lyr_sr,img_sr)
+
+        extent = lyr.GetExtent()
+
+        window = self._extent_to_window(extent,coord_trans)
         [xoff, yoff, win_xsize, win_ysize] = window
 
         return self.get_data(window = window, **kwargs)
 
 
+    def _footprint(self, srs=None, densify=16):
+        """Return the image footprint as an ogr polygon in srs (the image
+        projection if None).  Each edge is densified to densify points so
+        that the polygon follows curved edges after reprojection.  None is
+        returned if the footprint can't be transformed to srs."""
+
+        t = np.linspace(0, 1, densify, endpoint=False)
+        nx, ny = self.grid.xsize, self.grid.ysize
+        cols = np.concatenate([t*nx, np.full(densify, nx), (1-t)*nx,
+                               np.zeros(densify), [0]])
+        rows = np.concatenate([np.zeros(densify), t*ny, np.full(densify, ny),
+                               (1-t)*ny, [0]])
+        xs, ys = self.grid.raster_to_proj(cols, rows)
+
+        if srs is not None:
+            img_sr = osr.SpatialReference()
+            img_sr.ImportFromWkt(self.meta.projection_string)
+            coord_trans = osr.CoordinateTransformation(img_sr, srs)
+            try:
+                pts = coord_trans.TransformPoints(
+                                        np.column_stack([xs, ys]).tolist())
+            except Exception:
+                return None
+            pts = np.asarray(pts, dtype='float64').reshape(-1, 3)
+            xs, ys = pts[:,0], pts[:,1]
+
+        if not (np.isfinite(xs).all() and np.isfinite(ys).all()):
+            return None
+
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for x, y in zip(xs, ys):
+            ring.AddPoint_2D(float(x), float(y))
+        poly = ogr.Geometry(ogr.wkbPolygon)
+        poly.AddGeometry(ring)
+
+        return poly
+
+
     def _extent_to_window(self,extent,coord_trans=None):
 
         if not coord_trans:
@@ -703,13 +2191,15 @@ class GeoImage(object):
             ul_img = ul_vec
             lr_img = lr_vec
 
-        xs,ys = self.proj_to_raster(*zip(*[ul_img,lr_img]))
+        xs,ys = self.grid.proj_to_raster(
+                        np.array([ul_img[0], lr_img[0]], dtype='float64'),
+                        np.array([ul_img[1], lr_img[1]], dtype='float64'))
 
-        xoff = int(math.floor(min(xs)))
-        yoff = int(math.floor(min(ys)))
+        xoff = int(math.floor(xs.min()))
+        yoff = int(math.floor(ys.min()))
 
-        xmax = int(math.ceil(max(xs)))
-        ymax = int(math.ceil(max(ys)))
+        xmax = int(math.ceil(xs.max()))
+        ymax = int(math.ceil(ys.max()))
 
         win_xsize = xmax-xoff
         win_ysize = ymax-yoff
@@ -723,8 +2213,7 @@ class GeoImage(object):
         logger.debug('raster xy extent...\n\t%s,\n\t%s',xs,ys)
         logger.debug('requested window...\n\t%s',window)
 
-        if ((xoff + win_xsize <= 0) or (yoff + win_ysize <= 0) or
-            (xoff > self.meta.shape[1]) or (yoff > self.meta.shape[2])):
+        if self.grid.intersect_window(window) is None:
             raise OverlapError("The requested data window has no " \
                               "content.  Perhaps the image and vector " \
                               "do not overlap or the projections may " \
@@ -739,7 +2228,8 @@ class GeoImage(object):
 
         Input can be in a variety of types as long as both the input parameters
         are of the same type.  The method will attempt to return a data type
-        as similar as possible to the input type.
+        as similar as possible to the input type.  See proj_to_raster_array
+        for a faster array only version.
 
         Parameters
         ----------
@@ -764,41 +2254,27 @@ class GeoImage(object):
                              'either integers, float, tuples, lists, or '
                              'numpy arrays.')
 
-        # Determine input type so that the conversion back can be done
-        # on return
-        intype = 0
-        if not hasattr(projx, '__iter__'):
-            intype = 1
-        elif isinstance(projx, list):
-            intype = 2
-        elif isinstance(projx, tuple):
-            intype = 3
-        elif isinstance(projx, np.ndarray):
-            intype = 4
-        else:
+        # Transform per inverse of http://www.gdal.org/gdal_datamodel.html
+        # using the cached inverse geo transform
+        ig = self.grid.inv_transform
+
+        # Handle the common cases without any array conversion
+        if isinstance(projx, np.ndarray):
+            return self.proj_to_raster_array(projx, projy)
+        elif not hasattr(projx, '__iter__'):
+            return (ig[0] + ig[1] * projx + ig[2] * projy,
+                    ig[3] + ig[4] * projx + ig[5] * projy)
+        elif not isinstance(projx, (list, tuple)):
             raise ValueError("The input type was not recognized.")
 
-        # Convert to numpy arrays for the calculation
-        projx = np.asarray(projx)
-        projy = np.asarray(projy)
-
-        # Get geo_transform from object
-        gm = self.meta.geo_transform
-
-        # Transform per inverse of http://www.gdal.org/gdal_datamodel.html
-        x = (gm[5] * (projx - gm[0]) - gm[2] * (projy - gm[3])) / \
-            (gm[5] * gm[1] + gm[4] * gm[2])
-        y = (projy - gm[3] - x * gm[4]) / gm[5]
+        x, y = self.proj_to_raster_array(np.asarray(projx, dtype='float64'),
+                                         np.asarray(projy, dtype='float64'))
 
         # Return to input type
-        if intype == 1:
-            return float(x), float(y)
-        elif intype == 2:
-            return list(x), list(y)
-        elif intype == 3:
-            return tuple(x), tuple(y)
-        elif intype == 4:
-            return x, y
+        if isinstance(projx, list):
+            return x.tolist(), y.tolist()
+        else:
+            return tuple(x.tolist()), tuple(y.tolist())
 
 
     def raster_to_proj(self, x, y):
@@ -807,7 +2283,8 @@ class GeoImage(object):
 
         Input can be in a variety of types as long as both the input parameters
         are of the same type.  The method will attempt to return a data type
-        as similar as possible to the input type.
+        as similar as possible to the input type.  See raster_to_proj_array
+        for a faster array only version.
 
         Parameters
         ----------
@@ -832,40 +2309,339 @@ class GeoImage(object):
                              'either integers, float, tuples, lists, or '
                              'numpy arrays.')
 
-        # Determine input type so that the conversion back can be done
-        # on return
-        intype = 0
-        if not hasattr(x, '__iter__'):
-            intype = 1
-        elif isinstance(x, list):
-            intype = 2
-        elif isinstance(x, tuple):
-            intype = 3
-        elif isinstance(x, np.ndarray):
-            intype = 4
-        else:
+        # Transform per http://www.gdal.org/gdal_datamodel.html
+        gm = self.grid.geo_transform
+
+        # Handle the common cases without any array conversion
+        if isinstance(x, np.ndarray):
+            return self.raster_to_proj_array(x, y)
+        elif not hasattr(x, '__iter__'):
+            return (gm[0] + gm[1] * x + gm[2] * y,
+                    gm[3] + gm[4] * x + gm[5] * y)
+        elif not isinstance(x, (list, tuple)):
             raise ValueError("The input type was not recognized.")
 
-        # Convert to numpy arrays for the calculation
-        x = np.asarray(x)
-        y = np.asarray(y)
+        projx, projy = self.raster_to_proj_array(np.asarray(x, dtype='float64'),
+                                                 np.asarray(y, dtype='float64'))
 
-        # Get geo_transform from object
-        gm = self.meta.geo_transform
+        # Return to input type
+        if isinstance(x, list):
+            return projx.tolist(), projy.tolist()
+        else:
+            return tuple(projx.tolist()), tuple(projy.tolist())
 
-        # Transform per http://www.gdal.org/gdal_datamodel.html
-        projx = gm[0] + gm[1] * x + gm[2] * y
-        projy = gm[3] + gm[4] * x + gm[5] * y
 
-        # Return to input type
-        if intype == 1:
-            return float(projx), float(projy)
-        elif intype == 2:
-            return list(projx), list(projy)
-        elif intype == 3:
-            return tuple(projx), tuple(projy)
-        elif intype == 4:
-            return projx, projy
+    def proj_to_raster_array(self, projx, projy, out=None):
+        '''
+        Array only version of proj_to_raster without any type dispatch.
+
+        Parameters
+        ----------
+        projx : numpy.ndarray
+            Input points in projected space.
+        projy : numpy.ndarray
+            Input points in projected space.
+        out : tuple of two float64 numpy.ndarray, optional
+            Arrays to write the results into.  These can be projx and projy
+            themselves to convert float64 arrays in place.
+
+        Returns
+        -------
+        x, y : numpy.ndarray
+            raster x and y values.
+        '''
+        return self.grid.proj_to_raster(projx, projy, out)
+
+
+    def raster_to_proj_array(self, x, y, out=None):
+        '''
+        Array only version of raster_to_proj without any type dispatch.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            Input points in raster space.
+        y : numpy.ndarray
+            Input points in raster space.
+        out : tuple of two float64 numpy.ndarray, optional
+            Arrays to write the results into.  These can be x and y
+            themselves to convert float64 arrays in place.
+
+        Returns
+        -------
+        projx, projy : numpy.ndarray
+            projection x and y values.
+        '''
+        return self.grid.raster_to_proj(x, y, out)
+
+
+    def proj_to_raster_int(self, projx, projy, rounding='floor'):
+        '''
+        Convert points in projection space to integer pixel indices.
+
+        Parameters
+        ----------
+        projx : float or numpy.ndarray
+            Input points in projected space.
+        projy : float or numpy.ndarray
+            Input points in projected space.
+        rounding : {'floor', 'ceil'}, optional
+            floor gives the pixel containing the point (i.e. a window offset)
+            and ceil gives the pixel edge at or after the point (i.e. a
+            window end).
+
+        Returns
+        -------
+        x, y : numpy.ndarray
+            int64 raster x and y values.
+        '''
+        if rounding == 'floor':
+            rfunc = np.floor
+        elif rounding == 'ceil':
+            rfunc = np.ceil
+        else:
+            raise ValueError("rounding must be either 'floor' or 'ceil'.")
+
+        x, y = self.grid.proj_to_raster(np.asarray(projx, dtype='float64'),
+                                        np.asarray(projy, dtype='float64'))
+        return rfunc(x).astype('int64'), rfunc(y).astype('int64')
+
+
+    def get_coords(self, window=None, srs=None, step=16, tolerance=None):
+        '''
+        Return the coordinates of each pixel center in a window.
+
+        Coordinates in the image projection come straight from the geo
+        transform.  For other spatial references, the exact transform is
+        only computed on a lattice of every step pixels (plus the window
+        edges) and the coordinates in between are bilinearly interpolated.
+        If tolerance is passed, the interpolation error is checked at the
+        lattice cell centers and the lattice is refined until the error is
+        within tolerance.
+
+        Parameters
+        ----------
+        window : array-like, length 4, optional
+            [xoff, yoff, win_xsize, win_ysize] window (see get_data).
+            Defaults to the full image.
+        srs : osr.SpatialReference, str, or int, optional
+            Output spatial reference as an osr object, WKT/proj4 string, or
+            EPSG code (i.e. 4326 for lon/lat).  Defaults to the image
+            projection.
+        step : int, optional
+            Spacing in pixels of the exactly transformed lattice.
+        tolerance : float, optional
+            Maximum interpolation error in srs units.
+
+        Returns
+        -------
+        x, y : ndarray
+            Two dimensional arrays of shape (win_ysize, win_xsize).  For
+            geographic spatial references these are longitude and latitude.
+        '''
+
+        if window is None:
+            window = [0, 0, self.meta.shape[1], self.meta.shape[2]]
+        if len(window) != 4:
+            raise ValueError("Window must be length four and will be read" \
+                             "as: xoff, yoff, win_xsize, win_ysize")
+        xoff, yoff, win_xsize, win_ysize = [int(v) for v in window]
+        if step < 1:
+            raise ValueError("step must be one or greater.")
+
+        # Pixel center positions
+        cols = xoff + 0.5 + np.arange(win_xsize, dtype='float64')
+        rows = yoff + 0.5 + np.arange(win_ysize, dtype='float64')
+
+        if srs is None:
+            gm = self.grid.geo_transform
+            x = gm[0] + gm[1] * cols[np.newaxis,:] + gm[2] * rows[:,np.newaxis]
+            y = gm[3] + gm[4] * cols[np.newaxis,:] + gm[5] * rows[:,np.newaxis]
+            return x, y
+
+        def exact(c, r):
+            # Exact transform of the c x r grid of pixel positions
+            cc, rr = np.meshgrid(c, r)
+            px, py = self.raster_to_proj_array(cc.ravel(), rr.ravel())
+            tx, ty = self._transform_points(px, py,
+                                            self.meta.projection_string, srs)
+            return tx.reshape(cc.shape), ty.reshape(cc.shape)
+
+        tcols = np.arange(win_xsize, dtype='float64')
+        trows = np.arange(win_ysize, dtype='float64')
+        while True:
+            lc = _lattice(win_xsize, step)
+            lr = _lattice(win_ysize, step)
+            lx, ly = exact(xoff + 0.5 + lc, yoff + 0.5 + lr)
+            x = _interp_lattice(lx, lc, lr, tcols, trows)
+            y = _interp_lattice(ly, lc, lr, tcols, trows)
+
+            if tolerance is None or step == 1:
+                break
+
+            # Check the error at the lattice cell centers
+            mc = (lc[:-1] + lc[1:]) / 2.0 if len(lc) > 1 else lc
+            mr = (lr[:-1] + lr[1:]) / 2.0 if len(lr) > 1 else lr
+            mx, my = exact(xoff + 0.5 + mc, yoff + 0.5 + mr)
+            err = max(np.abs(_interp_lattice(lx, lc, lr, mc, mr) - mx).max(),
+                      np.abs(_interp_lattice(ly, lc, lr, mc, mr) - my).max())
+            logger.debug('get_coords step %s max error %s', step, err)
+            if err <= tolerance:
+                break
+            step = max(step // 2, 1)
+
+        return x, y
+
+
+    def _location_coords(self, return_location, window):
+        '''Return the get_coords output for the return_location argument of
+        get_data and the iterators.'''
+        if return_location == 'proj':
+            return self.get_coords(window=window)
+        return self.get_coords(window=window, srs=return_location)
+
+
+    def sample(self, xs, ys, bands=None, srs=None, method='nearest',
+               mask=False):
+        '''
+        Sample pixel values at many map coordinates.
+
+        All points are converted to raster space at once, grouped by the
+        native gdal block they fall in, and each block is read once (through
+        the block cache if one is set).  Values are then gathered from the
+        blocks with numpy fancy indexing.
+
+        Parameters
+        ----------
+        xs : array_like
+            x coordinates of the points.
+        ys : array_like
+            y coordinates of the points.
+        bands : list, optional
+            Bands to sample (see get_data).  Defaults to all bands.
+        srs : osr.SpatialReference, str, or int, optional
+            Spatial reference of the points as an osr object, WKT/proj4
+            string, or EPSG code.  Defaults to the image projection.
+        method : {'nearest', 'bilinear'}, optional
+            Nearest pixel values, or bilinear interpolation between the four
+            nearest pixel centers (returned as float64).
+        mask : bool, optional
+            Return a masked array with points outside the image masked.
+
+        Returns
+        -------
+        ndarray
+            Array of shape (nbands, npoints).  Points outside the image are
+            zero.
+        '''
+
+        if method not in ('nearest', 'bilinear'):
+            raise ValueError("method must be either 'nearest' or 'bilinear'.")
+
+        xs = np.asarray(xs, dtype='float64').ravel()
+        ys = np.asarray(ys, dtype='float64').ravel()
+        if xs.shape != ys.shape:
+            raise ValueError("xs and ys must be the same length.")
+
+        if srs is not None:
+            xs, ys = self._transform_points(xs, ys, srs)
+
+        col, row = self.proj_to_raster(xs, ys)
+        bands = self._get_band_numbers(bands)
+        xlim = self.meta.shape[1]
+        ylim = self.meta.shape[2]
+
+        inside = (col >= 0) & (col < xlim) & (row >= 0) & (row < ylim)
+        col = col[inside]
+        row = row[inside]
+
+        if method == 'nearest':
+            pcols = np.floor(col).astype('int64')[np.newaxis]
+            prows = np.floor(row).astype('int64')[np.newaxis]
+        else:
+            # Interpolate between pixel centers, replicating the edge pixels
+            c = col-0.5
+            r = row-0.5
+            c0 = np.floor(c)
+            r0 = np.floor(r)
+            fx = c-c0
+            fy = r-r0
+            c0 = c0.astype('int64')
+            r0 = r0.astype('int64')
+            pcols = np.clip(np.vstack([c0, c0+1, c0, c0+1]), 0, xlim-1)
+            prows = np.clip(np.vstack([r0, r0, r0+1, r0+1]), 0, ylim-1)
+            wts = np.vstack([(1-fx)*(1-fy), fx*(1-fy), (1-fx)*fy, fx*fy])
+
+        vals = self._gather_pixels(bands, pcols.ravel(), prows.ravel())
+        vals = vals.reshape(len(bands), pcols.shape[0], -1)
+
+        if method == 'nearest':
+            vals = vals[:,0,:]
+        else:
+            vals = (vals*wts[np.newaxis]).sum(axis=1)
+
+        out = np.zeros((len(bands), len(xs)), dtype=vals.dtype)
+        out[:, inside] = vals
+
+        if mask:
+            out = np.ma.array(out, mask=np.tile(~inside, (len(bands), 1)))
+
+        return out
+
+
+    def _gather_pixels(self, bands, cols, rows):
+        '''Return the values at the (cols, rows) pixel locations, which must
+        be inside the image, as an array of shape (nbands, npoints).  The
+        points are grouped by block so that each block is read only once.'''
+
+        bxsize, bysize = self._fobj.GetRasterBand(bands[0]).GetBlockSize()
+        xlim = self.meta.shape[1]
+        ylim = self.meta.shape[2]
+        nbx = int(math.ceil(xlim / bxsize))
+
+        dt = const.DICT_GDAL_TO_NP[self._fobj.GetRasterBand(bands[0]).DataType]
+        out = np.empty((len(bands), len(cols)), dtype=dt)
+        if len(cols) == 0:
+            return out
+
+        # Sort the points by block and find where each block's points start
+        bid = (rows // bysize)*nbx + (cols // bxsize)
+        order = np.argsort(bid, kind='mergesort')
+        sbid = bid[order]
+        starts = np.flatnonzero(np.r_[True, sbid[1:] != sbid[:-1]])
+        ends = np.r_[starts[1:], len(sbid)]
+
+        for s, e in zip(starts, ends):
+            idx = order[s:e]
+            bxoff = int(sbid[s] % nbx)*bxsize
+            byoff = int(sbid[s] // nbx)*bysize
+            blk = self._read_bands(self._fobj, bands, bxoff, byoff,
+                                   min(bxsize, xlim-bxoff),
+                                   min(bysize, ylim-byoff),
+                                   dset_key=self.files.dfile)
+            out[:, idx] = blk[:, rows[idx]-byoff, cols[idx]-bxoff]
+
+        logger.debug('sampled %s pixels from %s blocks', len(cols),
+                     len(starts))
+
+        return out
+
+
+    def _transform_points(self, xs, ys, src_srs, dst_srs=None):
+        '''Transform arrays of points from src_srs to dst_srs (the image
+        projection by default) with a single TransformPoints call.'''
+
+        src = _to_srs(src_srs)
+        if dst_srs is None:
+            dst = _to_srs(self.meta.projection_string)
+        else:
+            dst = _to_srs(dst_srs)
+
+        coord_trans = osr.CoordinateTransformation(src, dst)
+        pts = coord_trans.TransformPoints(np.column_stack([xs, ys]).tolist())
+        pts = np.asarray(pts, dtype='float64').reshape(-1, 3)
+
+        return pts[:,0], pts[:,1]
 
 
     def get_data(self, component=None,
@@ -876,7 +2652,8 @@ class GeoImage(object):
                        mask=False,
                        mask_all_touched=False,
                        virtual=False,
-                       return_location=False):
+                       return_location=False,
+                       zero_copy=False):
         """Read data from geo-image file.  If component is specified and
         this is a .vrt or .til file, then it will pull only the data from
         the file specified in self.dfile_tiles.  Component is specified base 1.
@@ -887,7 +2664,16 @@ class GeoImage(object):
         of the specified component.
 
         If return location=True, the function also returns the upper-left pixel 
-        coordinates.
+        coordinates.  If return_location is 'proj' or a spatial reference
+        (anything accepted by the srs argument of get_coords), the returned
+        location dictionary also holds the per-pixel coordinates of the
+        returned array under 'coords' as computed by get_coords.
+
+        If zero_copy=True and the image can be memory mapped (see
+        as_memmap), the data is returned as a read-only view of the memory
+        map instead of being read through gdal.  The view is only free of
+        copies if the window is inside the image and the bands are regularly
+        spaced.  Images that can't be mapped are read as usual.
 
         (TO DO: DETAILED DOCUMENTATION OF INPUT AND OUTPUT! WHAT DO THE ARGUMENTS MEAN?)
         """
@@ -904,8 +2690,10 @@ class GeoImage(object):
             logger.debug('returning data from:  '+
                   str(self.files.dfile_tiles[component-1]))
             obj = y._fobj
+            dset_key = self.files.dfile_tiles[component-1]
         else:
             obj = self._fobj
+            dset_key = self.files.dfile
 
         # If bands not requested, set to pull all bands
         if not bands:
@@ -940,17 +2728,7 @@ class GeoImage(object):
 
         # Add buffer
         if buffer:
-            if isinstance(buffer,int):
-                buffer = [buffer]
-
-            if len(buffer) == 1:
-                xbuff = buffer[0]
-                ybuff = buffer[0]
-            elif len(buffer) == 2:
-                xbuff = buffer[0]
-                ybuff = buffer[1]
-            else:
-                raise ValueError("Buffer must be either length one or two.")
+            xbuff, ybuff = _parse_buffer(buffer)
 
             # Apply the buffer to the readasarray parameters
             xoff = xoff-xbuff
@@ -958,6 +2736,69 @@ class GeoImage(object):
             win_xsize = win_xsize+2*xbuff
             win_ysize = win_ysize+2*ybuff
 
+        # Handle out-of-bounds cases
+        [xoff, yoff, win_xsize, win_ysize], pad_tuples = \
+                    self._clip_window([xoff, yoff, win_xsize, win_ysize])
+
+        # # This code will just buffer window requests outside of the
+        # # image dimension, so I need to explicitly catch bad requests
+        # if np.abs(np_xoff_buff) > xbuff or \
+        #    np.abs(np_xlim_buff) > xbuff or \
+        #    np.abs(np_yoff_buff) > ybuff or \
+        #    np.abs(np_ylim_buff) > ybuff:
+        #    raise ValueError("Requested window is outside the image.")
+
+        # Read data
+        if virtual is True:
+            raise NotImplementedError('keyword argument not implemented yet.')
+        elif virtual is False:
+            data = None
+            if zero_copy and component is None:
+                data = self._memmap_window(bands, xoff, yoff,
+                                           win_xsize, win_ysize)
+            if data is None:
+                data = self._read_bands(obj, bands, xoff, yoff,
+                                        win_xsize, win_ysize,
+                                        dset_key=dset_key)
+        else:
+            raise ValueError("virtual keyword argument should be boolean.")
+
+        # Convert to a masked array if requested and pad to the window
+        data = self._mask_and_pad(data, g if geom else None, mask,
+                                  mask_all_touched,
+                                  [xoff, yoff, win_xsize, win_ysize],
+                                  pad_tuples)
+
+        # if "y" is open, close it
+        try:
+            y = None
+        except NameError:
+            pass
+
+        if return_location is not False and return_location is not None:
+            location_dict = {}
+            location_dict['upper_left_pixel'] = [xoff, yoff]
+            if return_location is not True:
+                # Coordinates for the full returned array, including padding
+                if component is not None:
+                    geo_src = GeoImage(self.files.dfile_tiles[component-1])
+                else:
+                    geo_src = self
+                location_dict['coords'] = geo_src._location_coords(
+                                            return_location,
+                                            [xoff-pad_tuples[2][0],
+                                             yoff-pad_tuples[1][0],
+                                             data.shape[2], data.shape[1]])
+            return data, location_dict
+        else:
+            return data
+
+
+    def _clip_window(self, window):
+        """Clip a window to the image.  Returns the clipped window and the
+        ((0,0), (top,bottom), (left,right)) padding that restores it."""
+        [xoff, yoff, win_xsize, win_ysize] = window
+
         # Handle out-of-bounds cases
         # (i.e. xoff = 0; buffer = 3; xoff - buffer)
         # initialize buffer vars
@@ -988,111 +2829,288 @@ class GeoImage(object):
             np_ylim_buff = ypos-ylim
             win_ysize = win_ysize-np_ylim_buff
 
-        # # This code will just buffer window requests outside of the
-        # # image dimension, so I need to explicitly catch bad requests
-        # if np.abs(np_xoff_buff) > xbuff or \
-        #    np.abs(np_xlim_buff) > xbuff or \
-        #    np.abs(np_yoff_buff) > ybuff or \
-        #    np.abs(np_ylim_buff) > ybuff:
-        #    raise ValueError("Requested window is outside the image.")
+        pad_tuples = ((0,0),
+                      (np.abs(np_yoff_buff), np.abs(np_ylim_buff)),
+                      (np.abs(np_xoff_buff), np.abs(np_xlim_buff)))
 
-        # Read data
-        if virtual is True:
-            raise NotImplementedError('keyword argument not implemented yet.')
-        elif virtual is False:
-            # Read data one band at a time with ReadAsArray
-            for i,b in enumerate(bands):
-                bobj = obj.GetRasterBand(b)
-                # The try/except below is used to initialize the data variable...
-                # The first loop trigger the NameError, so the except is used to
-                # then initialize "data".
-                try:
-                    data[i,:,:] = bobj.ReadAsArray(xoff=xoff,
-                                                   yoff=yoff,
-                                                   win_xsize=win_xsize,
-                                                   win_ysize=win_ysize)
-                except NameError:
-                    zt = len(bands)
-                    dt = const.DICT_GDAL_TO_NP[bobj.DataType]
-                    data = np.empty([zt, win_ysize, win_xsize], dtype=dt)
-                    data[i,:,:] = bobj.ReadAsArray(xoff=xoff,
-                                                   yoff=yoff,
-                                                   win_xsize=win_xsize,
-                                                   win_ysize=win_ysize)
-        else:
-            raise ValueError("virtual keyword argument should be boolean.")
+        return [xoff, yoff, win_xsize, win_ysize], pad_tuples
 
-        # Convert numpy array to masked numpy array if requested.
-        if mask and geom:
-            # Set image parameters
-            xres = self.meta.resolution[0]
-            yres = self.meta.resolution[1]
-            (xmin, xmax, ymin, ymax) = g.GetEnvelope()
-            ul_env = [xmin, ymax]
-            ul_raster = self.proj_to_raster(*ul_env)
-            ul_corner = [math.floor(ul_raster[0]),math.floor(ul_raster[1])]
-            xmin_corner,ymax_corner = self.raster_to_proj(*ul_corner)
-
-            # Create temporary raster to burn
-            drv = gdal.GetDriverByName('MEM')
-            tds = drv.Create('', win_xsize, win_ysize, 1, gdal.GDT_Byte)
-            tds.SetGeoTransform((xmin_corner, xres, 0, ymax_corner, 0, -yres))
-            tds.SetProjection(self.meta.projection_string)
-
-            # Create ogr layr from geom
-            odrv = ogr.GetDriverByName('Memory')
-            ds = odrv.CreateDataSource('')
-
-            ltype = g.GetGeometryType()
-            lsrs = osr.SpatialReference(self.meta.projection_string)
-            lyr = ds.CreateLayer('burnshp', lsrs, ltype)
-
-            feat = ogr.Feature(lyr.GetLayerDefn())
-            feat.SetGeometryDirectly(g)
-            lyr.CreateFeature(feat)
-
-            # Run the burn
-            if mask_all_touched:
-                err = gdal.RasterizeLayer(tds, [1], lyr, burn_values=[1],
-                                                options=['ALL_TOUCHED=TRUE'])
-            else:
-                err = gdal.RasterizeLayer(tds, [1], lyr, burn_values=[1])
 
-            # build the masked array
-            m = tds.ReadAsArray().astype('bool')
-            data = np.ma.array(data, mask=np.tile(~m, (data.shape[0], 1, 1)))
+    def _geom_mask(self, g, window, all_touched=False):
+        """Rasterize the image space ogr geometry g over the image window
+        and return a 2D boolean array that is True inside the geometry."""
+        [xoff, yoff, win_xsize, win_ysize] = window
+
+        # Grid of the pixels actually read (after buffering/clipping)
+        mgrid = self.grid.subgrid([xoff, yoff, win_xsize, win_ysize])
 
-        if mask and not geom:
+        # The MEM raster and Memory layer are pooled per thread
+        try:
+            burner = _burners.burner
+        except AttributeError:
+            burner = _burners.burner = _MaskBurner()
+
+        return burner.burn(g, mgrid.geo_transform, win_xsize, win_ysize,
+                           all_touched)
+
+
+    def _mask_and_pad(self, data, g, mask, all_touched, window, pad_tuples):
+        """Apply the get_data mask options to data read from the clipped
+        window and pad it back out to the requested window.  g is the image
+        space ogr geometry of the request or None."""
+
+        # Convert numpy array to masked numpy array if requested.
+        if mask and g is not None:
+            # build the masked array, the 2D mask is broadcast into the
+            # band mask in place (a read-only broadcast view would break
+            # item assignment on the returned masked array)
+            m = self._geom_mask(g, window, all_touched)
+            bmask = np.empty(data.shape, dtype='bool')
+            np.logical_not(m, out=bmask[0])
+            bmask[1:] = bmask[0]
+            data = np.ma.array(data, mask=bmask)
+
+        if mask and g is None:
             # This code will mask values outside the image as well as zeros
             # inside the image.
             data = np.ma.array(data,mask=~data.astype('bool'))
             # The line below will only mask values outside the image.
             # data = np.ma.array(data,mask=np.zeros(data.shape).astype('bool'))
 
-        # Pad the output array if needed
-        pad_tuples = ((0,0),
-                      (np.abs(np_yoff_buff), np.abs(np_ylim_buff)),
-                      (np.abs(np_xoff_buff), np.abs(np_xlim_buff)))
-        if not mask:
+        # Pad the output array if needed (np.pad always copies, so skip it
+        # when there is nothing to pad)
+        if not any(pad_tuples[1] + pad_tuples[2]):
+            pass
+        elif not mask:
             data = np.pad(data, pad_tuples, 'constant',constant_values=0)
         elif mask:
             mpad = np.pad(data.mask, pad_tuples, 'constant', constant_values=1)
             data = np.pad(data, pad_tuples, 'constant', constant_values=0)
             data = np.ma.array(data,mask=mpad)
 
-        # if "y" is open, close it
-        try:
-            y = None
-        except NameError:
-            pass
+        return data
 
-        if return_location:
-            location_dict = {}
-            location_dict['upper_left_pixel'] = [xoff, yoff]
-            return data, location_dict
+
+    def get_data_parts(self, geom, **kwargs):
+        """Read a geometry part by part.  For a multipart geometry (or a
+        geometry collection) each part is read with its own get_data call
+        so that I/O and memory scale with the area of the parts instead of
+        the bounding box of the whole geometry.  Single part geometries are
+        read as one part.
+
+        Parameters
+        ----------
+        geom : ogr.Geometry or str
+            Geometry in image space, anything accepted by get_data.
+        kwargs
+            Any get_data arguments other than window and geom.
+
+        Returns
+        -------
+        list
+            The get_data result for each part, None for parts that don't
+            overlap the image.
+
+        Raises
+        ------
+        OverlapError
+            If none of the parts overlap the image.
+        """
+
+        if 'window' in kwargs.keys():
+            raise ValueError("The window argument is not valid for this " \
+                             "method. The geometry passed in defines " \
+                             "the retrieval geometry.")
+
+        out = []
+        for part in _geom_parts(self._instantiate_geom(geom)):
+            try:
+                out.append(self.get_data(geom=part, **kwargs))
+            except OverlapError:
+                out.append(None)
+
+        if all(x is None for x in out):
+            raise OverlapError("None of the geometry parts overlap the "
+                               "image.")
+
+        return out
+
+
+    def _get_band_numbers(self, bands=None):
+        '''Return the list of base 1 band numbers for a bands request.  All
+        bands are returned if bands is not passed.  Subclasses override this
+        to translate band aliases.'''
+        if not bands:
+            return range(1, self._fobj.RasterCount+1)
+        return list(bands)
+
+
+    def _read_window_into(self, out, bands, xoff, yoff, win_xsize, win_ysize):
+        '''Read a window into the preallocated array out.  Windows inside
+        the image are read in place, others are read (and padded) with
+        get_data and then copied.'''
+
+        if (xoff >= 0 and yoff >= 0 and
+            xoff+win_xsize <= self.meta.shape[1] and
+            yoff+win_ysize <= self.meta.shape[2]):
+            self._read_bands(self._fobj, bands, xoff, yoff,
+                             win_xsize, win_ysize,
+                             dset_key=self.files.dfile, out=out)
+        else:
+            out[...] = self.get_data(bands=bands,
+                                     window=[xoff, yoff, win_xsize, win_ysize])
+
+        return out
+
+
+    def _read_bands(self, obj, bands, xoff, yoff, win_xsize, win_ysize,
+                    dset_key=None, out=None):
+        '''Read a window from each band of the gdal object into a three
+        dimensional array.  The window must be inside the image.  If a block
+        cache is set on the object, the window is assembled from cached
+        decoded blocks.  If out is passed, the data is read into it in place
+        and it is returned.'''
+
+        if out is None:
+            zt = len(bands)
+            dt = const.DICT_GDAL_TO_NP[obj.GetRasterBand(bands[0]).DataType]
+            data = np.empty([zt, win_ysize, win_xsize], dtype=dt)
         else:
+            data = out
+
+        # Nothing to read for an empty window
+        if win_xsize <= 0 or win_ysize <= 0:
             return data
 
+        for i,b in enumerate(bands):
+            bobj = obj.GetRasterBand(b)
+            if self.block_cache is None:
+                # Read data one band at a time with ReadAsArray
+                bobj.ReadAsArray(xoff=xoff,
+                                 yoff=yoff,
+                                 win_xsize=win_xsize,
+                                 win_ysize=win_ysize,
+                                 buf_obj=data[i,:,:])
+            else:
+                self._read_band_from_blocks(obj, bobj, (dset_key, b),
+                                            xoff, yoff, win_xsize, win_ysize,
+                                            data[i,:,:])
+
+        return data
+
+
+    def _read_band_from_blocks(self, obj, bobj, band_key, xoff, yoff,
+                               win_xsize, win_ysize, out):
+        '''Fill out with the requested window by copying from the native
+        blocks of the band.  Blocks are pulled from self.block_cache when
+        present and are read and added to the cache otherwise.'''
+
+        cache = self.block_cache
+        bxsize, bysize = bobj.GetBlockSize()
+        xlim = obj.RasterXSize
+        ylim = obj.RasterYSize
+        xend = xoff+win_xsize
+        yend = yoff+win_ysize
+
+        for by in xrange(yoff//bysize, (yend-1)//bysize+1):
+            byoff = by*bysize
+            for bx in xrange(xoff//bxsize, (xend-1)//bxsize+1):
+                bxoff = bx*bxsize
+                key = band_key+(bx, by)
+                blk = cache.get(key)
+                if blk is None:
+                    blk = bobj.ReadAsArray(xoff=bxoff,
+                                           yoff=byoff,
+                                           win_xsize=min(bxsize,xlim-bxoff),
+                                           win_ysize=min(bysize,ylim-byoff))
+                    cache.put(key, blk)
+
+                # Copy the overlap of the block and the window
+                x0 = max(xoff, bxoff)
+                x1 = min(xend, bxoff+blk.shape[1])
+                y0 = max(yoff, byoff)
+                y1 = min(yend, byoff+blk.shape[0])
+                out[y0-yoff:y1-yoff, x0-xoff:x1-xoff] = \
+                    blk[y0-byoff:y1-byoff, x0-bxoff:x1-bxoff]
+
+
+    def get_data_many(self, windows, bands=None, buffer=None, mask=False,
+                      merge_gap=16, max_overhead=1.0):
+        '''
+        Read many windows with as few reads as possible.
+
+        The windows are sorted spatially and windows that are near each other
+        are merged into larger reads.  Each requested chip is then sliced
+        out of the merged read.  A window is added to a merged read if it is
+        within merge_gap pixels of it and the merged read stays no larger
+        than (1 + max_overhead) times the pixels of the windows it covers.
+
+        Parameters
+        ----------
+        windows : array-like
+            Sequence of [xoff, yoff, win_xsize, win_ysize] windows (see the
+            window argument of get_data).
+        bands : list, optional
+            Bands to read (see get_data).
+        buffer : int or list, optional
+            Buffer to add around each window (see get_data).
+        mask : bool, optional
+            Return masked arrays with zeros masked (see get_data).
+        merge_gap : int, optional
+            Maximum distance in pixels between a window and a merged read
+            for the two to be combined.  Zero only merges touching windows.
+        max_overhead : float, optional
+            Maximum fraction of extra pixels a merged read can contain.
+
+        Returns
+        -------
+        list
+            Three dimensional arrays for each window in the input order.
+        '''
+
+        windows = np.asarray(windows, dtype='int64').reshape(-1, 4)
+        if len(windows) == 0:
+            return []
+        if (windows[:,2:] <= 0).any():
+            raise ValueError("Window sizes must be greater than zero.")
+
+        # Apply the buffer to each window
+        xbuff, ybuff = _parse_buffer(buffer)
+        wins = windows.copy()
+        wins[:,0] -= xbuff
+        wins[:,1] -= ybuff
+        wins[:,2] += 2*xbuff
+        wins[:,3] += 2*ybuff
+
+        x0 = wins[:,0]
+        y0 = wins[:,1]
+        x1 = x0+wins[:,2]
+        y1 = y0+wins[:,3]
+        area = wins[:,2]*wins[:,3]
+
+        # Greedily merge windows in row major order into read groups of
+        # [xmin, ymin, xmax, ymax, pixels, [members]]
+        groups = _merge_windows(x0, y0, x1, y1, area, merge_gap,
+                                max_overhead)
+
+        logger.debug('get_data_many merged %s windows into %s reads',
+                     len(wins), len(groups))
+
+        bands = self._get_band_numbers(bands)
+        out = [None]*len(wins)
+        for gx0, gy0, gx1, gy1, _, members in groups:
+            data = self.get_data(bands=bands,
+                                 window=[int(gx0), int(gy0),
+                                         int(gx1-gx0), int(gy1-gy0)])
+            for i in members:
+                chip = data[:, y0[i]-gy0:y1[i]-gy0,
+                               x0[i]-gx0:x1[i]-gx0].copy()
+                if mask:
+                    chip = np.ma.array(chip, mask=~chip.astype('bool'))
+                out[i] = chip
+
+        return out
+
 
     def _instantiate_geom(self,g):
         """Attempt to convert the geometry pass in to an ogr Geometry
@@ -1225,6 +3243,12 @@ class GeoImage(object):
             raise ValueError("Data types must match exactly to do a "
                              "data replace.")
 
+        # Cached blocks are stale once the data is replaced
+        if self.block_cache is not None:
+            self.block_cache.clear(self.files.dfile)
+        self._memmap = None
+        self._validity_maps = {}
+
         # Reload gdal object in update mode
         reload_fname = self.meta_fname
         self._fobj = None
@@ -1247,6 +3271,48 @@ class GeoImage(object):
         return get_img_stretch_vals(self._fobj,**kwargs)
 
 
+    def build_overviews(self, levels=None, resample='average', workers=1):
+        """Build reduced resolution overviews (pyramids) for the image files.
+
+        For virtual data sets (.TIL and .VRT), the overviews are built for each
+        component file in self.files.dfile_tiles so that gdal can use them
+        through the virtual data set.  The components are processed in
+        parallel if workers is greater than one.  For other formats, the
+        overviews are built for self.files.dfile.  Overviews are written as
+        external .ovr files since the image is opened read only.
+
+        Parameters
+        ----------
+        levels : list of int, optional
+            Overview decimation factors (i.e. [2, 4, 8]).  If not passed, powers
+            of two are used until the smallest image dimension drops below
+            const.GDAL_OVERVIEW_MIN_SIZE.
+        resample : str, optional
+            gdal resampling method - one of const.GDAL_OVERVIEW_RESAMPLING.
+        workers : int, optional
+            Number of component files to process at the same time.
+
+        Returns
+        -------
+        list
+            The overview levels that were built.
+        """
+
+        if levels is None:
+            levels = default_overview_levels(self.meta.shape[1],
+                                             self.meta.shape[2])
+
+        build_overviews(self.files.dfile_tiles, levels=levels,
+                        resample=resample, workers=workers)
+
+        # Reopen the gdal object so that the new overviews are picked up.
+        self._fobj = None
+        self._fobj = self._get_gdal_obj(self.files.dfile,
+                                        self.files.dfile_tiles)
+
+        return levels
+
+
 def read_geo_file_info(fname_or_fobj):
     """ Get image metadata."""
     # class       : RasterBrick
@@ -1405,6 +3471,686 @@ def create_geo_image(new_file_name, data_np_array, gdal_driver_name,
     return new_file_name
 
 
+def _vrt_xml(fobj):
+    """Return the XML of an in memory VRT gdal object (i.e. the mosaic
+    created for .TIL files) or None for datasets that can be reopened from
+    their file name."""
+    if fobj.GetDriver().ShortName != 'VRT':
+        return None
+    if os.path.isfile(fobj.GetDescription()):
+        return None
+    xml = fobj.GetMetadata('xml:VRT')
+    return xml[0] if xml else None
+
+
+def _memmap_layout(fobj):
+    """Return (file name, offset, dtype, shape, axes) describing the pixels
+    of an uncompressed ENVI or striped GTiff gdal object as one contiguous
+    array on disk, or None if they aren't stored that way.  The array of
+    shape is transposed by axes to (bands, y, x)."""
+
+    drv = fobj.GetDriver().ShortName
+    if drv not in ('ENVI', 'GTiff'):
+        return None
+
+    nbands = fobj.RasterCount
+    xsize = fobj.RasterXSize
+    ysize = fobj.RasterYSize
+    band = fobj.GetRasterBand(1)
+    if band.GetMetadataItem('NBITS', 'IMAGE_STRUCTURE'):
+        return None
+    gdal_dtypes = set(fobj.GetRasterBand(b).DataType
+                      for b in xrange(1, nbands+1))
+    if len(gdal_dtypes) != 1 or band.DataType not in const.DICT_GDAL_TO_NP:
+        return None
+    dtype = np.dtype(const.DICT_GDAL_TO_NP[band.DataType])
+
+    interleave = fobj.GetMetadataItem('INTERLEAVE', 'IMAGE_STRUCTURE')
+    if interleave is None or nbands == 1:
+        interleave = 'BAND'
+
+    files = fobj.GetFileList() or []
+    if not files or not os.path.isfile(files[0]):
+        return None
+    fname = files[0]
+
+    if drv == 'ENVI':
+        hdr = [f for f in files if f.lower().endswith('.hdr')]
+        if not hdr:
+            return None
+        offset, big_endian = _read_envi_header_layout(hdr[0])
+    else:
+        if fobj.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE'):
+            return None
+        with open(fname, 'rb') as f:
+            big_endian = f.read(2) == b'MM'
+        offset = _tiff_strip_offset(fobj, interleave, dtype.itemsize)
+        if offset is None:
+            return None
+
+    dtype = dtype.newbyteorder('>' if big_endian else '<')
+    if interleave == 'PIXEL':
+        shape, axes = (ysize, xsize, nbands), (2, 0, 1)
+    elif interleave == 'LINE':
+        shape, axes = (ysize, nbands, xsize), (1, 0, 2)
+    else:
+        shape, axes = (nbands, ysize, xsize), (0, 1, 2)
+
+    if os.path.getsize(fname) < offset + dtype.itemsize*nbands*xsize*ysize:
+        return None
+
+    return fname, offset, dtype, shape, axes
+
+
+def _read_envi_header_layout(hdr):
+    """Return the header offset and whether the data is big endian from an
+    ENVI .hdr file."""
+    offset = 0
+    big_endian = False
+    with open(hdr) as f:
+        for line in f:
+            key, sep, value = line.partition('=')
+            key = key.strip().lower()
+            if key == 'header offset':
+                offset = int(value)
+            elif key == 'byte order':
+                big_endian = int(value) == 1
+    return offset, big_endian
+
+
+def _tiff_strip_offset(fobj, interleave, itemsize):
+    """Return the file offset of the first strip of an uncompressed striped
+    GTiff if all strips (of all bands) are stored back to back in image
+    order, else None."""
+    nbands = fobj.RasterCount
+    xsize = fobj.RasterXSize
+    ysize = fobj.RasterYSize
+    bx, by = fobj.GetRasterBand(1).GetBlockSize()
+    if bx != xsize:
+        return None
+
+    if interleave == 'PIXEL':
+        band_list = [1]
+        row_bytes = xsize*nbands*itemsize
+    else:
+        band_list = range(1, nbands+1)
+        row_bytes = xsize*itemsize
+
+    nstrips = (ysize + by - 1) // by
+    first = None
+    expected = None
+    for b in band_list:
+        rb = fobj.GetRasterBand(b)
+        for k in xrange(nstrips):
+            off = rb.GetMetadataItem('BLOCK_OFFSET_0_%s' % k, 'TIFF')
+            if off is None:
+                return None
+            off = int(off)
+            if expected is None:
+                first = expected = off
+            elif off != expected:
+                return None
+            expected = off + min(by, ysize-k*by)*row_bytes
+
+    return first
+
+
+def _index_axis(k, n):
+    """Return (start, count, step, drop) for an integer or slice index of
+    an image axis of length n as used by GeoImage.__getitem__."""
+    if isinstance(k, (int, long, np.integer)):
+        if not -n <= k < n:
+            raise IndexError("Index %s is out of range for an axis of "
+                             "length %s." % (k, n))
+        return int(k) % n, 1, 1, True
+    elif isinstance(k, slice):
+        start, stop, step = k.indices(n)
+        return start, len(xrange(start, stop, step)), step, False
+    else:
+        raise IndexError("Image rows and columns can only be indexed with "
+                         "integers or slices.")
+
+
+def _band_slice(bidx):
+    """Return a slice equal to the list of zero based band indices bidx if
+    they are regularly spaced, else None."""
+    if len(bidx) == 1:
+        return slice(bidx[0], bidx[0]+1)
+    step = bidx[1] - bidx[0]
+    if step == 0 or any(bidx[i+1]-bidx[i] != step
+                        for i in xrange(len(bidx)-1)):
+        return None
+    stop = bidx[-1] + step
+    if stop < 0:
+        stop = None
+    return slice(bidx[0], stop, step)
+
+
+def _lattice(n, step):
+    """Return the lattice positions every step from 0 through n-1."""
+    lat = np.arange(0, n, step, dtype='float64')
+    if n > 0 and lat[-1] != n-1:
+        lat = np.append(lat, n-1)
+    return lat
+
+
+def _interp_lattice(vals, lc, lr, tc, tr):
+    """Bilinearly interpolate vals, known at the lattice columns lc and rows
+    lr, to the column positions tc and row positions tr.  Returns an array of
+    shape (len(tr), len(tc))."""
+
+    def weights(lat, t):
+        if len(lat) == 1:
+            i0 = np.zeros(len(t), dtype='int64')
+            return i0, i0, np.zeros(len(t))
+        i0 = np.clip(np.searchsorted(lat, t, side='right')-1, 0, len(lat)-2)
+        w = (t - lat[i0]) / (lat[i0+1] - lat[i0])
+        return i0, i0+1, w
+
+    c0, c1, wc = weights(lc, tc)
+    r0, r1, wr = weights(lr, tr)
+
+    # Interpolate along the columns then along the rows
+    a = vals[:,c0]*(1-wc) + vals[:,c1]*wc
+    return a[r0,:]*(1-wr)[:,np.newaxis] + a[r1,:]*wr[:,np.newaxis]
+
+
+def _to_srs(srs):
+    """Return an osr.SpatialReference from an osr object, a WKT or proj4
+    string, or an EPSG code.  Traditional x/y (lon/lat) axis order is used.
+    """
+    if isinstance(srs, osr.SpatialReference):
+        return srs
+
+    sr = osr.SpatialReference()
+    if isinstance(srs, (int, long)):
+        sr.ImportFromEPSG(srs)
+    elif srs.strip().startswith('+'):
+        sr.ImportFromProj4(srs)
+    else:
+        sr.ImportFromWkt(srs)
+
+    # gdal >= 3 otherwise follows the authority axis order (i.e. lat/lon)
+    if hasattr(sr, 'SetAxisMappingStrategy'):
+        sr.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    return sr
+
+
+def _merge_windows(x0, y0, x1, y1, area, merge_gap, max_overhead):
+    """Greedily merge windows (in row major order) into read groups of
+    [xmin, ymin, xmax, ymax, pixels, [members]] for get_data_many.  Each
+    window joins the first (oldest) group that is within merge_gap of it and
+    stays within max_overhead, or starts a new group.
+
+    Windows are swept in order of ymin, so a group that ends more than
+    merge_gap above the current window can't take any later window and is
+    dropped.  The open groups are indexed by columns of cell pixels so that
+    each window only checks the groups near it."""
+
+    gap = int(merge_gap)
+    cell = max(int(np.median(x1-x0))+gap, 1)
+    cells = collections.defaultdict(list)
+    groups = []
+    spans = []
+
+    for i in np.lexsort((x0, y0)):
+        wx0, wy0, wx1, wy1 = int(x0[i]), int(y0[i]), int(x1[i]), int(y1[i])
+
+        # Open groups in the columns the window touches, oldest first
+        found = set()
+        for c in xrange(wx0//cell, wx1//cell+1):
+            ids = [k for k in cells.get(c, ()) if groups[k][3]+gap >= wy0]
+            if ids:
+                cells[c] = ids
+                found.update(ids)
+            else:
+                cells.pop(c, None)
+
+        target = None
+        for k in sorted(found):
+            g = groups[k]
+            if (wx0 > g[2]+gap or wx1 < g[0]-gap or
+                wy0 > g[3]+gap or wy1 < g[1]-gap):
+                continue
+            ux0 = min(g[0], wx0)
+            uy0 = min(g[1], wy0)
+            ux1 = max(g[2], wx1)
+            uy1 = max(g[3], wy1)
+            if (ux1-ux0)*(uy1-uy0) > (1+max_overhead)*(g[4]+area[i]):
+                continue
+            g[:5] = [ux0, uy0, ux1, uy1, g[4]+area[i]]
+            g[5].append(i)
+            target = k
+            break
+
+        if target is None:
+            target = len(groups)
+            groups.append([wx0, wy0, wx1, wy1, area[i], [i]])
+            spans.append(None)
+
+        # Register the group in every column its reach now covers
+        g = groups[target]
+        c0, c1 = (g[0]-gap)//cell, (g[2]+gap)//cell
+        old = spans[target]
+        for c in xrange(c0, c1+1):
+            if old is None or not old[0] <= c <= old[1]:
+                cells[c].append(target)
+        spans[target] = (c0, c1) if old is None else (min(c0, old[0]),
+                                                      max(c1, old[1]))
+
+    return groups
+
+
+def _fill_batch(img, batch, windows, start, bands, xbuff, ybuff):
+    """Read the windows of the batch that begins at start into batch and
+    return the number of chips read."""
+    w = windows[start:start+batch.shape[0]]
+    ysize, xsize = batch.shape[2:]
+    for i, (xoff, yoff) in enumerate(w[:,:2]):
+        img._read_window_into(batch[i], bands, int(xoff)-xbuff,
+                              int(yoff)-ybuff, xsize, ysize)
+    return len(w)
+
+
+def _shared_batch_worker(img, ring, dt, shape, windows, bands, buffer,
+                         tasks, free, ready):
+    """Worker process target for GeoImage._iter_batches_shared.  Batch
+    starts are taken from tasks and read into a free slot of the shared
+    ring, then the (slot, start, count) descriptor is put on ready.  The
+    image reopens its gdal dataset in the new process on first use."""
+    buf = np.frombuffer(ring, dtype=dt).reshape(shape)
+    xbuff, ybuff = buffer
+    while True:
+        start = tasks.get()
+        if start is None:
+            return
+        slot = free.get()
+        try:
+            n = _fill_batch(img, buf[slot], windows, start, bands,
+                            xbuff, ybuff)
+        except Exception as e:
+            free.put(slot)
+            ready.put(e)
+            return
+        ready.put((slot, start, n))
+
+
+def _compile_vector_filter(filter, field_names):
+    """Compile an iter_vector filter (a dictionary of length one or a list of
+    them, any of which may match) against the layer field names once.
+    Returns (where, predicate, keys) where where is an OGR SQL attribute
+    filter or None if the filter can't be expressed as one, predicate(feat)
+    tests a single feature, and keys are the fields the filter reads."""
+
+    if isinstance(filter, dict):
+        if len(filter) != 1:
+            raise ValueError("Filters should be passed in as a " \
+                             "list of dictionaries that will " \
+                             "be used to filter against the " \
+                             "feature property values.")
+        filter = [filter]
+
+    pairs = [f.items()[0] for f in filter]
+    if any(k not in field_names for k, v in pairs):
+        warnings.warn("Requested filter key is not present in "
+                      "vector properties.")
+
+    # Keys missing from the layer read as None
+    matches_missing = any(v is None for k, v in pairs
+                          if k not in field_names)
+
+    # Accepted values by field index
+    accepted = collections.OrderedDict()
+    for k, v in pairs:
+        if k in field_names:
+            accepted.setdefault(field_names.index(k), []).append(v)
+    accepted = accepted.items()
+
+    def predicate(feat):
+        if matches_missing:
+            return True
+        return any(feat.GetField(i) in vals for i, vals in accepted)
+
+    clauses = [_sql_equals(k, v) for k, v in pairs if k in field_names]
+    if matches_missing or not clauses or None in clauses:
+        where = None
+    else:
+        where = ' OR '.join(clauses)
+
+    return (where, predicate,
+            sorted(set(k for k, v in pairs if k in field_names)))
+
+
+def _sql_equals(key, value):
+    """Return an OGR SQL clause testing key for equality with value, or None
+    if value has no SQL literal."""
+    name = '"%s"' % key.replace('"', '""')
+    if value is None:
+        return '%s IS NULL' % name
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, long)):
+        return '%s = %d' % (name, value)
+    if isinstance(value, float):
+        if not math.isinf(value) and not math.isnan(value):
+            return '%s = %r' % (name, value)
+        return None
+    if isinstance(value, basestring):
+        return "%s = '%s'" % (name, value.replace("'", "''"))
+    return None
+
+
+def _morton(x, y):
+    """Return the Z-order (Morton) codes of non-negative integer arrays x
+    and y (less than 2**32)."""
+    def spread(v):
+        v = np.asarray(v).astype('uint64') & np.uint64(0xFFFFFFFF)
+        for shift, m in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                         (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                         (1, 0x5555555555555555)):
+            v = (v | (v << np.uint64(shift))) & np.uint64(m)
+        return v
+    return spread(x) | (spread(y) << np.uint64(1))
+
+
+def _group_windows(windows, size):
+    """Group an (n, 4) array of windows into superwindows no larger than
+    size in x and y.  Windows are visited in Z-order of their centers and
+    added to the current group while its union still fits.  Returns a list
+    of (member indices, union window) tuples.  A window larger than size is
+    a group by itself."""
+    if len(windows) == 0:
+        return []
+
+    windows = np.asarray(windows)
+    x0 = windows[:,0]
+    y0 = windows[:,1]
+    x1 = x0+windows[:,2]
+    y1 = y0+windows[:,3]
+    order = np.argsort(_morton((x0+x1)//2, (y0+y1)//2), kind='mergesort')
+
+    groups = []
+    members = []
+    for i in order:
+        if members:
+            nx0, ny0 = min(ux0, x0[i]), min(uy0, y0[i])
+            nx1, ny1 = max(ux1, x1[i]), max(uy1, y1[i])
+            if nx1-nx0 <= size and ny1-ny0 <= size:
+                members.append(i)
+                ux0, uy0, ux1, uy1 = nx0, ny0, nx1, ny1
+                continue
+            groups.append((members, [int(ux0), int(uy0),
+                                     int(ux1-ux0), int(uy1-uy0)]))
+        members = [i]
+        ux0, uy0, ux1, uy1 = x0[i], y0[i], x1[i], y1[i]
+    groups.append((members, [int(ux0), int(uy0),
+                             int(ux1-ux0), int(uy1-uy0)]))
+
+    return groups
+
+
+def _vector_batches(lyr, batch_size, fields):
+    """Yield OrderedDicts of 'fid', 'geometry' (WKB), and the fields columns
+    for batches of up to batch_size features of lyr.  OGR's Arrow stream
+    (GetArrowStreamAsNumPy, GDAL >= 3.6) is used when available and a
+    feature loop otherwise.  Both return the fields as masked arrays with
+    null values masked.  The Arrow path needs the python 3 only GDAL >= 3.6
+    bindings and is untested."""
+
+    stream = None
+    if hasattr(lyr, 'GetArrowStreamAsNumPy'):
+        try:
+            stream = lyr.GetArrowStreamAsNumPy(
+                        options=['MAX_FEATURES_IN_BATCH=%d' % batch_size,
+                                 'INCLUDE_FID=YES'])
+        except Exception:
+            logger.debug('Arrow stream not available, reading features '
+                         'one at a time.')
+            stream = None
+
+    if stream is not None:
+        fid_col = lyr.GetFIDColumn() or 'OGC_FID'
+        geom_col = lyr.GetGeometryColumn() or 'wkb_geometry'
+        for b in stream:
+            batch = collections.OrderedDict()
+            batch['fid'] = np.asarray(b[fid_col], dtype='int64')
+            # The stream defaults to USE_MASKED_ARRAYS=YES, keep the masks
+            # (np.asarray would drop them and expose the fill values)
+            wkb = b[geom_col]
+            null = np.ma.getmaskarray(wkb)
+            geoms = np.empty(len(batch['fid']), dtype=object)
+            geoms[:] = [None if n or x is None or len(x) == 0
+                        else bytes(bytearray(x))
+                        for x, n in zip(np.ma.getdata(wkb), null)]
+            batch['geometry'] = geoms
+            for f in fields:
+                col = b[f]
+                batch[f] = np.ma.masked_array(np.ma.getdata(col),
+                                              mask=np.ma.getmaskarray(col))
+            yield batch
+        return
+
+    defn = lyr.GetLayerDefn()
+    dtypes = []
+    for f in fields:
+        fd = defn.GetFieldDefn(defn.GetFieldIndex(f))
+        if fd.GetSubType() == ogr.OFSTBoolean:
+            dtypes.append('bool')
+        else:
+            dtypes.append(_OGR_FIELD_DTYPES.get(fd.GetType(), object))
+
+    def build(fids, wkbs, vals):
+        batch = collections.OrderedDict()
+        batch['fid'] = np.array(fids, dtype='int64')
+        geoms = np.empty(len(wkbs), dtype=object)
+        geoms[:] = wkbs
+        batch['geometry'] = geoms
+        for f, dt, v in zip(fields, dtypes, vals):
+            null = np.array([x is None for x in v], dtype=bool)
+            if dt is object:
+                col = np.empty(len(v), dtype=object)
+                col[:] = v
+            else:
+                col = np.array([0 if x is None else x for x in v], dtype=dt)
+            batch[f] = np.ma.masked_array(col, mask=null)
+        return batch
+
+    fids, wkbs, vals = [], [], [[] for f in fields]
+    for feat in lyr:
+        fids.append(feat.GetFID())
+        g = feat.GetGeometryRef()
+        wkbs.append(None if g is None or g.IsEmpty() else g.ExportToWkb())
+        for v, f in zip(vals, fields):
+            v.append(feat.GetField(f))
+        if len(fids) == batch_size:
+            yield build(fids, wkbs, vals)
+            fids, wkbs, vals = [], [], [[] for f in fields]
+    if fids:
+        yield build(fids, wkbs, vals)
+
+
+def _label_passes(members, windows, tile, pad=0):
+    """Split the features members of a zonal_stats tile into passes in which
+    no two pixel windows (grown by pad pixels and clipped to the tile
+    window) overlap, so each pixel gets at most one label per pass.  Each
+    feature goes in the first pass it fits in."""
+    xoff, yoff, xsize, ysize = tile
+    passes = []
+    for k in members:
+        x0, y0, wx, wy = windows[k]
+        x1 = min(x0+wx+pad, xoff+xsize)-xoff
+        y1 = min(y0+wy+pad, yoff+ysize)-yoff
+        x0 = max(x0-pad, xoff)-xoff
+        y0 = max(y0-pad, yoff)-yoff
+        for used, ks in passes:
+            if not used[y0:y1, x0:x1].any():
+                break
+        else:
+            used, ks = np.zeros((ysize, xsize), dtype=bool), []
+            passes.append((used, ks))
+        used[y0:y1, x0:x1] = True
+        ks.append(k)
+    return [ks for used, ks in passes]
+
+
+def _write_zonal_layer(lyr, table, bands, out_file, out_driver):
+    """Write a copy of lyr to out_file with a '<stat>_<band>' field for each
+    statistic in a GeoImage.zonal_stats table."""
+    drv = ogr.GetDriverByName(out_driver)
+    if drv is None:
+        raise ValueError("Unknown OGR driver %s." % out_driver)
+    # With ogr.UseExceptions() a failed create raises, otherwise it returns
+    # None - report both the same way.
+    try:
+        ds = drv.CreateDataSource(out_file)
+    except RuntimeError:
+        ds = None
+    if ds is None:
+        raise ValueError("Creation of %s with the %s driver failed.  The "
+                         "file may already exist or the location may not "
+                         "be writable." % (out_file, out_driver))
+    out = ds.CreateLayer(str(lyr.GetName()), lyr.GetSpatialRef(),
+                         lyr.GetGeomType())
+
+    in_defn = lyr.GetLayerDefn()
+    for i in xrange(in_defn.GetFieldCount()):
+        out.CreateField(in_defn.GetFieldDefn(i))
+
+    columns = []
+    for stat, vals in table.items():
+        if stat in ('fid', 'hist'):
+            continue
+        ftype = ogr.OFTInteger if stat == 'count' else ogr.OFTReal
+        for j, b in enumerate(bands):
+            name = '%s_%s' % (stat, b)
+            out.CreateField(ogr.FieldDefn(name, ftype))
+            columns.append((name, vals[:,j]))
+
+    defn = out.GetLayerDefn()
+    lyr.ResetReading()
+    for k, feat in enumerate(lyr):
+        f = ogr.Feature(defn)
+        f.SetFrom(feat)
+        for name, vals in columns:
+            v = vals[k]
+            if not np.isnan(v):
+                f.SetField(name, int(v) if isinstance(v, np.integer)
+                                        else float(v))
+        out.CreateFeature(f)
+
+    ds = None
+
+
+def _geom_parts(g):
+    """Return the single part geometries that make up an ogr geometry,
+    recursing into nested collections."""
+    if ogr.GT_Flatten(g.GetGeometryType()) in (ogr.wkbMultiPoint,
+                                                ogr.wkbMultiLineString,
+                                                ogr.wkbMultiPolygon,
+                                                ogr.wkbGeometryCollection):
+        parts = []
+        for i in xrange(g.GetGeometryCount()):
+            parts.extend(_geom_parts(g.GetGeometryRef(i).Clone()))
+        return parts
+    return [g]
+
+
+def _next_pow2(n):
+    """Return the smallest power of two that is at least n."""
+    return 1 << max(int(n)-1, 0).bit_length()
+
+
+def _extents_overlap(a, b):
+    """Return True if the (xmin, xmax, ymin, ymax) extents a and b touch."""
+    return a[0] <= b[1] and b[0] <= a[1] and a[2] <= b[3] and b[2] <= a[3]
+
+
+def _parse_buffer(buffer):
+    """Return the (x, y) buffer sizes from a get_data buffer argument."""
+    if not buffer:
+        return 0, 0
+
+    if isinstance(buffer,int):
+        buffer = [buffer]
+
+    if len(buffer) == 1:
+        return buffer[0], buffer[0]
+    elif len(buffer) == 2:
+        return buffer[0], buffer[1]
+    else:
+        raise ValueError("Buffer must be either length one or two.")
+
+
+def default_overview_levels(xsize, ysize,
+                            min_size=const.GDAL_OVERVIEW_MIN_SIZE):
+    """Return power of two overview levels for an image of size xsize by
+    ysize.  Levels are added until the smallest reduced resolution dimension
+    would be less than min_size.
+    """
+    levels = []
+    factor = 2
+    while int(math.ceil(min(xsize, ysize) / factor)) >= min_size:
+        levels.append(factor)
+        factor *= 2
+
+    # Always return at least one level so that small images get an overview.
+    if not levels:
+        levels = [2]
+
+    return levels
+
+
+def build_overviews(file_list, levels, resample='average', workers=1):
+    """Build overviews for each of the files in file_list.  The files are
+    processed in parallel on a thread pool if workers is greater than one.
+    Each worker opens its own gdal object.
+
+    file_list:  List of image files (i.e. GeoImage.files.dfile_tiles)
+    levels:     List of overview decimation factors (i.e. [2, 4, 8])
+    resample:   gdal resampling method - see const.GDAL_OVERVIEW_RESAMPLING
+    workers:    Number of files to process at the same time
+    """
+
+    if isinstance(file_list, str):
+        file_list = [file_list]
+
+    if not levels or any(int(x) < 2 for x in levels):
+        raise ValueError("Overview levels must be a list of integers "
+                         "greater than one.")
+    levels = [int(x) for x in levels]
+
+    if resample.upper() not in const.GDAL_OVERVIEW_RESAMPLING:
+        raise ValueError("The requested resample method is not valid.  It "
+                         "should be one of: %s" %
+                         const.GDAL_OVERVIEW_RESAMPLING)
+    resample = resample.upper()
+
+    if workers < 1:
+        raise ValueError("workers must be one or greater.")
+
+    def _build(fname):
+        logger.debug('building overviews %s for:  %s', levels, fname)
+        fobj = gdal.Open(fname, gdalconst.GA_ReadOnly)
+        err = fobj.BuildOverviews(resample, levels)
+        fobj = None
+        if err != 0:
+            raise RuntimeError("Overview creation failed for %s" % fname)
+        return fname
+
+    if workers == 1 or len(file_list) == 1:
+        return [_build(f) for f in file_list]
+
+    pool = ThreadPool(min(workers, len(file_list)))
+    try:
+        out = pool.map(_build, file_list)
+    finally:
+        pool.close()
+        pool.join()
+
+    return out
+
+
 def get_img_stretch_vals(imgfname_or_gdalobj,stretch=[0.02,0.98],approx_ok=True):
     """Read image, mask very small values, and return max and min
 
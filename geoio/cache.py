@@ -0,0 +1,124 @@
+'''
+Decoded block cache for geoio image reads.
+
+The BlockCache class holds decoded native gdal blocks keyed by
+(dataset, band, block x, block y) so that overlapping reads (strided window
+iteration, buffered reads, neighboring vector features, etc.) don't decode the
+same compressed blocks more than once.  A cache can be attached to a single
+GeoImage object or shared between objects to act as a process-wide cache.
+'''
+
+import collections
+import threading
+import logging
+
+# Module setup
+logger = logging.getLogger(__name__)
+
+
+class BlockCache(object):
+    """
+    Least recently used cache of decoded image blocks with a byte budget.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The maximum number of bytes of block data to hold.  The least
+        recently used blocks are evicted once this is exceeded.
+
+    Attributes
+    ----------
+    hits : int
+        Number of block requests served from the cache.
+    misses : int
+        Number of block requests that were not in the cache.
+    evictions : int
+        Number of blocks removed to stay within max_bytes.
+    nbytes : int
+        Number of bytes currently held in the cache.
+    """
+
+    def __init__(self, max_bytes=256*1024*1024):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be greater than zero.")
+
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._blocks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Blocks and the lock stay in this process, the copy starts empty
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __contains__(self, key):
+        return key in self._blocks
+
+    def __repr__(self):
+        return "%s(%s blocks, %s/%s bytes, hits=%s, misses=%s)" % \
+               (self.__class__.__name__, len(self._blocks), self.nbytes,
+                self.max_bytes, self.hits, self.misses)
+
+    def get(self, key):
+        """Return the block stored at key or None if it isn't cached.  A
+        successful lookup marks the block as most recently used."""
+        with self._lock:
+            try:
+                blk = self._blocks.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._blocks[key] = blk
+            self.hits += 1
+            return blk
+
+    def put(self, key, blk):
+        """Add a decoded block to the cache.  The array is marked read-only
+        since it is shared by every read that uses it.  Blocks larger than
+        the full byte budget are not cached."""
+        if blk.nbytes > self.max_bytes:
+            return
+
+        blk.setflags(write=False)
+        with self._lock:
+            old = self._blocks.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._blocks[key] = blk
+            self.nbytes += blk.nbytes
+
+            while self.nbytes > self.max_bytes:
+                k, v = self._blocks.popitem(last=False)
+                self.nbytes -= v.nbytes
+                self.evictions += 1
+                logger.debug('evicted block %s', k)
+
+    def clear(self, dataset=None):
+        """Remove all blocks from the cache, or only the blocks belonging to
+        dataset if it is passed."""
+        with self._lock:
+            if dataset is None:
+                self._blocks.clear()
+                self.nbytes = 0
+                return
+
+            for k in [x for x in self._blocks if x[0] == dataset]:
+                self.nbytes -= self._blocks.pop(k).nbytes
+
+    def stats(self):
+        """Return a dictionary of the cache counters."""
+        return {'blocks': len(self._blocks),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
@@ -27,6 +27,18 @@ DICT_GDAL_TO_NP = {gdalconst.GDT_Byte : np.dtype('uint8'),
 ###############################################################################
 
 
+##### GDAL Overview Settings ##################################################
+# Resampling methods accepted by gdal BuildOverviews.
+GDAL_OVERVIEW_RESAMPLING = ['NEAREST', 'AVERAGE', 'GAUSS', 'CUBIC',
+                            'CUBICSPLINE', 'LANCZOS', 'AVERAGE_MAGPHASE',
+                            'MODE', 'NONE']
+
+# Default overview levels stop once the smallest image dimension of the
+# reduced resolution layer would be less than this many pixels.
+GDAL_OVERVIEW_MIN_SIZE = 256
+###############################################################################
+
+
 ##### DigitalGlobe File Suffixes and Search Strings ###########################
 # DG meta file endings
 # If XML exists, it should contains same info as the rest of the files.
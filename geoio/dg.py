@@ -20,7 +20,7 @@ from pkg_resources import resource_filename
 from tzwhere import tzwhere
 
 import tinytools as tt
-from base import GeoImage
+from base import GeoImage, build_overviews
 import constants as const
 
 # Module setup
@@ -201,9 +201,12 @@ class DGImage(GeoImage):
         self.meta.effbandwidth = effbandwidth
         self.meta.tdilevel = tdilevel
 
-        # Set data from constants file
+        # Set data from constants file.  The satellite index and the band
+        # number lookups are cached for the get_data path.
         sat_index = self.meta.satid.upper() + "_" + \
                     self.meta.bandid.upper()
+        self._sat_index = sat_index
+        self._band_num_cache = {}
         self.meta.band_names = const.DG_BAND_NAMES[sat_index]
         self.meta.band_centers = const.DG_WEIGHTED_BAND_CENTERS[sat_index]
 
@@ -368,6 +371,8 @@ class DGImage(GeoImage):
                        mask = False,
                        mask_all_touched=False,
                        virtual = False,
+                       return_location = False,
+                       zero_copy = False,
                        stype = None):
         """Get image data with ability to output a data frame or request
         keyword arguments to the parent get_data function.  These include
@@ -382,35 +387,74 @@ class DGImage(GeoImage):
                                       "implemented yet.  Please use the " \
                                       "dedicated methods.")
 
-        # Set satelite index to query const dictionaries
-        # Set initial band names that might be updated below
-        sat_index = self.meta.satid.upper() + "_" + \
-                    self.meta.bandid.upper()
-        bnames = const.DG_BAND_NAMES[sat_index]
+        # Convert any band aliases to band numbers
+        band_nums = self._get_band_numbers(bands)
+
+        # Call super with keywords passed in and/or convereted above
+        data = super(self.__class__,self).get_data(component = component,
+                                           bands = band_nums,
+                                           window = window,
+                                           buffer = buffer,
+                                           geom=geom,
+                                           mask = mask,
+                                           mask_all_touched=mask_all_touched,
+                                           virtual = virtual,
+                                           return_location = return_location,
+                                           zero_copy = zero_copy)
+
+        return data
+
+    def _index_bands(self, k):
+        """Extend GeoImage band indexing for img[...] with the band aliases
+        defined in const, i.e. img['RGB', 100:200, 100:200].  Integers in a
+        list with aliases are zero based band indices."""
+
+        if isinstance(k, basestring):
+            return self._get_band_numbers(k), False
+        elif (isinstance(k, (list, tuple)) and
+              any(isinstance(x, basestring) for x in k)):
+            band_nums = []
+            for x in k:
+                if isinstance(x, basestring):
+                    band_nums.extend(self._get_band_numbers(x))
+                else:
+                    band_nums.extend(super(DGImage, self)._index_bands([x])[0])
+            return band_nums, False
+        else:
+            return super(DGImage, self)._index_bands(k)
+
+    def _get_band_numbers(self, bands=None):
+        """Return the band numbers for a bands request that can include the
+        band aliases defined in const."""
+
+        # Cached lookups keyed by the request (lists are keyed as tuples)
+        key = tuple(bands) if isinstance(bands, list) else bands
+        try:
+            return list(self._band_num_cache[key])
+        except KeyError:
+            cache = True
+        except TypeError:
+            cache = False
+
+        # Satelite index to query const dictionaries
+        sat_index = self._sat_index
 
         # handle options request for individual bands
         if bands:
             band_nums = get_alias_band_numbers(sat_index,bands)
             band_nums = [x for x in band_nums if x is not None]
-            bnames = [bnames[x-1] for x in band_nums if x is not None]
         else:
-            band_nums = get_alias_band_numbers(sat_index,bnames)
+            band_nums = get_alias_band_numbers(sat_index,
+                                               const.DG_BAND_NAMES[sat_index])
 
         if len(band_nums) is 0:
             raise ValueError("No band values were found in the requested " \
                              "alias.")
 
-        # Call super with keywords passed in and/or convereted above
-        data = super(self.__class__,self).get_data(component = component,
-                                           bands = band_nums,
-                                           window = window,
-                                           buffer = buffer,
-                                           geom=geom,
-                                           mask = mask,
-                                           mask_all_touched=mask_all_touched,
-                                           virtual = virtual)
+        if cache:
+            self._band_num_cache[key] = tuple(band_nums)
 
-        return data
+        return band_nums
 
     def get_data_as_at_sensor_rad(self,component=None):
         """Read data from sensor as at sensor radiance.  The returned values
@@ -893,6 +937,29 @@ class DGImage(GeoImage):
         self.delete_toa_ref_files(test_only=test_only)
         self.delete_dgacomp_files(test_only=test_only)
 
+    def build_overviews(self, levels=None, resample='average', workers=1,
+                        spectral=True):
+        """Build overviews for the image components and, if spectral is True,
+        for the components of any derived spectral files (radiance, TOA
+        reflectance, and DGAComp) that exist for this image.  See
+        GeoImage.build_overviews for the other arguments."""
+
+        levels = super(DGImage, self).build_overviews(levels=levels,
+                                                      resample=resample,
+                                                      workers=workers)
+
+        if spectral:
+            spec_tiles = []
+            for x in ['rad_tiles', 'toa_tiles', 'dgacomp_tiles']:
+                if self.files.get(x):
+                    spec_tiles.extend(self.files[x])
+
+            if spec_tiles:
+                build_overviews(spec_tiles, levels=levels, resample=resample,
+                                workers=workers)
+
+        return levels
+
     def get_data_as_surf_ref(self):
         """Get data from DGAcomp files, if they exist."""
         if not self.files.dgacomp:
@@ -0,0 +1,236 @@
+'''
+Compact grid geometry for geoio images.
+
+The GeoGrid class holds the geo transform, size, and projection of an image
+grid and provides vectorized coordinate transforms and window/extent algebra
+(intersection, sub-grids, alignment, and offsets between grids) without going
+back to the image metadata dictionaries.
+'''
+
+from __future__ import division
+
+import math
+
+import numpy as np
+
+
+class GeoGrid(object):
+    """
+    Immutable description of a georeferenced pixel grid.
+
+    Parameters
+    ----------
+    geo_transform : sequence, length 6
+        gdal geo transform of the grid.
+    xsize : int
+        Number of pixels in x (columns).
+    ysize : int
+        Number of pixels in y (rows).
+    projection : str, optional
+        WKT projection string of the grid.
+
+    Attributes
+    ----------
+    geo_transform : tuple
+        The gdal geo transform as floats.
+    inv_transform : tuple
+        The inverse geo transform (projection to raster space).
+    xsize : int
+        Number of columns.
+    ysize : int
+        Number of rows.
+    projection : str
+        WKT projection string.
+    """
+
+    __slots__ = ('geo_transform', 'inv_transform', 'xsize', 'ysize',
+                 'projection')
+
+    def __init__(self, geo_transform, xsize, ysize, projection=''):
+        gt = tuple(float(x) for x in geo_transform)
+        if len(gt) != 6:
+            raise ValueError("geo_transform must be length six.")
+        object.__setattr__(self, 'geo_transform', gt)
+        object.__setattr__(self, 'inv_transform', invert_geo_transform(gt))
+        object.__setattr__(self, 'xsize', int(xsize))
+        object.__setattr__(self, 'ysize', int(ysize))
+        object.__setattr__(self, 'projection', projection or '')
+
+    def __setattr__(self, name, value):
+        raise AttributeError("GeoGrid objects are immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("GeoGrid objects are immutable.")
+
+    def __reduce__(self):
+        return (self.__class__, (self.geo_transform, self.xsize, self.ysize,
+                                 self.projection))
+
+    def __eq__(self, other):
+        if not isinstance(other, GeoGrid):
+            return NotImplemented
+        return (self.geo_transform == other.geo_transform and
+                self.xsize == other.xsize and self.ysize == other.ysize and
+                self.projection == other.projection)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __hash__(self):
+        return hash((self.geo_transform, self.xsize, self.ysize,
+                     self.projection))
+
+    def __repr__(self):
+        return "%s(%s, %s, %s)" % (self.__class__.__name__,
+                                   self.geo_transform, self.xsize, self.ysize)
+
+    @property
+    def shape(self):
+        """Grid shape in numpy order (rows, columns)."""
+        return (self.ysize, self.xsize)
+
+    @property
+    def resolution(self):
+        """Pixel size in x and y."""
+        return (abs(self.geo_transform[1]), abs(self.geo_transform[5]))
+
+    @property
+    def extent(self):
+        """(xmin, xmax, ymin, ymax) of the grid in projection space."""
+        return self.window_to_extent([0, 0, self.xsize, self.ysize])
+
+    def proj_to_raster(self, projx, projy, out=None):
+        """Convert projection space arrays to raster space.  See
+        affine_transform for out."""
+        return affine_transform(self.inv_transform, projx, projy, out)
+
+    def raster_to_proj(self, x, y, out=None):
+        """Convert raster space arrays to projection space.  See
+        affine_transform for out."""
+        return affine_transform(self.geo_transform, x, y, out)
+
+    def window_to_extent(self, window):
+        """Return the (xmin, xmax, ymin, ymax) projection extent of an
+        [xoff, yoff, win_xsize, win_ysize] window."""
+        xoff, yoff, win_xsize, win_ysize = window
+        x = np.array([xoff, xoff+win_xsize, xoff, xoff+win_xsize],
+                     dtype='float64')
+        y = np.array([yoff, yoff, yoff+win_ysize, yoff+win_ysize],
+                     dtype='float64')
+        px, py = self.raster_to_proj(x, y)
+        return (px.min(), px.max(), py.min(), py.max())
+
+    def extent_to_window(self, extent):
+        """Return the [xoff, yoff, win_xsize, win_ysize] window that covers
+        the (xmin, xmax, ymin, ymax) projection extent.  The window is not
+        clipped to the grid."""
+        xmin, xmax, ymin, ymax = extent
+        px = np.array([xmin, xmax, xmin, xmax], dtype='float64')
+        py = np.array([ymin, ymin, ymax, ymax], dtype='float64')
+        x, y = self.proj_to_raster(px, py)
+        xoff = int(math.floor(x.min()))
+        yoff = int(math.floor(y.min()))
+        return [xoff, yoff,
+                int(math.ceil(x.max()))-xoff, int(math.ceil(y.max()))-yoff]
+
+    def intersect_window(self, window):
+        """Clip an [xoff, yoff, win_xsize, win_ysize] window to the grid.
+        Returns None if the window does not overlap the grid."""
+        xoff, yoff, win_xsize, win_ysize = window
+        x0 = max(xoff, 0)
+        y0 = max(yoff, 0)
+        x1 = min(xoff+win_xsize, self.xsize)
+        y1 = min(yoff+win_ysize, self.ysize)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return [x0, y0, x1-x0, y1-y0]
+
+    def intersect_extent(self, extent):
+        """Return the grid window covering the (xmin, xmax, ymin, ymax)
+        extent clipped to the grid, or None if there is no overlap."""
+        return self.intersect_window(self.extent_to_window(extent))
+
+    def subgrid(self, window):
+        """Return the GeoGrid of an [xoff, yoff, win_xsize, win_ysize]
+        window of this grid."""
+        xoff, yoff, win_xsize, win_ysize = window
+        gt = self.geo_transform
+        origin = self.raster_to_proj(np.float64(xoff), np.float64(yoff))
+        return GeoGrid((float(origin[0]), gt[1], gt[2],
+                        float(origin[1]), gt[4], gt[5]),
+                       win_xsize, win_ysize, self.projection)
+
+    def is_aligned(self, other, tolerance=1e-6):
+        """Return True if other has the same pixel size and rotation and its
+        pixels line up with the pixels of this grid to within tolerance
+        (a fraction of a pixel).  Projections are not compared since
+        equivalent WKT strings can differ."""
+        a = self.geo_transform
+        b = other.geo_transform
+        for i in (1, 2, 4, 5):
+            if abs(a[i]-b[i]) > tolerance*max(abs(a[1]), abs(a[5])):
+                return False
+        x, y = self.pixel_offset(other, check=False)
+        return (abs(x-round(x)) <= tolerance and
+                abs(y-round(y)) <= tolerance)
+
+    def pixel_offset(self, other, check=True):
+        """Return the (x, y) pixel position of the origin of other in this
+        grid.  The values are rounded integers if check is True, in which
+        case the grids must be aligned."""
+        x, y = self.proj_to_raster(np.float64(other.geo_transform[0]),
+                                   np.float64(other.geo_transform[3]))
+        if not check:
+            return float(x), float(y)
+        if not self.is_aligned(other):
+            raise ValueError("The grids are not aligned.")
+        return int(round(x)), int(round(y))
+
+    def window_to(self, other, window):
+        """Map an [xoff, yoff, win_xsize, win_ysize] window of this grid to
+        the same pixels of the aligned grid other."""
+        dx, dy = other.pixel_offset(self)
+        xoff, yoff, win_xsize, win_ysize = window
+        return [xoff+dx, yoff+dy, win_xsize, win_ysize]
+
+
+def invert_geo_transform(gt):
+    """Return the inverse of a gdal geo transform so that raster coordinates
+    are gt_inv[0] + gt_inv[1]*projx + gt_inv[2]*projy and
+    gt_inv[3] + gt_inv[4]*projx + gt_inv[5]*projy."""
+    det = gt[1]*gt[5] - gt[2]*gt[4]
+    if det == 0:
+        raise ValueError("The geo transform is not invertible.")
+
+    return ((gt[2]*gt[3] - gt[0]*gt[5]) / det,
+            gt[5] / det,
+            -gt[2] / det,
+            (gt[0]*gt[4] - gt[1]*gt[3]) / det,
+            -gt[4] / det,
+            gt[1] / det)
+
+
+def affine_transform(gt, x, y, out=None):
+    """Apply the affine geo transform gt to the x and y arrays.  If out is
+    passed as a tuple of two float64 arrays, the results are written to them.
+    out can be (x, y) to transform in place."""
+    # Cross terms first so that x and y can be overwritten below
+    tx = gt[4] * x
+    ty = gt[2] * y
+    if out is None:
+        xo = gt[1] * x
+        yo = gt[5] * y
+    else:
+        xo, yo = out
+        np.multiply(x, gt[1], out=xo)
+        np.multiply(y, gt[5], out=yo)
+
+    xo += ty
+    xo += gt[0]
+    yo += tx
+    yo += gt[3]
+
+    return xo, yo
@@ -0,0 +1,505 @@
+'''
+Lazy chunked arrays over geoio images.
+
+A LazyArray describes an array computed from image data (slices of an image,
+elementwise ufuncs of those slices, type conversions, etc.) without reading
+any pixels.  Data is only read when the array is computed or reduced and then
+one chunk at a time, so whole-image band math and statistics run in memory
+proportional to the chunk size rather than the image size.
+'''
+
+from __future__ import division
+
+import itertools
+import threading
+import logging
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+import constants as const
+
+# Module setup
+logger = logging.getLogger(__name__)
+
+
+class LazyArray(object):
+    """
+    Lazily evaluated array of image data.  Create these with
+    GeoImage.to_lazy_array rather than directly.
+
+    LazyArray objects support basic slicing (integers and slices), numpy
+    ufuncs and arithmetic operators (with other lazy arrays of the same
+    shape, numpy arrays that broadcast to the shape, and scalars), astype,
+    and the sum, mean, min, max, and histogram reductions.  All of these
+    return new lazy arrays except the reductions, which are evaluated chunk
+    by chunk.  Use compute or numpy.asarray to read the full array.
+
+    Attributes
+    ----------
+    shape : tuple
+        Shape of the array.
+    dtype : numpy.dtype
+        Data type of the array.
+    chunks : tuple
+        Chunk size along each axis.
+    """
+
+    def __init__(self, node, shape3, dtype, chunks3, drop=(False,)*3):
+        self._node = node
+        self._shape3 = tuple(int(x) for x in shape3)
+        self._chunks3 = tuple(int(x) for x in chunks3)
+        self._drop = tuple(bool(x) for x in drop)
+        self.dtype = np.dtype(dtype)
+
+    # numpy should hand ufuncs and binary operators to __array_ufunc__
+    __array_priority__ = 100
+
+    @property
+    def shape(self):
+        return tuple(n for n, d in zip(self._shape3, self._drop) if not d)
+
+    @property
+    def chunks(self):
+        return tuple(c for c, d in zip(self._chunks3, self._drop) if not d)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        if not self.shape:
+            raise TypeError("len() of unsized object")
+        return self.shape[0]
+
+    def __repr__(self):
+        return "%s(shape=%s, dtype=%s, chunks=%s)" % \
+               (self.__class__.__name__, self.shape, self.dtype, self.chunks)
+
+    def __array__(self, dtype=None):
+        a = self.compute()
+        if dtype is not None:
+            a = a.astype(dtype, copy=False)
+        return a
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if any(k is Ellipsis for k in key):
+            if sum(1 for k in key if k is Ellipsis) > 1:
+                raise IndexError("An index can only have a single ellipsis.")
+            i = [k is Ellipsis for k in key].index(True)
+            fill = (slice(None),)*(self.ndim-len(key)+1)
+            key = key[:i] + fill + key[i+1:]
+        if len(key) > self.ndim:
+            raise IndexError("Too many indices for a %s dimensional array." %
+                             self.ndim)
+        key = list(key) + [slice(None)]*(self.ndim-len(key))
+
+        # Map the visible index onto the three internal axes
+        starts = []
+        steps = []
+        shape3 = []
+        drop = []
+        for n, d in zip(self._shape3, self._drop):
+            if d:
+                k = 0
+            else:
+                k = key.pop(0)
+            if isinstance(k, (int, long, np.integer)):
+                if not -n <= k < n:
+                    raise IndexError("Index %s is out of range for an axis "
+                                     "of length %s." % (k, n))
+                starts.append(int(k) % n)
+                steps.append(1)
+                shape3.append(1)
+                drop.append(True)
+            elif isinstance(k, slice):
+                start, stop, step = k.indices(n)
+                starts.append(start)
+                steps.append(step)
+                shape3.append(len(xrange(start, stop, step)))
+                drop.append(d)
+            else:
+                raise IndexError("Lazy arrays can only be indexed with "
+                                 "integers and slices.")
+
+        chunks3 = [min(c, max(n, 1)) for c, n in zip(self._chunks3, shape3)]
+        return LazyArray(_ViewNode(self, starts, steps), shape3, self.dtype,
+                         chunks3, drop)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method != '__call__' or ufunc.nout != 1 or 'out' in kwargs:
+            return NotImplemented
+
+        ref = None
+        for x in inputs:
+            if isinstance(x, LazyArray):
+                if ref is None:
+                    ref = x
+                elif (x._shape3 != ref._shape3) or (x._drop != ref._drop):
+                    raise ValueError("Lazy array operands must have the same "
+                                     "shape.  Got %s and %s." %
+                                     (ref.shape, x.shape))
+
+        # Broadcast array operands to the internal three dimensional shape
+        args = []
+        for x in inputs:
+            if isinstance(x, LazyArray) or np.isscalar(x):
+                args.append(x)
+            else:
+                x = np.asarray(x)
+                if x.ndim == 0:
+                    args.append(x[()])
+                else:
+                    args.append(np.broadcast_to(x, ref.shape)
+                                .reshape(ref._shape3))
+
+        probe = [np.empty(0, x.dtype) if hasattr(x, 'dtype') and
+                 not np.isscalar(x) else x for x in args]
+        dtype = ufunc(*probe, **kwargs).dtype
+
+        return LazyArray(_MapNode(ufunc, args, kwargs), ref._shape3, dtype,
+                         ref._chunks3, ref._drop)
+
+    def astype(self, dtype):
+        """Return a lazy array converted to dtype."""
+        return LazyArray(_MapNode(_astype, [self], {'dtype': dtype}),
+                         self._shape3, dtype, self._chunks3, self._drop)
+
+    def rechunk(self, chunks):
+        """Return the same lazy array with a different chunk size."""
+        chunks3 = _normalize_chunks(chunks, self._shape3, self._chunks3,
+                                    self._drop)
+        return LazyArray(self._node, self._shape3, self.dtype, chunks3,
+                         self._drop)
+
+    def iter_chunks(self, workers=1):
+        """
+        Yield the chunks of the array.
+
+        Parameters
+        ----------
+        workers : int, optional
+            Number of threads used to compute chunks.  Each thread reads with
+            its own gdal dataset handle.
+
+        Yields
+        ------
+        index : tuple of slice
+            Position of the chunk in the array.
+        data : ndarray
+            The chunk data.
+        """
+        for region, data in self._map_blocks(workers):
+            yield self._visible(region), self._squeeze(data)
+
+    def compute(self, workers=1):
+        """Evaluate the full array.  See iter_chunks for workers."""
+        out = np.empty(self._shape3, dtype=self.dtype)
+        for region, data in self._map_blocks(workers):
+            out[region] = data
+        return self._squeeze(out)
+
+    def sum(self, axis=None, dtype=None, out=None, workers=1):
+        """Sum of the array elements over the given axis, as numpy.sum."""
+        _check_out(out)
+        return self._reduce(lambda a, ax: a.sum(axis=ax, dtype=dtype),
+                            np.add, axis, workers)
+
+    def mean(self, axis=None, dtype='float64', out=None, workers=1):
+        """Mean of the array elements over the given axis, as numpy.mean."""
+        _check_out(out)
+        total = self.sum(axis=axis, dtype=dtype, workers=workers)
+        axes = self._reduce_axes(axis)
+        count = np.prod([self._shape3[a] for a in axes])
+        return total / count
+
+    def min(self, axis=None, out=None, workers=1):
+        """Minimum of the array elements over the given axis."""
+        _check_out(out)
+        return self._reduce(lambda a, ax: a.min(axis=ax), np.minimum,
+                            axis, workers)
+
+    def max(self, axis=None, out=None, workers=1):
+        """Maximum of the array elements over the given axis."""
+        _check_out(out)
+        return self._reduce(lambda a, ax: a.max(axis=ax), np.maximum,
+                            axis, workers)
+
+    def histogram(self, bins=10, range=None, workers=1):
+        """
+        Histogram of all the array elements, as numpy.histogram.
+
+        If range isn't passed, the array minimum and maximum are computed
+        first which takes an extra pass over the data.
+
+        Returns
+        -------
+        hist : ndarray
+            Counts in each bin.
+        bin_edges : ndarray
+            The bin edges (length len(hist)+1).
+        """
+        if np.ndim(bins) == 0 and range is None:
+            range = (self.min(workers=workers), self.max(workers=workers))
+        edges = np.histogram(np.empty(0, dtype=self.dtype), bins=bins,
+                             range=range)[1]
+
+        hist = np.zeros(len(edges)-1, dtype='int64')
+        for region, data in self._map_blocks(workers):
+            hist += np.histogram(data, bins=edges)[0]
+
+        return hist, edges
+
+    def _block(self, region):
+        """Compute the internal three dimensional block at region (a tuple
+        of three slices with positive steps)."""
+        return self._node.block(region)
+
+    def _regions(self):
+        """Yield the internal regions of each chunk in C order."""
+        ranges = [[slice(s, min(s+c, n)) for s in xrange(0, n, c)]
+                  for n, c in zip(self._shape3, self._chunks3)]
+        return itertools.product(*ranges)
+
+    def _map_blocks(self, workers=1):
+        """Yield (region, data) for each chunk, computed with workers
+        threads."""
+        regions = self._regions()
+        if workers is None or workers <= 1:
+            for r in regions:
+                yield r, self._block(r)
+            return
+
+        pool = ThreadPool(workers)
+        try:
+            for r, data in pool.imap(lambda r: (r, self._block(r)), regions):
+                yield r, data
+        finally:
+            pool.terminate()
+
+    def _squeeze(self, a):
+        return a[tuple(0 if d else slice(None) for d in self._drop)]
+
+    def _visible(self, region):
+        return tuple(r for r, d in zip(region, self._drop) if not d)
+
+    def _reduce_axes(self, axis):
+        """Return the internal axes reduced for a visible axis argument."""
+        visible = [i for i, d in enumerate(self._drop) if not d]
+        if axis is None:
+            return tuple(visible)
+        if not isinstance(axis, tuple):
+            axis = (axis,)
+        axes = []
+        for a in axis:
+            if not -len(visible) <= a < len(visible):
+                raise ValueError("axis %s is out of bounds for a %s "
+                                 "dimensional array." % (a, len(visible)))
+            axes.append(visible[a % len(visible)])
+        return tuple(sorted(set(axes)))
+
+    def _reduce(self, func, combine, axis, workers):
+        """Reduce each chunk over the requested axes with func and merge
+        the partial results with the ufunc combine."""
+        axes = self._reduce_axes(axis)
+        raxes = tuple(sorted(set(axes) |
+                             set(i for i, d in enumerate(self._drop) if d)))
+        keep = [i for i in xrange(3) if i not in raxes]
+
+        if any(self._shape3[a] == 0 for a in raxes):
+            # Let numpy decide what an empty reduction returns
+            return func(np.empty(self._shape3, dtype=self.dtype), raxes)
+
+        out = None
+        seen = set()
+        for region, data in self._map_blocks(workers):
+            part = func(data, raxes)
+            if not keep:
+                out = part if out is None else combine(out, part)
+                continue
+
+            if out is None:
+                out = np.empty([self._shape3[i] for i in keep],
+                               dtype=part.dtype)
+            kregion = tuple(region[i] for i in keep)
+            kkey = tuple(r.start for r in kregion)
+            if kkey in seen:
+                combine(out[kregion], part, out=out[kregion])
+            else:
+                out[kregion] = part
+                seen.add(kkey)
+
+        return out
+
+
+class _ImageNode(object):
+    """Lazy node that reads from a GeoImage.  Threads other than the one
+    that created the node read from their own reopened copy of the image
+    since gdal dataset handles can't be shared between threads."""
+
+    def __init__(self, img):
+        self.img = img
+        self._owner = threading.current_thread()
+        self._local = threading.local()
+
+    def block(self, region):
+        img = getattr(self._local, 'img', None)
+        if img is None:
+            if threading.current_thread() is self._owner:
+                img = self.img
+            else:
+                img = self.img._reopen()
+            self._local.img = img
+        return img[region]
+
+    def __getstate__(self):
+        # The image reopens its dataset after unpickling, so lazy arrays can
+        # be sent to process pools
+        return {'img': self.img}
+
+    def __setstate__(self, state):
+        self.__init__(state['img'])
+
+
+class _ViewNode(object):
+    """Lazy node for a strided view of another lazy array."""
+
+    def __init__(self, parent, starts, steps):
+        self.parent = parent
+        self.starts = starts
+        self.steps = steps
+
+    def block(self, region):
+        pregion = []
+        flip = []
+        for r, start, step in zip(region, self.starts, self.steps):
+            n = len(xrange(r.start, r.stop, r.step or 1))
+            first = start + r.start*step
+            pstep = (r.step or 1)*step
+            if pstep > 0:
+                pregion.append(slice(first, first+(n-1)*pstep+1, pstep))
+                flip.append(slice(None))
+            else:
+                low = first + (n-1)*pstep
+                pregion.append(slice(low, first+1, -pstep))
+                flip.append(slice(None, None, -1))
+
+        return self.parent._block(tuple(pregion))[tuple(flip)]
+
+
+class _MapNode(object):
+    """Lazy node applying an elementwise function to lazy arrays, arrays
+    (already broadcast to the internal shape), and scalars."""
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def block(self, region):
+        args = []
+        for x in self.args:
+            if isinstance(x, LazyArray):
+                args.append(x._block(region))
+            elif isinstance(x, np.ndarray):
+                args.append(x[region])
+            else:
+                args.append(x)
+        return self.func(*args, **self.kwargs)
+
+
+def from_image(img, chunks=None):
+    """Return a LazyArray of the (bands, y, x) data of a GeoImage."""
+    nbands, xsize, ysize = img.meta.shape
+    shape3 = (nbands, ysize, xsize)
+    bx, by = img._fobj.GetRasterBand(1).GetBlockSize()
+    default = (nbands, _round_chunk(1024, by, ysize),
+               _round_chunk(1024, bx, xsize))
+    chunks3 = _normalize_chunks(chunks, shape3, default, (False,)*3)
+    dtype = const.DICT_GDAL_TO_NP[img._fobj.GetRasterBand(1).DataType]
+    return LazyArray(_ImageNode(img), shape3, dtype, chunks3)
+
+
+def _round_chunk(target, block, n):
+    """Round a target chunk size down to a multiple of the block size."""
+    return max(1, min(n, max(block, (target//block)*block)))
+
+
+def _normalize_chunks(chunks, shape3, default3, drop):
+    """Return internal chunk sizes from an int (used for the last two
+    visible axes) or a tuple with one size per visible axis.  None in the
+    tuple keeps the default."""
+    if chunks is None:
+        chunks3 = list(default3)
+    else:
+        visible = [i for i, d in enumerate(drop) if not d]
+        if np.ndim(chunks) == 0:
+            chunks = (None,)*(len(visible)-2) + (chunks,)*min(2,len(visible))
+        if len(chunks) != len(visible):
+            raise ValueError("chunks must have one size per axis.")
+        chunks3 = list(default3)
+        for i, c in zip(visible, chunks):
+            if c is not None:
+                chunks3[i] = int(c)
+
+    if any(c < 1 for c in chunks3):
+        raise ValueError("Chunk sizes must be one or greater.")
+    return tuple(min(c, max(n, 1)) for c, n in zip(chunks3, shape3))
+
+
+def _astype(a, dtype):
+    return a.astype(dtype)
+
+
+def _check_out(out):
+    if out is not None:
+        raise NotImplementedError("out is not supported for lazy arrays.")
+
+
+def _binary(ufunc):
+    def op(self, other):
+        return ufunc(self, other)
+    return op
+
+
+def _reflected(ufunc):
+    def op(self, other):
+        return ufunc(other, self)
+    return op
+
+
+def _unary(ufunc):
+    def op(self):
+        return ufunc(self)
+    return op
+
+
+for _name, _ufunc in [('add', np.add), ('sub', np.subtract),
+                      ('mul', np.multiply), ('div', np.divide),
+                      ('truediv', np.true_divide),
+                      ('floordiv', np.floor_divide), ('mod', np.remainder),
+                      ('pow', np.power), ('and', np.bitwise_and),
+                      ('or', np.bitwise_or), ('xor', np.bitwise_xor)]:
+    setattr(LazyArray, '__%s__' % _name, _binary(_ufunc))
+    setattr(LazyArray, '__r%s__' % _name, _reflected(_ufunc))
+
+for _name, _ufunc in [('lt', np.less), ('le', np.less_equal),
+                      ('gt', np.greater), ('ge', np.greater_equal),
+                      ('eq', np.equal), ('ne', np.not_equal)]:
+    setattr(LazyArray, '__%s__' % _name, _binary(_ufunc))
+
+for _name, _ufunc in [('neg', np.negative), ('pos', np.positive),
+                      ('abs', np.absolute), ('invert', np.invert)]:
+    setattr(LazyArray, '__%s__' % _name, _unary(_ufunc))
+
+LazyArray.__hash__ = None
@@ -0,0 +1,206 @@
+'''
+Image metadata record for geoio images.
+
+The ImageMeta class replaces the OrderedBunch previously used for
+GeoImage.meta.  The fields returned by read_geo_file_info are stored in slots
+(so attribute access in the read paths is a plain descriptor lookup) and the
+grid defining fields are read-only once the record is built.  Any other keys
+(e.g. the DigitalGlobe fields added by DGImage) are kept in an ordered
+dictionary.  Both attribute and dictionary style access work for all keys.
+'''
+
+import collections
+
+
+class ImageMeta(object):
+    """
+    Slotted image metadata with dictionary and attribute access.
+
+    Parameters
+    ----------
+    d : dict, optional
+        Initial metadata, typically the output of read_geo_file_info.  Any
+        keyword arguments are added after d.
+
+    Notes
+    -----
+    The fields in ImageMeta.frozen_fields (shape, geo_transform, etc.)
+    describe the pixel grid and can't be changed or deleted after the record
+    is created.  Keys iterate in field order followed by any added keys in
+    insertion order.
+    """
+
+    fields = ('file_name', 'file_list', 'driver_name', 'no_data_value',
+              'gdal_dtype', 'gdal_dtype_name', 'pixels', 'shape',
+              'geo_transform', 'resolution', 'extent', 'projection_string',
+              'pprint_proj_string', 'authority', 'class_name')
+
+    frozen_fields = frozenset(('gdal_dtype', 'pixels', 'shape',
+                               'geo_transform', 'resolution', 'extent',
+                               'projection_string'))
+
+    __slots__ = fields + ('_extra', '_locked')
+
+    def __init__(self, d=None, **kwargs):
+        object.__setattr__(self, '_extra', collections.OrderedDict())
+        object.__setattr__(self, '_locked', False)
+
+        if d is not None:
+            for k, v in (d.iteritems() if hasattr(d, 'iteritems')
+                         else d.items()):
+                self[k] = v
+        for k, v in kwargs.items():
+            self[k] = v
+
+        object.__setattr__(self, '_locked', True)
+
+    def __setattr__(self, name, value):
+        if name in self.frozen_fields:
+            if self._locked:
+                raise AttributeError("%s is read-only." % name)
+            value = _as_typed(name, value)
+        if name in self.fields:
+            object.__setattr__(self, name, value)
+        elif name.startswith('_'):
+            raise AttributeError("Private attributes can't be set on %s." %
+                                 self.__class__.__name__)
+        else:
+            self._extra[name] = value
+
+    def __getattr__(self, name):
+        # Only called when the slot lookup fails
+        try:
+            return self._extra[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __delattr__(self, name):
+        if name in self.frozen_fields:
+            raise AttributeError("%s is read-only." % name)
+        if name in self.fields:
+            object.__delattr__(self, name)
+        else:
+            try:
+                del self._extra[name]
+            except KeyError:
+                raise AttributeError(name)
+
+    def __getitem__(self, key):
+        if key in self.fields:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, basestring):
+            raise TypeError("ImageMeta keys must be strings.")
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except AttributeError:
+            if key in self.frozen_fields:
+                raise
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        for k in self.fields:
+            if hasattr(self, k):
+                yield k
+        for k in self._extra:
+            yield k
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __eq__(self, other):
+        if isinstance(other, ImageMeta):
+            other = other.to_dict()
+        elif not isinstance(other, dict):
+            return NotImplemented
+        return dict(self.iteritems()) == dict(other)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (self.__class__, (self.to_dict(),))
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__,
+                           ', '.join('%s=%r' % (k, v)
+                                     for k, v in self.iteritems()))
+
+    def __dir__(self):
+        return sorted(set(dir(self.__class__)) | set(self))
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for k in self:
+            yield self[k]
+
+    def iteritems(self):
+        for k in self:
+            yield k, self[k]
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, d=None, **kwargs):
+        """Set several keys as with dict.update."""
+        if d is not None:
+            for k, v in (d.iteritems() if hasattr(d, 'iteritems')
+                         else d.items()):
+                self[k] = v
+        for k, v in kwargs.items():
+            self[k] = v
+
+    def copy(self):
+        return self.__class__(self.to_dict())
+
+    def to_dict(self):
+        """Return the metadata as an OrderedDict."""
+        return collections.OrderedDict(self.iteritems())
+
+
+def _as_typed(name, value):
+    """Coerce the grid fields to plain python types."""
+    if value is None:
+        return value
+    if name == 'shape':
+        return tuple(int(x) for x in value)
+    elif name in ('geo_transform', 'resolution', 'extent'):
+        return tuple(float(x) for x in value)
+    elif name in ('gdal_dtype', 'pixels'):
+        return int(value)
+    else:
+        return value
@@ -94,5 +94,13 @@ class TestGeoioSpectralFileHandling(unittest.TestCase):
               (self.img.files.rad==None))
         self.assertTrue(pre & post & gone)
 
+    def test_DGImage_build_overviews(self):
+        self.img.create_toa_ref_files()
+        levels = self.img.build_overviews(levels=[2,4], workers=2)
+        self.assertEqual(levels,[2,4])
+        for f in self.img.files.dfile_tiles+self.img.files.toa_tiles:
+            b = geoio.GeoImage(f)._fobj.GetRasterBand(1)
+            self.assertEqual(b.GetOverviewCount(),2)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
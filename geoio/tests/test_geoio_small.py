@@ -3,10 +3,13 @@
 import unittest
 import os
 import collections
-from osgeo import gdalconst
+from osgeo import gdalconst, ogr, osr
 import numpy as np
 import warnings
 import json
+import pickle
+import tempfile
+import shutil
 
 import geoio.dg
 import tinytools as tt
@@ -60,7 +63,19 @@ class TestGeoImage(unittest.TestCase):
         self.assertIsInstance(self.img.files,tt.bunch.OrderedBunch)
 
     def test_GeoImage_meta_exists(self):
-        self.assertIsInstance(self.img.meta,tt.bunch.OrderedBunch)
+        self.assertIsInstance(self.img.meta,geoio.ImageMeta)
+
+    def test_GeoImage_meta_access(self):
+        m = self.img.meta
+        self.assertEqual(m['shape'], m.shape)
+        self.assertEqual(m.get('missing', 3), 3)
+        self.assertTrue('geo_transform' in m)
+        m.extra_key = 'a'
+        self.assertEqual(m['extra_key'], 'a')
+        self.assertEqual(m.keys()[-1], 'extra_key')
+        self.assertRaises(AttributeError, setattr, m, 'shape', (1, 2, 3))
+        self.assertRaises(AttributeError, m.__setitem__, 'geo_transform',
+                          (0, 1, 0, 0, 0, -1))
 
     def test_GeoImage_shape(self):
         self.assertEqual(self.img.shape,(8,500,501))
@@ -81,6 +96,102 @@ class TestGeoImage(unittest.TestCase):
         self.assertEqual(const.DICT_NP_TO_GDAL[a.dtype],
                          self.img.meta.gdal_dtype)
 
+    def test_GeoImage_proj_to_raster_roundtrip(self):
+        x = np.array([0.0, 10.5, 250.25])
+        y = np.array([0.0, 20.5, 400.75])
+        px, py = self.img.raster_to_proj(x, y)
+        rx, ry = self.img.proj_to_raster(px, py)
+        self.assertTrue(np.allclose(rx, x) and np.allclose(ry, y))
+
+    def test_GeoImage_proj_to_raster_types(self):
+        px, py = self.img.raster_to_proj([1, 2], [3, 4])
+        self.assertIsInstance(px, list)
+        px, py = self.img.raster_to_proj((1, 2), (3, 4))
+        self.assertIsInstance(px, tuple)
+        px, py = self.img.raster_to_proj(1, 3)
+        self.assertIsInstance(px, float)
+
+    def test_GeoImage_proj_to_raster_array_inplace(self):
+        px, py = self.img.raster_to_proj(np.array([5.5, 6.5]),
+                                         np.array([7.5, 8.5]))
+        out = self.img.proj_to_raster_array(px, py, out=(px, py))
+        self.assertIs(out[0], px)
+        self.assertTrue(np.allclose(px, [5.5, 6.5]))
+        self.assertTrue(np.allclose(py, [7.5, 8.5]))
+
+    def test_GeoImage_proj_to_raster_int(self):
+        px, py = self.img.raster_to_proj(np.array([5.5]), np.array([7.2]))
+        fx, fy = self.img.proj_to_raster_int(px, py)
+        cx, cy = self.img.proj_to_raster_int(px, py, rounding='ceil')
+        self.assertEqual((fx[0], fy[0]), (5, 7))
+        self.assertEqual((cx[0], cy[0]), (6, 8))
+
+    def test_GeoImage_get_coords(self):
+        x, y = self.img.get_coords(window=[10, 20, 30, 40])
+        self.assertEqual(x.shape, (40, 30))
+        px, py = self.img.raster_to_proj(10.5, 20.5)
+        self.assertAlmostEqual(x[0,0], px)
+        self.assertAlmostEqual(y[0,0], py)
+
+    def test_GeoImage_get_coords_latlon(self):
+        lon, lat = self.img.get_coords(window=[0, 0, 100, 100], srs=4326,
+                                       step=32)
+        elon, elat = self.img.get_coords(window=[0, 0, 100, 100], srs=4326,
+                                         step=1)
+        self.assertTrue(np.allclose(lon, elon, atol=1e-7))
+        self.assertTrue(np.allclose(lat, elat, atol=1e-7))
+        self.assertTrue((np.abs(lat) <= 90).all())
+
+    def test_GeoImage_get_data_return_location_coords(self):
+        d, loc = self.img.get_data(window=[5, 5, 10, 12],
+                                   return_location='proj')
+        x, y = self.img.get_coords(window=[5, 5, 10, 12])
+        self.assertTrue(np.array_equal(loc['coords'][0], x))
+        self.assertEqual(loc['coords'][1].shape, d.shape[1:])
+
+    def test_GeoImage_grid(self):
+        g = self.img.grid
+        self.assertIsInstance(g, geoio.GeoGrid)
+        self.assertEqual(g.shape, (501, 500))
+        self.assertEqual(g.resolution, (2, 2))
+        self.assertRaises(AttributeError, setattr, g, 'xsize', 10)
+
+    def test_GeoImage_grid_extent_window(self):
+        g = self.img.grid
+        win = [10, 20, 30, 40]
+        self.assertEqual(g.extent_to_window(g.window_to_extent(win)), win)
+        self.assertEqual(g.intersect_window([-5, 490, 20, 20]),
+                         [0, 490, 15, 11])
+        self.assertIsNone(g.intersect_window([500, 0, 10, 10]))
+
+    def test_GeoImage_grid_subgrid_offset(self):
+        g = self.img.grid
+        sub = g.subgrid([10, 20, 30, 40])
+        self.assertTrue(g.is_aligned(sub))
+        self.assertEqual(g.pixel_offset(sub), (10, 20))
+        self.assertEqual(sub.window_to(g, [0, 0, 5, 5]), [10, 20, 5, 5])
+        gt = list(sub.geo_transform)
+        gt[0] += 0.5
+        shifted = geoio.GeoGrid(gt, 30, 40)
+        self.assertFalse(g.is_aligned(shifted))
+        self.assertRaises(ValueError, g.pixel_offset, shifted)
+
+    def test_GeoImage_pickle(self):
+        a = self.img.get_data(window=[10, 20, 30, 40])
+        img = pickle.loads(pickle.dumps(self.img, pickle.HIGHEST_PROTOCOL))
+        self.assertFalse('_fobj_handle' in img.__dict__)
+        self.assertEqual(img.meta, self.img.meta)
+        self.assertTrue(np.array_equal(img.get_data(window=[10, 20, 30, 40]),
+                                       a))
+
+    def test_GeoImage_fork_reopen(self):
+        self.img.get_data(window=[0, 0, 5, 5])
+        handle = self.img._fobj
+        self.img._fobj_pid = -1  # as if inherited by a forked child
+        a = self.img.get_data(window=[0, 0, 5, 5])
+        self.assertIsNot(self.img._fobj, handle)
+        self.assertEqual(a.shape, (8, 5, 5))
+
     def test_GeoImage_write_img_like_this(self):
         a = (self.img.get_data()*0.01).astype('float32')
         back = self.img.write_img_like_this("tmp.tif",a,return_obj=True)
@@ -163,6 +274,134 @@ class TestGeoImage_getdata(unittest.TestCase):
         known_min = 47
         self.assertEqual(d.min(), known_min)
 
+    def test_get_data_block_cache(self):
+        a = self.img.get_data(window=[10, 10, 300, 200], buffer=3)
+        cache = self.img.set_block_cache(max_bytes=2**26)
+        b = self.img.get_data(window=[10, 10, 300, 200], buffer=3)
+        c = self.img.get_data(window=[10, 10, 300, 200], buffer=3)
+        self.assertTrue(np.array_equal(a, b))
+        self.assertTrue(np.array_equal(a, c))
+        self.assertTrue(cache.misses > 0)
+        self.assertEqual(cache.hits, cache.misses)
+
+    def test_getitem(self):
+        a = self.img.get_data()
+        for k in [np.s_[0:3, 100:200, 50:80], np.s_[2], np.s_[:, 10, :],
+                  np.s_[[7,3,1], ::7, 5:400:3], np.s_[::-1, 300:100:-4, -5:]]:
+            self.assertTrue(np.array_equal(self.img[k], a[k]))
+
+    def test_getitem_bad_index(self):
+        self.assertRaises(IndexError, self.img.__getitem__, 8)
+        self.assertRaises(IndexError, self.img.__getitem__, (0, [1, 2]))
+
+    def test_to_lazy_array(self):
+        a = self.img.get_data()
+        la = self.img.to_lazy_array(chunks=(4, 128, 96))
+        self.assertEqual(la.shape, a.shape)
+        self.assertEqual(la.chunks, (4, 128, 96))
+        self.assertTrue(np.array_equal(np.asarray(la[1:3, ::2, 10:]),
+                                       a[1:3, ::2, 10:]))
+
+    def test_to_lazy_array_band_math(self):
+        a = self.img.get_data().astype('float32')
+        la = self.img.to_lazy_array(chunks=100)
+        lf = la.astype('float32')
+        ndvi = (lf[6]-lf[4]) / (lf[6]+lf[4])
+        expected = (a[6]-a[4]) / (a[6]+a[4])
+        self.assertTrue(np.allclose(ndvi.compute(workers=2), expected))
+        self.assertAlmostEqual(ndvi.mean(), expected.mean(dtype='float64'),
+                               places=5)
+
+    def test_to_lazy_array_reductions(self):
+        a = self.img.get_data()
+        la = self.img.to_lazy_array(chunks=64)
+        self.assertEqual(la.sum(), a.sum())
+        self.assertTrue(np.array_equal(la.max(axis=(1,2)), a.max(axis=(1,2))))
+        self.assertTrue(np.array_equal(la.min(axis=0), a.min(axis=0)))
+        h, edges = la.histogram(bins=20)
+        eh, eedges = np.histogram(a, bins=20)
+        self.assertTrue(np.array_equal(h, eh))
+
+    def test_as_memmap_gtiff(self):
+        a = self.img.get_data()
+        img = self.img.write_img_like_this("tmp_mm.tif", a, return_obj=True)
+        m = img.as_memmap()
+        self.assertTrue(np.array_equal(m, a))
+        self.assertFalse(m.flags.writeable)
+
+    def test_as_memmap_envi(self):
+        a = self.img.get_data()
+        img = self.img.write_img_like_this("tmp_mm", a, return_obj=True,
+                                           gdal_driver_name='ENVI')
+        d = img.get_data(bands=[2,4,6], window=[10, 20, 30, 40],
+                         zero_copy=True)
+        self.assertTrue(np.array_equal(d, a[1:6:2,20:60,10:40]))
+        self.assertTrue(np.may_share_memory(d, img.as_memmap()))
+
+    def test_as_memmap_fallback(self):
+        a = self.img.get_data()
+        img = self.img.write_img_like_this("tmp_lzw.tif", a, return_obj=True,
+                                           options=['COMPRESS=LZW'])
+        self.assertRaises(ValueError, img.as_memmap)
+        d = img.get_data(window=[10, 20, 30, 40], zero_copy=True)
+        self.assertTrue(np.array_equal(d, a[:,20:60,10:40]))
+
+    def test_get_data_block_cache_eviction(self):
+        a = self.img.get_data()
+        cache = self.img.set_block_cache(max_bytes=2**16)
+        b = self.img.get_data()
+        self.assertTrue(np.array_equal(a, b))
+        self.assertTrue(cache.nbytes <= 2**16)
+        self.assertTrue(cache.evictions > 0)
+
+    def test_get_data_many(self):
+        windows = [[10, 10, 20, 20], [25, 12, 20, 20], [400, 300, 5, 7],
+                   [495, 496, 10, 10], [12, 14, 3, 3]]
+        out = self.img.get_data_many(windows, bands=[2,5], buffer=2)
+        self.assertEqual(len(out), len(windows))
+        for d, w in zip(out, windows):
+            known = self.img.get_data(window=w, bands=[2,5], buffer=2)
+            self.assertTrue(np.array_equal(d, known))
+
+    def test_get_data_many_mask(self):
+        windows = [[0, 0, 10, 10], [-5, -5, 10, 10]]
+        out = self.img.get_data_many(windows, mask=True)
+        for d, w in zip(out, windows):
+            known = self.img.get_data(window=w, mask=True)
+            self.assertTrue(np.array_equal(d.mask, known.mask))
+
+    def test_sample_nearest(self):
+        d = self.img.get_data()
+        cols = np.array([100.5, 200.2, 361.7, 499.9])
+        rows = np.array([100.5, 200.9, 333.1, 500.5])
+        xs, ys = self.img.raster_to_proj(cols, rows)
+        v = self.img.sample(xs, ys)
+        self.assertEqual(v.shape, (8,4))
+        for i in range(4):
+            self.assertTrue(np.array_equal(v[:,i],
+                                           d[:,int(rows[i]),int(cols[i])]))
+
+    def test_sample_outside(self):
+        xs, ys = self.img.raster_to_proj(np.array([-10.0, 10.0]),
+                                         np.array([10.0, 10.0]))
+        v = self.img.sample(xs, ys, bands=[1], mask=True)
+        self.assertTrue(v.mask[0,0])
+        self.assertFalse(v.mask[0,1])
+
+    def test_sample_bilinear(self):
+        d = self.img.get_data(bands=[3]).astype('float64')
+        xs, ys = self.img.raster_to_proj(np.array([101.0]),
+                                         np.array([51.0]))
+        v = self.img.sample(xs, ys, bands=[3], method='bilinear')
+        self.assertAlmostEqual(v[0,0], d[0,50:52,100:102].mean())
+
+    def test_sample_srs(self):
+        xs, ys = self.img.raster_to_proj(np.array([100.5]),
+                                         np.array([100.5]))
+        a = self.img.sample(xs, ys)
+        b = self.img.sample(xs, ys, srs=self.img.meta.projection_string)
+        self.assertTrue(np.array_equal(a, b))
+
     def test_get_data_geom(self):
         with open(self.test_vecpath_json) as f:
             data = json.load(f)
@@ -178,10 +417,184 @@ class TestGeoImage_getdata(unittest.TestCase):
         #d = self.img.get_data(geom = geom_from_json)
 
 
+    def test_get_data_parts(self):
+        def box(window):
+            xmin, xmax, ymin, ymax = self.img.grid.window_to_extent(window)
+            return ('(({0} {2}, {1} {2}, {1} {3}, {0} {3}, {0} {2}))'
+                    .format(xmin, xmax, ymin, ymax))
+        a = box([10, 10, 8, 6])
+        b = box([900, 800, 5, 7])
+        out = self.img.get_data_parts('MULTIPOLYGON (%s, %s)' % (a, b),
+                                      mask=True)
+        self.assertEqual(len(out), 2)
+        # Each part is read on its own, not the envelope of both
+        self.assertTrue(out[0].shape[1] <= 7 and out[0].shape[2] <= 9)
+        self.assertTrue(out[1].shape[1] <= 8 and out[1].shape[2] <= 6)
+        self.assertTrue(np.array_equal(out[1], self.img.get_data(
+                                geom='POLYGON %s' % b, mask=True)))
+        out = self.img.get_data_parts('POLYGON %s' % a)
+        self.assertEqual(len(out), 1)
+
     #def test_get_data_wrongbandnum_throwsexc(self):
         #self.assertRaises(Exception, self.img.get_data(10))
 
 
+class TestGeoImage_iter_window(unittest.TestCase):
+    # Run defined method setUp to setup the test environment
+    def setUp(self):
+        self.test_img = dgsamples.wv2_longmont_1k.ms
+        self.img = geoio.GeoImage(self.test_img)
+
+    def tearDown(self):
+        # Remove gdal image object
+        self.img = None
+
+    def test_iter_window_sliding(self):
+        a = [x for x in self.img.iter_window(win_size=[64,64],
+                                             stride=[16,16])]
+        b = [x for x in self.img.iter_window(win_size=[64,64],
+                                             stride=[16,16],
+                                             sliding=True, copy=True)]
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertTrue(np.array_equal(x, y))
+
+    def test_iter_window_sliding_buffer(self):
+        a = [x for x in self.img.iter_window(win_size=[50,40],
+                                             stride=[30,30], buffer=3,
+                                             bands=[1,2])]
+        b = [x for x in self.img.iter_window(win_size=[50,40],
+                                             stride=[30,30], buffer=3,
+                                             bands=[1,2], sliding=True,
+                                             copy=True)]
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertTrue(np.array_equal(x, y))
+
+    def test_iter_window_sliding_readonly(self):
+        x = next(self.img.iter_window(win_size=[64,64], stride=[16,16],
+                                      sliding=True))
+        self.assertFalse(x.flags.writeable)
+
+    def test_iter_window_sliding_bad_kwarg(self):
+        with self.assertRaises(ValueError):
+            next(self.img.iter_window(win_size=[64,64], sliding=True,
+                                      mask=True))
+
+
+    def test_iter_window_no_empty_windows(self):
+        for x in self.img.iter_window(win_size=[100,167]):
+            self.assertTrue(x.any())
+
+    def test_plan_windows_pad(self):
+        xoff, yoff, xsize, ysize = self.img.plan_windows([64,64])
+        self.assertEqual(len(xoff), 8*8)
+        self.assertTrue((xoff < 500).all() and (yoff < 501).all())
+        self.assertTrue((xsize == 64).all() and (ysize == 64).all())
+
+    def test_plan_windows_shrink(self):
+        xoff, yoff, xsize, ysize = self.img.plan_windows([64,64],
+                                                         edge='shrink')
+        self.assertTrue((xoff+xsize <= 500).all())
+        self.assertTrue((yoff+ysize <= 501).all())
+        self.assertEqual(xsize.sum(), 500*8)
+
+    def test_plan_windows_drop(self):
+        xoff, yoff, xsize, ysize = self.img.plan_windows([64,64],
+                                                         stride=[32,32],
+                                                         edge='drop')
+        self.assertEqual(len(xoff), 14*14)
+        self.assertTrue((xoff+xsize <= 500).all())
+        self.assertTrue((yoff+ysize <= 501).all())
+
+    def test_plan_windows_iter_base(self):
+        plan = self.img.plan_windows([100,100], edge='shrink')
+        chips = [x for x in self.img.iter_base(*plan)]
+        self.assertEqual(len(chips), len(plan[0]))
+        self.assertEqual(chips[-1].shape, (8,1,100))
+
+    def test_plan_windows_bad_edge(self):
+        with self.assertRaises(ValueError):
+            self.img.plan_windows([64,64], edge='bad')
+
+
+    def test_iter_window_skip_empty(self):
+        a = [x for x in self.img.iter_window(win_size=[64,64])]
+        b = [x for x in self.img.iter_window(win_size=[64,64],
+                                             skip_empty=True)]
+        self.assertEqual(len(a), len(b)+self.img.skipped_windows)
+        self.assertEqual(sum(x.any() for x in a), sum(x.any() for x in b))
+
+    def test_iter_window_skip_empty_sliding(self):
+        a = [x for x in self.img.iter_window(win_size=[64,64],
+                                             stride=[32,32],
+                                             skip_empty=True)]
+        b = [x for x in self.img.iter_window(win_size=[64,64],
+                                             stride=[32,32], sliding=True,
+                                             skip_empty=True, copy=True)]
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertTrue(np.array_equal(x, y))
+
+    def test_get_validity_map(self):
+        vmap = self.img.get_validity_map(cell_size=50)
+        self.assertEqual(vmap.shape, (11,10))
+        self.assertEqual(vmap.dtype, np.dtype('bool'))
+        self.assertIs(vmap, self.img.get_validity_map(cell_size=50))
+
+    def test_iter_window_batched(self):
+        plan = self.img.plan_windows([64,64], stride=[48,48])
+        chips = [x for x in self.img.iter_base(*plan)]
+        out = []
+        for batch, windows in self.img.iter_window_batched(win_size=[64,64],
+                                                           stride=[48,48],
+                                                           batch_size=10):
+            self.assertEqual(batch.shape[1:], (8,64,64))
+            self.assertEqual(len(batch), len(windows))
+            out.extend(batch.copy())
+        self.assertEqual(len(out), len(chips))
+        for x, y in zip(out, chips):
+            self.assertTrue(np.array_equal(x, y))
+
+    def test_iter_window_batched_prefetch(self):
+        a = [(b.copy(), w.copy()) for b, w in
+             self.img.iter_window_batched(win_size=[64,64], batch_size=6,
+                                          bands=[1,3])]
+        b = [(b.copy(), w.copy()) for b, w in
+             self.img.iter_window_batched(win_size=[64,64], batch_size=6,
+                                          bands=[1,3], prefetch=2)]
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertTrue(np.array_equal(x[0], y[0]))
+            self.assertTrue(np.array_equal(x[1], y[1]))
+
+    def test_iter_window_batched_processes(self):
+        a = {}
+        for b, w in self.img.iter_window_batched(win_size=[64,64],
+                                                 batch_size=6, bands=[1,3]):
+            for chip, x in zip(b, w):
+                a[tuple(x)] = chip.copy()
+        n = 0
+        for b, w in self.img.iter_window_batched(win_size=[64,64],
+                                                 batch_size=6, bands=[1,3],
+                                                 processes=2):
+            for chip, x in zip(b, w):
+                self.assertTrue(np.array_equal(chip, a[tuple(x)]))
+            n += len(b)
+        self.assertEqual(n, len(a))
+
+    def test_iter_window_random_batched(self):
+        n = 0
+        for batch, windows in self.img.iter_window_random_batched(
+                                    win_size=[20,30], batch_size=16,
+                                    no_chips=40, prefetch=1):
+            for chip, w in zip(batch, windows):
+                d = self.img.get_data(window=list(w))
+                self.assertTrue(np.array_equal(chip, d))
+            n += len(batch)
+        self.assertEqual(n, 40)
+
+
 class TestGeoImage_iter_vector(unittest.TestCase):
     # Run defined method setUp to setup the test environment
     def setUp(self):
@@ -208,6 +621,187 @@ class TestGeoImage_iter_vector(unittest.TestCase):
         for x in self.img.iter_vector(vector=self.badvec):
             self.assertIsNone(x)
 
+    def test_get_data_skipNonoverlap(self):
+        a = [x for x in self.img.iter_vector(vector=self.vec)]
+        b = [x for x in self.img.iter_vector(vector=self.vec,
+                                             skip_nonoverlap=True)]
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertTrue(np.array_equal(x, y))
+        tmp = [x for x in self.img.iter_vector(vector=self.badvec,
+                                               skip_nonoverlap=True)]
+        self.assertEqual(tmp, [])
+
+    def test_get_data_superwindow(self):
+        kw = dict(vector=self.vec, properties=True, buffer=2, mask=True)
+        a = [x for x in self.img.iter_vector(**kw)]
+        b = [x for x in self.img.iter_vector(superwindow=64, **kw)]
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertEqual(x[1], y[1])
+            self.assertTrue(np.array_equal(x[0], y[0]))
+            self.assertTrue(np.array_equal(x[0].mask, y[0].mask))
+
+    def test_mask_burner_reuse(self):
+        # Burning a large geometry first must not leak into later masks
+        a = [x.mask.copy() for x in self.img.iter_vector(vector=self.vec,
+                                                         mask=True)]
+        geoio.base._burners.burner = geoio.base._MaskBurner()
+        self.img.get_data(geom=self.img._footprint(), mask=True)
+        b = [x.mask.copy() for x in self.img.iter_vector(vector=self.vec,
+                                                         mask=True)]
+        for x, y in zip(a, b):
+            self.assertTrue(np.array_equal(x, y))
+            self.assertTrue(all(np.array_equal(x[0], z) for z in x))
+
+    def test_zonal_stats(self):
+        table = self.img.zonal_stats(vector=self.vec,
+                                     stats=['count', 'mean', 'max'],
+                                     bands=[1, 2])
+        chips = [x for x in self.img.iter_vector(vector=self.vec,
+                                                 bands=[1, 2], mask=True)]
+        self.assertEqual(len(table['fid']), len(chips))
+        for k, chip in enumerate(chips):
+            for j in range(2):
+                v = chip[j].compressed()
+                self.assertEqual(table['count'][k,j], len(v))
+                self.assertAlmostEqual(table['mean'][k,j], v.mean())
+                self.assertEqual(table['max'][k,j], v.max())
+
+    def test_zonal_stats_overlap(self):
+        # Pixels shared by overlapping features count for each of them
+        xmin, xmax, ymin, ymax = self.img.grid.extent
+        dx, dy = (xmax-xmin)/10.0, (ymax-ymin)/10.0
+        sr = osr.SpatialReference()
+        sr.ImportFromWkt(self.img.meta.projection_string)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            vec = os.path.join(tmp_dir, 'tmp_overlap.shp')
+            drv = ogr.GetDriverByName('ESRI Shapefile')
+            ds = drv.CreateDataSource(vec)
+            lyr = ds.CreateLayer('tmp_overlap', sr, ogr.wkbPolygon)
+            for i in [2, 4]:
+                x0, x1 = xmin+i*dx, xmin+(i+4)*dx
+                y0, y1 = ymin+i*dy, ymin+(i+4)*dy
+                f = ogr.Feature(lyr.GetLayerDefn())
+                f.SetGeometry(ogr.CreateGeometryFromWkt(
+                        'POLYGON ((%r %r, %r %r, %r %r, %r %r, %r %r))' %
+                        (x0, y0, x1, y0, x1, y1, x0, y1, x0, y0)))
+                lyr.CreateFeature(f)
+            ds = None
+
+            table = self.img.zonal_stats(vector=vec, stats=['count', 'mean'],
+                                         bands=[1])
+            chips = [x for x in self.img.iter_vector(vector=vec, bands=[1],
+                                                     mask=True)]
+            self.assertEqual(len(chips), 2)
+            for k, chip in enumerate(chips):
+                v = chip[0].compressed()
+                self.assertEqual(table['count'][k,0], len(v))
+                self.assertAlmostEqual(table['mean'][k,0], v.mean())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_zonal_stats_out_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            out = os.path.join(tmp_dir, 'tmp_zonal.geojson')
+            table = self.img.zonal_stats(vector=self.vec, stats=['mean'],
+                                         bands=[3], out_file=out,
+                                         out_driver='GeoJSON')
+            ds = ogr.Open(out)
+            vals = [f.GetField('mean_3') for f in ds.GetLayer(0)]
+            ds = None
+            self.assertTrue(np.allclose(vals, table['mean'][:,0]))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_get_data_workers(self):
+        kw = dict(vector=self.vec, properties=True, mask=True)
+        a = [x for x in self.img.iter_vector(**kw)]
+        b = [x for x in self.img.iter_vector(workers=3, **kw)]
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertEqual(x[1], y[1])
+            self.assertTrue(np.array_equal(x[0], y[0]))
+        c = [x for x in self.img.iter_vector(workers=3, ordered=False, **kw)]
+        self.assertEqual(sorted(x[0].sum() for x in a),
+                         sorted(x[0].sum() for x in c))
+
+    def test_iter_vector_batches(self):
+        kw = dict(vector=self.vec, properties=['teststr'], mask=True)
+        a = [x for x in self.img.iter_vector(**kw)]
+        b = []
+        for batch in self.img.iter_vector_batches(batch_size=1, **kw):
+            self.assertEqual(len(batch['fid']), len(batch['data']))
+            self.assertEqual(len(batch['teststr']), len(batch['data']))
+            b.extend(zip(batch['data'], batch['teststr']))
+        self.assertEqual(len(a), len(b))
+        for x, y in zip(a, b):
+            self.assertEqual(x[1]['teststr'], y[1])
+            self.assertTrue(np.array_equal(x[0], y[0]))
+
+    def test_vector_batches_null(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmp_dir, 'tmp_null.geojson')
+            drv = ogr.GetDriverByName('GeoJSON')
+            ds = drv.CreateDataSource(fname)
+            lyr = ds.CreateLayer('tmp_null', None, ogr.wkbPoint)
+            lyr.CreateField(ogr.FieldDefn('val', ogr.OFTReal))
+            for v in [1.5, None, 3.0]:
+                f = ogr.Feature(lyr.GetLayerDefn())
+                if v is not None:
+                    f.SetField('val', v)
+                f.SetGeometry(ogr.CreateGeometryFromWkt('POINT (1 2)'))
+                lyr.CreateFeature(f)
+            ds = None
+
+            class NoArrow(object):
+                # Hides GetArrowStreamAsNumPy to force the feature loop
+                def __init__(self, lyr):
+                    self._lyr = lyr
+                def __getattr__(self, name):
+                    if name == 'GetArrowStreamAsNumPy':
+                        raise AttributeError(name)
+                    return getattr(self._lyr, name)
+                def __iter__(self):
+                    return iter(self._lyr)
+
+            # The Arrow stream is only read where the bindings have it
+            # (GDAL >= 3.6), otherwise both cases would read the same path
+            ds = ogr.Open(fname)
+            wraps = [NoArrow]
+            if hasattr(ds.GetLayer(0), 'GetArrowStreamAsNumPy'):
+                wraps.append(lambda x: x)
+            ds = None
+
+            for wrap in wraps:
+                ds = ogr.Open(fname)
+                lyr = wrap(ds.GetLayer(0))
+                col = np.ma.concatenate([b['val'] for b in
+                            geoio.base._vector_batches(lyr, 2, ['val'])])
+                self.assertEqual(col.mask.tolist(), [False, True, False])
+                self.assertEqual(col.compressed().tolist(), [1.5, 3.0])
+                lyr = None
+                ds = None
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_group_windows(self):
+        w = np.array([[0,0,5,5], [100,100,5,5], [6,2,4,4], [90,95,4,4]])
+        groups = geoio.base._group_windows(w, 32)
+        self.assertEqual(sorted(sorted(m) for m, u in groups),
+                         [[0, 2], [1, 3]])
+        for m, u in groups:
+            self.assertTrue(u[2] <= 32 and u[3] <= 32)
+
+    def test_footprint(self):
+        fp = self.img._footprint()
+        xmin, xmax, ymin, ymax = fp.GetEnvelope()
+        self.assertTrue(np.allclose([xmin, xmax, ymin, ymax],
+                                    self.img.grid.extent))
+
     def test_get_data_propTrue(self):
         for x in self.img.iter_vector(vector=self.vec,properties=True):
             self.assertIsInstance(x,tuple)
@@ -285,6 +879,56 @@ class TestGeoImage_iter_vector(unittest.TestCase):
         self.assertIsInstance(tmp[0], np.ndarray)
         self.assertIsNone(tmp[1])
 
+    def test_compile_filter(self):
+        class Feat(object):
+            def __init__(self, vals):
+                self.vals = vals
+            def GetField(self, i):
+                return self.vals[i]
+        where, pred, keys = geoio.base._compile_vector_filter(
+                        [{'id': 2}, {'name': "o'k"}, {'id': None}],
+                        ['id', 'name'])
+        self.assertEqual(where, '"id" = 2 OR "name" = \'o\'\'k\' OR '
+                                '"id" IS NULL')
+        self.assertEqual(keys, ['id', 'name'])
+        self.assertTrue(pred(Feat([None, 'x'])))
+        self.assertTrue(pred(Feat([1, "o'k"])))
+        self.assertFalse(pred(Feat([1, "O'K"])))
+        where, pred, keys = geoio.base._compile_vector_filter(
+                                            {'id': [1, 2]}, ['id'])
+        self.assertIsNone(where)
+
+    def test_get_data_filt_skipFiltered(self):
+        tmp = [x for x in self.img.iter_vector(vector=self.vec,
+                                               filter={'id': 2},
+                                               skip_filtered=True)]
+        self.assertEqual(len(tmp), 1)
+        self.assertIsInstance(tmp[0], np.ndarray)
+
+    def test_get_data_filt_shapefile(self):
+        # The filter fields must not be ignored on file backed layers
+        tmpdir = tempfile.mkdtemp()
+        try:
+            drv = ogr.GetDriverByName('ESRI Shapefile')
+            drv.CopyDataSource(ogr.Open(self.vec), tmpdir)
+            shp = [os.path.join(tmpdir, f) for f in os.listdir(tmpdir)
+                   if f.endswith('.shp')][0]
+            tmp = [x for x in self.img.iter_vector(vector=shp,
+                                                   filter={'id': 2})]
+            self.assertEqual(len(tmp), 2)
+            self.assertIsNone(tmp[0])
+            self.assertIsInstance(tmp[1], np.ndarray)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_get_data_filt_skipNonoverlap(self):
+        tmp = [x for x in self.img.iter_vector(vector=self.vec,
+                                               filter={'id': 2},
+                                               skip_nonoverlap=True)]
+        self.assertEqual(len(tmp), 2)
+        self.assertIsNone(tmp[0])
+        self.assertIsInstance(tmp[1], np.ndarray)
+
     def test_get_data_propStr_filtList(self):
         tmp = [x for x in self.img.iter_vector(vector=self.vec,
                         properties='teststr',
@@ -331,6 +975,30 @@ class TestDGImage(unittest.TestCase):
     def test_DGImage_dg_meta_exists(self):
         self.assertIsInstance(self.img.meta_dg,tt.bunch.OrderedBunch)
 
+    def test_DGImage_meta_dg_fields(self):
+        self.assertEqual(self.img.meta['satid'], self.img.meta.satid)
+        self.assertEqual(self.img.meta.band_names,
+                         const.DG_BAND_NAMES['WV02_MULTI'])
+
+    def test_DGImage_band_alias_cache(self):
+        a = self.img._get_band_numbers('RGB')
+        b = self.img._get_band_numbers('RGB')
+        self.assertEqual(a, [5,3,2])
+        self.assertEqual(a, b)
+        b.append(1)
+        self.assertEqual(self.img._get_band_numbers('RGB'), [5,3,2])
+        self.assertEqual(self.img._get_band_numbers(['R',1]), [5,1])
+
+    def test_DGImage_getitem_alias(self):
+        a = self.img.get_data(bands='RGB', window=[10, 20, 30, 40])
+        self.assertTrue(np.array_equal(self.img['RGB', 20:60, 10:40], a))
+
+    def test_DGImage_pickle(self):
+        img = pickle.loads(pickle.dumps(self.img))
+        self.assertEqual(img.meta_dg, self.img.meta_dg)
+        self.assertTrue(np.array_equal(img['RGB', 0:10, 0:10],
+                                       self.img['RGB', 0:10, 0:10]))
+
     def test_DGImage_dg_meta_abscal(self):
         self.assertTrue(len(self.img.meta.effbandwidth)==8)
         self.assertTrue(len(self.img.meta.abscalfactor)==8)
@@ -0,0 +1,173 @@
+'''
+Grouped reductions for zonal statistics.
+
+A ZonalAccumulator collects per-zone statistics from blocks of image data and
+a matching block of zone labels (as produced by rasterizing polygons).  Each
+block is reduced with np.bincount style grouped operations, so the cost is
+proportional to the number of pixels read rather than the number of zones and
+any number of zones can be reduced in a single pass over an image.
+'''
+
+from __future__ import division
+
+import collections
+import logging
+
+import numpy as np
+
+# Module setup
+logger = logging.getLogger(__name__)
+
+STATS = ('count', 'sum', 'mean', 'std', 'min', 'max', 'hist')
+
+
+class ZonalAccumulator(object):
+    """
+    Accumulate zonal statistics block by block.
+
+    Parameters
+    ----------
+    nzones : int
+        Number of zones.  Zone labels are 1 to nzones, a label of 0 marks
+        pixels that aren't in any zone.
+    nbands : int
+        Number of bands in each data block.
+    stats : list, optional
+        Statistics to compute, any of 'count', 'sum', 'mean', 'std', 'min',
+        'max', and 'hist'.  std is the population standard deviation.
+    bins : int, optional
+        Number of histogram bins for 'hist'.
+    hist_range : tuple, optional
+        (min, max) of the histogram bins, required for 'hist'.  Values
+        outside the range aren't counted (as in np.histogram).
+    """
+
+    def __init__(self, nzones, nbands, stats=('count', 'mean', 'std',
+                                               'min', 'max'),
+                 bins=10, hist_range=None):
+        if isinstance(stats, basestring):
+            stats = [stats]
+        bad = [x for x in stats if x not in STATS]
+        if bad:
+            raise ValueError("Unknown statistic(s) %s, valid options are "
+                             "%s." % (bad, STATS))
+        if 'hist' in stats and hist_range is None:
+            raise ValueError("hist_range is required for the 'hist' "
+                             "statistic.")
+
+        self.nzones = int(nzones)
+        self.nbands = int(nbands)
+        self.stats = list(stats)
+        self.bins = int(bins)
+        self.hist_range = hist_range
+
+        n = self.nzones+1
+        shape = (self.nbands, n)
+        need = set(self.stats)
+        self._count = np.zeros(shape, dtype='int64')
+        self._sum = None
+        self._sumsq = None
+        self._min = None
+        self._max = None
+        self._hist = None
+        if need & set(['sum', 'mean', 'std']):
+            self._sum = np.zeros(shape, dtype='float64')
+        if 'std' in need:
+            self._sumsq = np.zeros(shape, dtype='float64')
+        if 'min' in need:
+            self._min = np.full(shape, np.inf)
+        if 'max' in need:
+            self._max = np.full(shape, -np.inf)
+        if 'hist' in need:
+            self._hist = np.zeros(shape+(self.bins,), dtype='int64')
+
+    def add(self, labels, data, nodata=None):
+        """Reduce a block of data into the statistics.
+
+        Parameters
+        ----------
+        labels : array
+            (y, x) integer zone labels of the block.
+        data : array
+            (bands, y, x) data of the block.
+        nodata : number, optional
+            Data value that is excluded from the statistics.
+        """
+        valid = labels > 0
+        if not valid.any():
+            return
+        zones = labels[valid].astype('int64')
+        n = self.nzones+1
+
+        for b in xrange(self.nbands):
+            vals = data[b][valid]
+            idx = zones
+            if nodata is not None:
+                keep = vals != nodata
+                vals = vals[keep]
+                idx = zones[keep]
+            if not len(idx):
+                continue
+            vals = vals.astype('float64')
+
+            self._count[b] += np.bincount(idx, minlength=n)
+            if self._sum is not None:
+                self._sum[b] += np.bincount(idx, weights=vals, minlength=n)
+            if self._sumsq is not None:
+                self._sumsq[b] += np.bincount(idx, weights=vals*vals,
+                                              minlength=n)
+
+            if self._min is not None or self._max is not None:
+                # Sort by zone once and reduce each run of equal zones
+                order = np.argsort(idx, kind='mergesort')
+                sidx = idx[order]
+                svals = vals[order]
+                starts = np.flatnonzero(np.concatenate(
+                                    ([True], sidx[1:] != sidx[:-1])))
+                u = sidx[starts]
+                if self._min is not None:
+                    self._min[b,u] = np.minimum(self._min[b,u],
+                                        np.minimum.reduceat(svals, starts))
+                if self._max is not None:
+                    self._max[b,u] = np.maximum(self._max[b,u],
+                                        np.maximum.reduceat(svals, starts))
+
+            if self._hist is not None:
+                lo, hi = self.hist_range
+                inside = (vals >= lo) & (vals <= hi)
+                bi = ((vals[inside]-lo)*(self.bins/(hi-lo))).astype('int64')
+                bi = np.minimum(bi, self.bins-1)
+                self._hist[b] += np.bincount(idx[inside]*self.bins+bi,
+                                    minlength=n*self.bins).reshape(n, -1)
+
+    def result(self):
+        """Return an OrderedDict of the requested statistics.  Each value is
+        an (nzones, nbands) array ((nzones, nbands, bins) for 'hist').
+        Zones without any valid pixels have a count of zero and NaN for the
+        other statistics (zero for 'sum' and 'hist')."""
+        out = collections.OrderedDict()
+        count = self._count[:,1:]
+        empty = count == 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = None
+            if self._sum is not None:
+                mean = self._sum[:,1:]/count
+            for s in self.stats:
+                if s == 'count':
+                    v = count
+                elif s == 'sum':
+                    v = self._sum[:,1:]
+                elif s == 'mean':
+                    v = mean
+                elif s == 'std':
+                    var = self._sumsq[:,1:]/count - mean*mean
+                    v = np.sqrt(np.maximum(var, 0))
+                elif s == 'min':
+                    v = np.where(empty, np.nan, self._min[:,1:])
+                elif s == 'max':
+                    v = np.where(empty, np.nan, self._max[:,1:])
+                elif s == 'hist':
+                    out[s] = self._hist[:,1:].transpose(1, 0, 2).copy()
+                    continue
+                out[s] = np.ascontiguousarray(v.T)
+        return out